@@ -0,0 +1,71 @@
+# Recall and latency of the IVF index against exact search. The knowledge base is grown to --size
+# rows by mixing pairs of the stored embeddings and adding noise, queries are made the same way.
+# Usage: python -m src.benchmark.bench_ann [--size N] [--queries N] [--k K]
+import os
+import time
+import pickle
+import argparse
+import tempfile
+import numpy as np
+from src.vector_db import ann_index
+from src.vector_db.ann_index import IVFIndex
+from src.vector_db.embedding_store import EMBEDDINGS_PKL, EmbeddingStore, read_embeddings_pickle
+
+
+def make_embeddings(base: np.ndarray, size: int, random) -> np.ndarray:
+    pairs = random.integers(0, len(base), size=(size, 2))
+    weights = random.random((size, 1))
+    mixed = weights * base[pairs[:, 0]] + (1 - weights) * base[pairs[:, 1]]
+    return mixed + random.normal(scale=0.01, size=mixed.shape)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    random = np.random.default_rng(0)
+    embeddings, metadata_list, _ = read_embeddings_pickle(EMBEDDINGS_PKL)
+    base = np.array(list(embeddings.values()))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pkl_path = os.path.join(tmp_dir, "embeddings.pkl")
+        rows = make_embeddings(base, args.size, random)
+        pickle.dump(({str(i): row for i, row in enumerate(rows)}, [
+                    dict() for _ in range(args.size)]), open(pkl_path, "wb"))
+        del rows
+        store = EmbeddingStore.load(pkl_path)
+        queries = make_embeddings(base, args.queries, random)
+
+        start = time.perf_counter()
+        exact = [store.top_k(query, args.k)[0] for query in queries]
+        exact_latency = (time.perf_counter() - start) / args.queries
+
+        ann_index.ANN_ENABLED = True
+        ann_index.ANN_MIN_SIZE = 0
+        start = time.perf_counter()
+        index = ann_index.get_index(store)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        assert IVFIndex.load(ann_index.get_index_path(store), len(store), os.path.getmtime(
+            EmbeddingStore.get_paths(pkl_path)[0])) is not None
+        load_time = time.perf_counter() - start
+
+        print("{0} rows, {1} lists, build {2:.2f}s, load {3:.4f}s\n".format(
+            len(store), len(index.centroids), build_time, load_time))
+        print("{0:<10} {1:>12} {2:>10} {3:>9}".format(
+            "search", "latency(ms)", "recall@" + str(args.k), "speedup"))
+        print("{0:<10} {1:>12.3f} {2:>10.3f} {3:>8.2f}x".format(
+            "exact", exact_latency * 1000, 1.0, 1.0))
+        for n_probe in [1, 2, 4, 8, 16, 32]:
+            if n_probe > len(index.centroids):
+                break
+            ann_index.ANN_N_PROBE = n_probe
+            start = time.perf_counter()
+            approximate = [ann_index.search(store, query, args.k)[0] for query in queries]
+            latency = (time.perf_counter() - start) / args.queries
+            recall = np.mean([len(set(a) & set(e)) / len(e)
+                              for a, e in zip(approximate, exact)])
+            print("{0:<10} {1:>12.3f} {2:>10.3f} {3:>8.2f}x".format(
+                "nprobe=" + str(n_probe), latency * 1000, recall, exact_latency / latency))
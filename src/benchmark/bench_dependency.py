@@ -0,0 +1,93 @@
+# Compare the pairwise recheable() based DataPDG builder with the reachability-index one
+# on the curated manual partitions.
+# Usage: python -m src.benchmark.bench_dependency [contract ...]
+import io
+import sys
+import time
+import contextlib
+from typing import Dict, List, Set, Tuple
+from slither.core.cfg.node import recheable
+from src.framework.compile import Compilation, ContractWrapper
+from src.framework.dependency import DataPDG
+
+benchmark_dir = "./examples/benchmark/curated/manual_partitions"
+solc_remaps = "@openzeppelin=examples/benchmark/curated/raw/node_modules/@openzeppelin"
+solc_version = "0.8.25"
+
+benchmark_contracts = [
+    "AuctionInstance",
+    "ConfidentialAuction",
+    "EncryptedERC20",
+    "NFTExample",
+    "Battleship",
+    "ConfidentialERC20",
+    "EncryptedFunds",
+    "Suffragium",
+    "BlindAuction",
+    "ConfidentialIdentityRegistry",
+    "GovernorZama",
+    "CipherBomb",
+    "DarkPool",
+    "IdentityRegistry",
+    "VickreyAuction",
+    "Comp",
+    "Leaderboard",
+    "TokenizedAssets"
+]
+
+
+class PairwiseDataPDG(DataPDG):
+    # the original O(n^2) builder calling recheable() for every node pair
+    def generate(self) -> None:
+        for i, node_a in enumerate(self.function.nodes):
+            apinode_a = self.factory.create_or_get_node(
+                node_a, dependency_type="DataDep")
+            for j, node_b in enumerate(self.function.nodes):
+                if i == j:
+                    continue
+                if not node_b in recheable(node_a):
+                    continue
+                apinode_b = self.factory.create_or_get_node(
+                    node_b, dependency_type="DataDep")
+                if self.is_dependent(left=apinode_a, right=apinode_b):
+                    apinode_a.add_son(apinode_b)
+
+
+def edges(pdg: DataPDG) -> Set[Tuple[int, int]]:
+    return set((apinode.node.node_id, son.node.node_id) for apinode in pdg.nodes for son in apinode.sons)
+
+
+def build(builder, wrapper: ContractWrapper) -> Tuple[float, Dict]:
+    pdgs = dict()
+    start = time.perf_counter()
+    # APINode.add_son logs every edge
+    with contextlib.redirect_stdout(io.StringIO()):
+        for function in wrapper.get_functions():
+            if not function.pure:
+                pdg = builder(function)
+                pdg.generate()
+                pdgs[function] = pdg
+    return time.perf_counter() - start, pdgs
+
+
+def main(contracts: List[str]):
+    print("Contract\tFunctions\tNodes\tPairwise(s)\tIndexed(s)\tSpeedup\tSame edges")
+    for contract_name in contracts:
+        contract_file = "{0}/{1}/original/{1}.sol".format(
+            benchmark_dir, contract_name)
+        instance = Compilation(contract_file=contract_file,
+                               solc_remaps=solc_remaps, solc_version=solc_version)
+        wrapper = ContractWrapper(
+            target_contract_name=contract_name, compilation=instance)
+
+        old_time, old_pdgs = build(PairwiseDataPDG, wrapper)
+        new_time, new_pdgs = build(DataPDG, wrapper)
+        same = all(edges(old_pdgs[function]) == edges(new_pdgs[function])
+                   for function in old_pdgs)
+        node_count = sum(len(function.nodes) for function in old_pdgs)
+        print("{0}\t{1}\t{2}\t{3:.4f}\t{4:.4f}\t{5:.1f}x\t{6}".format(contract_name, len(old_pdgs), node_count,
+              old_time, new_time, old_time / new_time if new_time > 0 else float("inf"), same))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] if len(sys.argv) > 1 else benchmark_contracts)
@@ -0,0 +1,114 @@
+# Load time and memory of the few-shot embeddings: the pickled dict of Python lists against the
+# memory-mapped float32 EmbeddingStore, alone and shared by several worker processes. The 58 stored
+# embeddings are tiled --scale times so the difference is visible.
+# Usage: python -m src.benchmark.bench_embeddings [--scale N] [--workers N]
+import os
+import time
+import pickle
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+from src.vector_db.embedding_store import EMBEDDINGS_PKL, EmbeddingStore, get_store, read_embeddings_pickle
+
+
+def get_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def get_pss_mb() -> float:
+    # proportional set size: pages shared between processes are split between them
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) / 2 ** 10
+    return 0.0
+
+
+def make_scaled_pickle(pkl_path: str, scale: int) -> None:
+    embeddings, metadata_list, backend = read_embeddings_pickle(EMBEDDINGS_PKL)
+    scaled_embeddings, scaled_metadata = dict(), list()
+    # distinct values, so pickle does not share the objects of the copies
+    for copy in range(scale):
+        for (row_id, embedding), metadata in zip(embeddings.items(), metadata_list):
+            scaled_embeddings["{0}-{1}".format(row_id, copy)] = [
+                value + copy * 1e-9 for value in embedding]
+            scaled_metadata.append({key: value + "\n// {0}".format(copy)
+                                   for key, value in metadata.items()})
+    pickle.dump((scaled_embeddings, scaled_metadata, backend), open(pkl_path, "wb"))
+
+
+def load_pickle(pkl_path, query):
+    embeddings, metadata_list, _ = pickle.load(open(pkl_path, "rb"))
+    np.array(list(embeddings.values())) @ query
+    return embeddings, metadata_list
+
+
+def load_store(pkl_path, query):
+    store = get_store(pkl_path)
+    store.similarities(query)
+    return store
+
+
+def load_store_in_memory(pkl_path, query):
+    store = EmbeddingStore.load(pkl_path, mmap=False)
+    store.similarities(query)
+    return store
+
+
+def measure(loader, pkl_path, query, barrier, connection):
+    rss = get_rss_mb()
+    start = time.perf_counter()
+    loaded = loader(pkl_path, query)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    loaded = loader(pkl_path, query)
+    second = time.perf_counter() - start
+    # all workers hold their embeddings at the same time while memory is measured
+    barrier.wait()
+    connection.send((first, second, get_rss_mb() - rss, get_pss_mb()))
+    barrier.wait()
+    del loaded
+
+
+def run(loader, pkl_path, query, workers):
+    # every measurement starts from a fresh interpreter
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = []
+    processes = []
+    for _ in range(workers):
+        parent_connection, child_connection = context.Pipe()
+        process = context.Process(target=measure, args=(
+            loader, pkl_path, query, barrier, child_connection))
+        process.start()
+        processes.append((process, parent_connection))
+    for process, connection in processes:
+        results.append(connection.recv())
+        process.join()
+    return [sum(values) / len(values) for values in zip(*results)] + [sum(result[3] for result in results)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pkl_path = os.path.join(tmp_dir, "embeddings.pkl")
+        make_scaled_pickle(pkl_path, args.scale)
+        store = EmbeddingStore.load(pkl_path)
+        query = np.asarray(store.matrix[0])
+        print("{0} embeddings of dimension {1}, {2:.1f} MB as float32\n".format(
+            len(store), store.matrix.shape[1], store.matrix.nbytes / 2 ** 20))
+
+        print("{0:<22} {1:>8} {2:>13} {3:>12} {4:>11} {5:>16}".format(
+            "loader", "workers", "first load(s)", "reload(s)", "RSS +MB", "total PSS MB"))
+        for name, loader in [("pickle", load_pickle), ("store (in memory)", load_store_in_memory), ("store (mmap, shared)", load_store)]:
+            for workers in [1, args.workers]:
+                first, second, rss, _, total_pss = run(
+                    loader, pkl_path, query, workers)
+                print("{0:<22} {1:>8} {2:>13.4f} {3:>12.4f} {4:>11.1f} {5:>16.1f}".format(
+                    name, workers, first, second, rss, total_pss))
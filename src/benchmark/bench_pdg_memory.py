@@ -0,0 +1,169 @@
+# Memory of the data and control PDGs: the previous object graph (one APINode per node and PDG holding
+# a list of sons and a set of fathers) against CompactPDG (int ids, one tagged edge list, CSR arrays).
+# Both are filled with the same nodes and edges, taken from the PDGs of the curated contracts or,
+# with --synthetic, from random functions of the given sizes.
+# Usage: python -m src.benchmark.bench_pdg_memory [contract ...] | --synthetic SIZE [SIZE ...]
+import io
+import gc
+import random
+import argparse
+import contextlib
+import tracemalloc
+from typing import Dict, List, Set, Tuple
+from src.framework.dependency import CONTROL_DEP, DATA_DEP, CompactPDG, SingletonAPINodeFactory
+
+benchmark_dir = "./examples/benchmark/curated/manual_partitions"
+solc_remaps = "@openzeppelin=examples/benchmark/curated/raw/node_modules/@openzeppelin"
+solc_version = "0.8.25"
+
+benchmark_contracts = [
+    "AuctionInstance",
+    "ConfidentialAuction",
+    "EncryptedERC20",
+    "NFTExample",
+    "Battleship",
+    "ConfidentialERC20",
+    "EncryptedFunds",
+    "Suffragium",
+    "BlindAuction",
+    "ConfidentialIdentityRegistry",
+    "GovernorZama",
+    "CipherBomb",
+    "DarkPool",
+    "IdentityRegistry",
+    "VickreyAuction",
+    "Comp",
+    "Leaderboard",
+    "TokenizedAssets"
+]
+
+# nodes of each kind in registration order, and the (source, target, kind) edges
+FunctionEdges = Tuple[Dict[int, List[object]], List[Tuple[object, object, int]]]
+
+
+class LegacyAPINode(object):
+    # the previous representation
+    def __init__(self, node, dependency_type: str) -> None:
+        self.node = node
+        self.sons: List[LegacyAPINode] = []
+        self.fathers: Set[LegacyAPINode] = set()
+        self.dependency_type = dependency_type
+
+
+class LegacyFactory(object):
+    def __init__(self) -> None:
+        self.apinodes: List[LegacyAPINode] = []
+        self.registry: Dict[object, LegacyAPINode] = dict()
+
+    def create_or_get_node(self, node, dependency_type: str) -> LegacyAPINode:
+        apinode = self.registry.get(node)
+        if apinode is None:
+            apinode = LegacyAPINode(node, dependency_type)
+            self.registry[node] = apinode
+            self.apinodes.append(apinode)
+        return apinode
+
+
+def build_legacy(functions: List[FunctionEdges]) -> list:
+    pdgs = []
+    for members, edges in functions:
+        factories = {kind: LegacyFactory() for kind in members}
+        for kind, nodes in members.items():
+            for node in nodes:
+                factories[kind].create_or_get_node(
+                    node, "DataDep" if kind == DATA_DEP else "ControlDep")
+        for source, target, kind in edges:
+            father = factories[kind].registry[source]
+            son = factories[kind].registry[target]
+            father.sons.append(son)
+            son.fathers.add(father)
+        pdgs.append(factories)
+    return pdgs
+
+
+def build_compact(functions: List[FunctionEdges]) -> list:
+    pdgs = []
+    for members, edges in functions:
+        graph = CompactPDG()
+        factories = {kind: SingletonAPINodeFactory(
+            graph, kind) for kind in members}
+        for kind, nodes in members.items():
+            for node in nodes:
+                factories[kind].create_or_get_node(node)
+        for source, target, kind in edges:
+            graph.add_edge(graph.ids[source], graph.ids[target], kind)
+        # the CSR arrays are part of the queried representation
+        if len(graph.nodes) > 0:
+            graph.successors(0, kind=DATA_DEP)
+            graph.predecessors(0, kind=DATA_DEP)
+        pdgs.append(factories)
+    return pdgs
+
+
+def measure(builder, functions: List[FunctionEdges]) -> float:
+    gc.collect()
+    tracemalloc.start()
+    pdgs = builder(functions)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del pdgs
+    return size / 2 ** 10
+
+
+def get_contract_functions(contract_name: str) -> List[FunctionEdges]:
+    from src.framework.compile import Compilation, ContractWrapper
+    from src.framework.dependency import ProgramDependency
+    contract_file = "{0}/{1}/original/{1}.sol".format(
+        benchmark_dir, contract_name)
+    wrapper = ContractWrapper(target_contract_name=contract_name, compilation=Compilation(
+        contract_file=contract_file, solc_remaps=solc_remaps, solc_version=solc_version))
+    pdg = ProgramDependency(contract=wrapper)
+    with contextlib.redirect_stdout(io.StringIO()):
+        pdg.generate_dependencies()
+    functions = []
+    for graph in pdg.graphs.values():
+        members = {kind: [graph.nodes[i] for i in range(len(graph.nodes)) if graph.members[i] & kind]
+                   for kind in [DATA_DEP, CONTROL_DEP]}
+        edges = [(graph.nodes[source], graph.nodes[target], kind) for source, target, kind in zip(
+            graph.edge_sources, graph.edge_targets, graph.edge_kinds)]
+        functions.append((members, edges))
+    return functions
+
+
+def get_synthetic_function(size: int, rng: random.Random) -> FunctionEdges:
+    nodes = [object() for _ in range(size)]
+    control_nodes = rng.sample(nodes, size // 2)
+    edges = [(nodes[i], nodes[j], DATA_DEP) for i in range(size)
+             for j in rng.sample(range(size), min(size, 3)) if i != j]
+    edges += [(control_nodes[i], control_nodes[j], CONTROL_DEP)
+              for i in range(len(control_nodes)) for j in range(i + 1, min(len(control_nodes), i + 3))]
+    return ({DATA_DEP: nodes, CONTROL_DEP: control_nodes}, edges)
+
+
+def report(name: str, functions: List[FunctionEdges]) -> None:
+    node_count = sum(len(members[DATA_DEP]) for members, _ in functions)
+    edge_count = sum(len(edges) for _, edges in functions)
+    legacy = measure(build_legacy, functions)
+    compact = measure(build_compact, functions)
+    print("{0}\t{1}\t{2}\t{3}\t{4:.1f}\t{5:.1f}\t{6:.1f}x".format(name, len(functions), node_count, edge_count,
+          legacy, compact, legacy / compact if compact > 0 else float("inf")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("contracts", nargs="*", default=benchmark_contracts)
+    parser.add_argument("--synthetic", type=int, nargs="+",
+                        help="Sizes (nodes per function) of random functions instead of contracts")
+    parser.add_argument("--functions", type=int, default=20,
+                        help="Number of random functions per size")
+    args = parser.parse_args()
+
+    print("Contract\tFunctions\tNodes\tEdges\tObjects(KB)\tCompact(KB)\tReduction")
+    if args.synthetic:
+        rng = random.Random(0)
+        for size in args.synthetic:
+            report("synthetic-{0}".format(size), [get_synthetic_function(size, rng)
+                                                   for _ in range(args.functions)])
+    else:
+        for contract_name in args.contracts:
+            report(contract_name, get_contract_functions(contract_name))
@@ -0,0 +1,89 @@
+# Time Slicer.compute_all_function_slices with the functions transformed one after another and
+# side by side. The LLM is replaced by a fake with a fixed latency that answers with the manual
+# (ground truth) partition, compilation and candidate analyses run for real.
+# Usage: python -m src.benchmark.bench_transform [--workers N] [--pool thread|process] [--latency S]
+import os
+import io
+import time
+import argparse
+import threading
+import contextlib
+from src.framework import slicer as slicer_module
+from src.framework.compile import Compilation, ContractWrapper
+from src.framework.dependency import ProgramDependency
+from src.framework.slicer import Slicer
+from src.framework.taint_tracking import TaintTrack
+from src.llmpartition import code_gen, llm_cache
+from src.llmpartition.prompt import format_template
+
+benchmark_dir = "./examples/benchmark/curated/manual_partitions"
+solc_remaps = "@openzeppelin=examples/benchmark/curated/raw/node_modules/@openzeppelin"
+solc_version = "0.8.25"
+benchmark_contracts = ["AuctionInstance", "BlindAuction"]
+
+LATENCY = 1.0
+current_job = threading.local()
+real_transform = slicer_module.transform
+
+
+def fake_llm_result(prompt, example_prompts, candidate=0):
+    time.sleep(LATENCY)
+    if prompt == format_template.format(original_contract=current_job.original_code):
+        return current_job.original_code
+    return current_job.partition or current_job.original_code
+
+
+def fake_transform(**kwargs):
+    current_job.original_code = kwargs["original_code"]
+    current_job.partition = code_gen.get_groundtruth_partition(
+        kwargs["target_contract_name"], kwargs["target_func_name"])
+    return real_transform(**kwargs)
+
+
+def run(contract_name, workers, pool):
+    contract_file = os.path.join(
+        benchmark_dir, contract_name, "original", contract_name + ".sol")
+    wrapper = ContractWrapper(target_contract_name=contract_name, compilation=Compilation(
+        contract_file=contract_file, solc_remaps=solc_remaps, solc_version=solc_version))
+    pdg = ProgramDependency(contract=wrapper)
+    pdg.generate_dependencies()
+    tainter = TaintTrack(pdg, sensitive_var_names=set(
+        [state_var.name for state_var in wrapper.get_all_state_variables()]))
+    tainter.compute()
+
+    slicer_module.TRANSFORM_WORKERS = workers
+    slicer_module.TRANSFORM_POOL = pool
+    slicer = Slicer(tainter=tainter, pdg=pdg)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = slicer.compute_all_function_slices()[-1]
+    return time.perf_counter() - start, results
+
+
+def summarize(results):
+    return [(result["target_func_name"], sorted([(str(index), partition["output_code"]) for index, partition in result["partitions"].items()]))
+            for result in results]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--candidates", type=int, default=2)
+    args = parser.parse_args()
+
+    LATENCY = args.latency
+    code_gen.CANDIDATE_LIMIT = args.candidates
+    code_gen.get_llm_result = fake_llm_result
+    slicer_module.transform = fake_transform
+    llm_cache.LLM_CACHE_ENABLED = False
+
+    print("{0:<20} {1:>10} {2:>12} {3:>8}  {4}".format(
+        "contract", "serial(s)", "parallel(s)", "speedup", "same results"))
+    for contract_name in benchmark_contracts:
+        serial_time, serial_results = run(contract_name, 1, args.pool)
+        parallel_time, parallel_results = run(
+            contract_name, args.workers, args.pool)
+        print("{0:<20} {1:>10.2f} {2:>12.2f} {3:>7.2f}x  {4}".format(contract_name, serial_time, parallel_time,
+                                                                     serial_time / parallel_time, summarize(serial_results) == summarize(parallel_results)))
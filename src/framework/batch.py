@@ -0,0 +1,205 @@
+# Batch mode: partition every contract of a manifest, one process per job.
+# A job that crashes, times out or runs out of memory is recorded and the batch goes on;
+# finished jobs are appended to a JSONL progress file so an interrupted batch can be resumed.
+import os
+import csv
+import sys
+import json
+import time
+import hashlib
+import resource
+import traceback
+import multiprocessing
+from typing import Callable, Dict, List, Optional
+from src.framework.jsonl import truncate_partial_line
+
+PROGRESS_FILE = "batch_progress.jsonl"
+SUMMARY_FILE = "batch_summary.json"
+
+
+class BatchJob(object):
+    def __init__(self, file_path: str, target_contract_name: str, sensitive_var_names: str, solc_version: Optional[str] = None,
+                 solc_remaps: List[str] = [], mode: str = "simple") -> None:
+        self.file_path: str = file_path
+        self.target_contract_name: str = target_contract_name
+        # comma separated, as on the command line
+        self.sensitive_var_names: str = sensitive_var_names
+        self.solc_version: Optional[str] = solc_version
+        self.solc_remaps: List[str] = list(solc_remaps)
+        self.mode: str = mode
+
+    @property
+    def job_id(self) -> str:
+        spec = json.dumps([self.file_path, self.target_contract_name, self.sensitive_var_names,
+                          self.solc_version, self.solc_remaps, self.mode])
+        return "{0}-{1}".format(self.target_contract_name, hashlib.sha256(spec.encode("utf8")).hexdigest()[:12])
+
+    def to_dict(self) -> dict:
+        return dict(file=self.file_path, contract=self.target_contract_name, sensitive_vars=self.sensitive_var_names,
+                    solc_version=self.solc_version, solc_remaps=self.solc_remaps, mode=self.mode)
+
+
+def parse_job(entry: dict, default_solc_version: Optional[str], default_solc_remaps: List[str], default_mode: str) -> BatchJob:
+    sensitive_vars = entry["sensitive_vars"]
+    if isinstance(sensitive_vars, list):
+        sensitive_vars = ",".join(sensitive_vars)
+    solc_remaps = entry.get("solc_remaps") or default_solc_remaps
+    if isinstance(solc_remaps, str):
+        solc_remaps = [remap for remap in solc_remaps.split(",") if remap]
+    return BatchJob(entry["file"], entry["contract"], sensitive_vars, entry.get("solc_version") or default_solc_version,
+                    solc_remaps, entry.get("mode") or default_mode)
+
+
+def load_manifest(manifest_path: str, default_solc_version: Optional[str] = None, default_solc_remaps: List[str] = [], default_mode: str = "simple") -> List[BatchJob]:
+    # JSON: a list of {"file", "contract", "sensitive_vars", "solc_version"?, "solc_remaps"?, "mode"?}
+    # CSV: the same columns, lists are comma separated inside a quoted cell
+    with open(manifest_path, newline="") as f:
+        if manifest_path.endswith(".csv"):
+            entries = list(csv.DictReader(f))
+        else:
+            entries = json.load(f)
+    return [parse_job(entry, default_solc_version, default_solc_remaps, default_mode) for entry in entries]
+
+
+def load_progress(progress_path: str) -> Dict[str, dict]:
+    # the last record of a job wins; a truncated last line (killed batch) is ignored
+    progress = dict()
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                progress[record["job_id"]] = record
+    return progress
+
+
+def run_job_in_child(job: BatchJob, job_output_dir: str, memory_limit_mb: Optional[int], connection) -> None:
+    from src.framework.partition import split
+
+    os.makedirs(job_output_dir, exist_ok=True)
+    log = open(os.path.join(job_output_dir, "job.log"), "w")
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+    if memory_limit_mb is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        stage_timings = split(job.file_path, job.target_contract_name, job.sensitive_var_names, solc_version=job.solc_version,
+                              solc_remaps=job.solc_remaps, mode=job.mode, outputdir=job_output_dir)
+        connection.send(dict(status="ok", stage_timings=stage_timings or dict()))
+    except MemoryError:
+        connection.send(dict(status="out_of_memory", error="MemoryError"))
+    except BaseException as e:
+        traceback.print_exc()
+        connection.send(dict(status="failed", error="{0}: {1}".format(type(e).__name__, e)))
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        connection.close()
+
+
+class RunningJob(object):
+    def __init__(self, job: BatchJob, process, connection) -> None:
+        self.job: BatchJob = job
+        self.process = process
+        self.connection = connection
+        self.start: float = time.time()
+
+
+def run_batch(jobs: List[BatchJob], output_dir: str, workers: int = 1, timeout: Optional[float] = None, memory_limit_mb: Optional[int] = None,
+              resume: bool = True, target: Callable = run_job_in_child) -> dict:
+    os.makedirs(output_dir, exist_ok=True)
+    progress_path = os.path.join(output_dir, PROGRESS_FILE)
+    if resume and os.path.exists(progress_path):
+        # records are appended below, after the last complete one
+        truncate_partial_line(progress_path)
+    progress = load_progress(progress_path) if resume else dict()
+    pending = [job for job in jobs if progress.get(
+        job.job_id, dict()).get("status") != "ok"]
+    print("Batch: {0} jobs, {1} already done".format(
+        len(jobs), len(jobs) - len(pending)))
+
+    # fork keeps the configuration set from the command line (model_config, caches, ...)
+    context = multiprocessing.get_context("fork")
+    running: List[RunningJob] = []
+    progress_file = open(progress_path, "a" if resume else "w")
+
+    def finish(running_job: RunningJob, record: dict) -> None:
+        record.update(job_id=running_job.job.job_id, job=running_job.job.to_dict(),
+                      elapsed=time.time() - running_job.start)
+        progress[running_job.job.job_id] = record
+        progress_file.write(json.dumps(record) + "\n")
+        progress_file.flush()
+        os.fsync(progress_file.fileno())
+        print("[{0}] {1} ({2:.1f}s)".format(
+            record["status"], running_job.job.job_id, record["elapsed"]))
+
+    try:
+        while pending or running:
+            while pending and len(running) < max(1, workers):
+                job = pending.pop(0)
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=target, args=(
+                    job, os.path.join(output_dir, job.job_id), memory_limit_mb, sender))
+                process.start()
+                sender.close()
+                running.append(RunningJob(job, process, receiver))
+
+            time.sleep(0.1)
+            for running_job in list(running):
+                if running_job.connection.poll():
+                    try:
+                        record = running_job.connection.recv()
+                    except EOFError:
+                        record = None
+                    running_job.process.join()
+                elif not running_job.process.is_alive():
+                    running_job.process.join()
+                    record = None
+                elif timeout is not None and time.time() - running_job.start > timeout:
+                    running_job.process.kill()
+                    running_job.process.join()
+                    record = dict(status="timeout",
+                                  error="exceeded {0}s".format(timeout))
+                else:
+                    continue
+                if record is None:
+                    record = dict(status="crashed", error="exit code {0}".format(
+                        running_job.process.exitcode))
+                running.remove(running_job)
+                finish(running_job, record)
+    finally:
+        for running_job in running:
+            running_job.process.kill()
+        progress_file.close()
+
+    summary = get_summary([progress[job.job_id] for job in jobs if job.job_id in progress])
+    json.dump(summary, open(os.path.join(output_dir, SUMMARY_FILE), "w"), indent=4)
+    print_summary(summary)
+    return summary
+
+
+def get_summary(records: List[dict]) -> dict:
+    statuses: Dict[str, int] = dict()
+    stage_totals: Dict[str, float] = dict()
+    for record in records:
+        statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+        for stage, seconds in record.get("stage_timings", dict()).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+    return dict(jobs=len(records), statuses=statuses, stage_totals=stage_totals, records=records)
+
+
+def print_summary(summary: dict) -> None:
+    print("\n********************************")
+    print("Batch summary: {0} jobs {1}".format(
+        summary["jobs"], ", ".join(["{0} {1}".format(count, status) for status, count in sorted(summary["statuses"].items())])))
+    for record in summary["records"]:
+        timings = ", ".join(["{0} {1:.1f}s".format(stage, seconds)
+                            for stage, seconds in record.get("stage_timings", dict()).items()])
+        print("{0:<40} {1:<14} {2:>8.1f}s  {3}".format(record["job_id"], record["status"], record["elapsed"],
+                                                      timings or record.get("error", "")))
+    print("Total per stage: " + ", ".join(["{0} {1:.1f}s".format(stage, seconds)
+                                          for stage, seconds in summary["stage_totals"].items()]))
+    print("********************************\n")
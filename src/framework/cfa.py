@@ -27,16 +27,15 @@ class ConditionalNode(object):
 class ConditionalNodeFactory(object):
     def __init__(self) -> None:
         self.factory: List[ConditionalNode] = []
+        self.registry: Dict[Tuple[Node, bool], ConditionalNode] = dict()
 
     def create_or_get_cond(self, node: Node, is_true_branch: bool):
-        matched_conditionalnode = list(
-            filter(lambda x: x.node == node and x.is_true_branch == is_true_branch, self.factory))
-        if len(matched_conditionalnode) > 0:
-            return matched_conditionalnode[0]
-        else:
+        conditionalnode = self.registry.get((node, is_true_branch))
+        if conditionalnode is None:
             conditionalnode = ConditionalNode(node, is_true_branch)
+            self.registry[(node, is_true_branch)] = conditionalnode
             self.factory.append(conditionalnode)
-            return conditionalnode
+        return conditionalnode
 
 
 class CFI(object):
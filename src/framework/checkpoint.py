@@ -0,0 +1,55 @@
+# Per-function checkpoint of the partition results of split(): every transformed function is appended
+# to a JSONL file as soon as it completes, so a crashed run resumes without redoing its LLM work.
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional
+from src.framework.jsonl import truncate_partial_line
+from src.llmpartition import model_config
+from src.llmpartition import code_gen
+from src.vector_db import embedding_backend
+
+
+def get_source_hash(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_config_hash(target_contract_name: str, sensitive_var_names: List[str], solc_version, solc_remaps, mode: str) -> str:
+    # everything besides the source that changes what transform() produces
+    config = dict(target_contract_name=target_contract_name, sensitive_var_names=sorted(sensitive_var_names),
+                  solc_version=solc_version, solc_remaps=list(solc_remaps or []), mode=mode, llm=model_config.LLM,
+                  candidate_limit=code_gen.CANDIDATE_LIMIT, limit_count=code_gen.LIMIT_COUNT, search_mode=model_config.SEARCH_MODE,
+                  early_exit=[model_config.EARLY_EXIT_SCORE_THRESHOLD, model_config.EARLY_EXIT_TOP_K, model_config.EARLY_EXIT_PATIENCE],
+                  embedding_backend=embedding_backend.EMBEDDING_BACKEND)
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf8")).hexdigest()
+
+
+class PartitionCheckpoint(object):
+    def __init__(self, path: str, source_hash: str, config_hash: str) -> None:
+        self.path: str = path
+        self.source_hash: str = source_hash
+        self.config_hash: str = config_hash
+        self.results: Dict[str, dict] = dict()
+        if os.path.exists(self.path):
+            truncate_partial_line(self.path)
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("source_hash") == source_hash and record.get("config_hash") == config_hash:
+                        self.results[record["function"]] = record["partition_result"]
+
+    def get(self, function_name: str) -> Optional[dict]:
+        return self.results.get(function_name)
+
+    def add(self, function_name: str, partition_result: dict) -> None:
+        self.results[function_name] = partition_result
+        record = dict(source_hash=self.source_hash, config_hash=self.config_hash,
+                      function=function_name, partition_result=partition_result)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
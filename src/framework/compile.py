@@ -1,7 +1,15 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
 from typing import Optional, List, Dict, Callable, Tuple, TYPE_CHECKING, Union, Set, Any
 
 
 from crytic_compile import CryticCompile
+from crytic_compile.platform.standard import generate_standard_export
 from slither import Slither
 from slither.core.compilation_unit import SlitherCompilationUnit
 from slither.core.declarations.contract import Contract
@@ -9,12 +17,215 @@ from slither.core.declarations.function import Function, FunctionType, FunctionL
 from slither.core.declarations.modifier import Modifier
 from slither.core.variables.state_variable import StateVariable
 
+# compilation cache: crytic-compile standard exports on disk (rehydrated without invoking solc)
+# plus an in-process LRU of the Slither objects built from them
+COMPILATION_CACHE_ENABLED = True
+COMPILATION_CACHE_DIR = ".partitiongpt-cache/compilation"
+# the least recently used exports and cached sources are evicted beyond this total size
+COMPILATION_CACHE_MAX_SIZE = 512 * 2 ** 20
+SLITHER_LRU_SIZE = 8
+
+_slither_lru: "OrderedDict[str, Slither]" = OrderedDict()
+_slither_lru_lock = threading.Lock()
+
+# import "a.sol"; import "a.sol" as A; import * as A from "a.sol"; import {B, C} from "a.sol";
+IMPORT_PATTERN = re.compile(
+    r'^\s*import\s+(?:[^"\';]*?\bfrom\s+)?["\']([^"\']+)["\']', re.MULTILINE)
+
+
+def get_file_hash(file_path) -> Optional[str]:
+    try:
+        with open(file_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def get_remaps(solc_remaps) -> List[Tuple[str, str]]:
+    if isinstance(solc_remaps, str):
+        solc_remaps = solc_remaps.split()
+    remaps = []
+    for remap in solc_remaps or []:
+        prefix, _, target = remap.partition("=")
+        # drop the optional context of "context:prefix=target"
+        remaps.append((prefix.split(":")[-1], target))
+    return remaps
+
+
+def resolve_import(importer: str, import_path: str, remaps: List[Tuple[str, str]]) -> str:
+    # same lookup as solc with the working directory as base path
+    if import_path.startswith("./") or import_path.startswith("../"):
+        return os.path.normpath(os.path.join(os.path.dirname(importer), import_path))
+    matches = [(prefix, target) for prefix, target in remaps
+               if prefix and import_path.startswith(prefix)]
+    if len(matches) > 0:
+        prefix, target = max(matches, key=lambda remap: len(remap[0]))
+        import_path = target + import_path[len(prefix):]
+    return os.path.abspath(import_path)
+
+
+def get_source_hashes(contract_file, solc_remaps) -> Dict[str, Optional[str]]:
+    # content hash of the contract and of every file it imports, directly or not (None when missing)
+    remaps = get_remaps(solc_remaps)
+    source_hashes: Dict[str, Optional[str]] = dict()
+    pending = [os.path.abspath(contract_file)]
+    while len(pending) > 0:
+        file_path = pending.pop()
+        if file_path in source_hashes:
+            continue
+        try:
+            with open(file_path, "rb") as f:
+                content = f.read()
+        except OSError:
+            source_hashes[file_path] = None
+            continue
+        source_hashes[file_path] = hashlib.sha256(content).hexdigest()
+        imports = IMPORT_PATTERN.findall(content.decode("utf8", errors="replace"))
+        pending.extend(resolve_import(file_path, import_path, remaps)
+                       for import_path in reversed(imports))
+    return source_hashes
+
+
+def get_compilation_key(source_hashes: Dict[str, Optional[str]], solc_remaps, solc_version) -> str:
+    # the same sources compile to the same key wherever they are on disk
+    remaps = ["{0}={1}".format(prefix, target) for prefix, target in get_remaps(solc_remaps)]
+    key = json.dumps([list(source_hashes.values()), solc_version, remaps])
+    return hashlib.sha256(key.encode("utf8")).hexdigest()
+
+
+def is_compiled_from(ccompile: CryticCompile, source_hashes: Dict[str, Optional[str]]) -> bool:
+    # Slither reads the sources back from the paths they were compiled from, an entry compiled
+    # elsewhere is only usable while those files still hold the same content
+    expected_hashes = set(source_hashes.values())
+    for filename in ccompile.filenames:
+        if filename.absolute in source_hashes:
+            continue
+        file_hash = get_file_hash(filename.absolute)
+        if file_hash is None or file_hash not in expected_hashes:
+            return False
+    return True
+
+
+def remove_file(file_path) -> None:
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def get_cached_source_dir() -> str:
+    return os.path.join(COMPILATION_CACHE_DIR, "sources")
+
+
+def write_cached_source(content: str) -> str:
+    # Write generated code (e.g. a partition candidate) to a path derived from its content. The
+    # file is never rewritten, and compiling the same code again finds the export compiled from it.
+    source_dir = get_cached_source_dir()
+    file_path = os.path.abspath(os.path.join(source_dir, hashlib.sha256(
+        content.encode("utf8")).hexdigest() + ".sol"))
+    if os.path.exists(file_path):
+        os.utime(file_path)
+        return file_path
+    os.makedirs(source_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(suffix=".tmp", dir=source_dir)
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            f.write(content)
+        os.replace(tmp_file, file_path)
+    except BaseException:
+        remove_file(tmp_file)
+        raise
+    return file_path
+
+
+def evict_cache(max_size: int = None) -> None:
+    # drop the least recently used exports and sources until the cache fits in max_size bytes;
+    # an export whose sources are evicted is recompiled on its next use
+    max_size = COMPILATION_CACHE_MAX_SIZE if max_size is None else max_size
+    entries = []
+    for directory, suffix in [(COMPILATION_CACHE_DIR, "_export.json"), (get_cached_source_dir(), ".sol")]:
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if not name.endswith(suffix):
+                continue
+            file_path = os.path.join(directory, name)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file_path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, file_path in sorted(entries):
+        if total_size <= max_size:
+            break
+        remove_file(file_path)
+        total_size -= size
+
+
+def load_crytic_compile(contract_file, solc_remaps, solc_version, key: str,
+                        source_hashes: Dict[str, Optional[str]]) -> CryticCompile:
+    export_file = os.path.join(COMPILATION_CACHE_DIR, key + "_export.json")
+    if os.path.exists(export_file):
+        try:
+            ccompile = CryticCompile(export_file)
+            if is_compiled_from(ccompile, source_hashes):
+                # a hit makes the entry the most recently used one
+                os.utime(export_file)
+                return ccompile
+        except Exception:
+            print("Discard broken compilation cache entry {0}".format(export_file))
+            remove_file(export_file)
+
+    ccompile = CryticCompile(
+        contract_file, solc_remaps=solc_remaps, solc_version=solc_version)
+    os.makedirs(COMPILATION_CACHE_DIR, exist_ok=True)
+    # unique per writer, threads of one process included
+    fd, tmp_file = tempfile.mkstemp(
+        prefix=key + "_", suffix=".tmp", dir=COMPILATION_CACHE_DIR)
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            json.dump(generate_standard_export(ccompile), f)
+        os.replace(tmp_file, export_file)
+    except BaseException:
+        remove_file(tmp_file)
+        raise
+    evict_cache()
+    return ccompile
+
+
+def clear_slither_lru() -> None:
+    with _slither_lru_lock:
+        _slither_lru.clear()
+
 
 class Compilation(object):
-    def __init__(self, contract_file, solc_remaps, solc_version):
-        ccompile = CryticCompile(
-            contract_file, solc_remaps=solc_remaps, solc_version=solc_version)
-        self.slither: Slither = Slither(ccompile)
+    def __init__(self, contract_file, solc_remaps, solc_version, use_cache: bool = None):
+        if use_cache is None:
+            use_cache = COMPILATION_CACHE_ENABLED
+        if not use_cache:
+            ccompile = CryticCompile(
+                contract_file, solc_remaps=solc_remaps, solc_version=solc_version)
+            self.slither: Slither = Slither(ccompile)
+            return
+
+        source_hashes = get_source_hashes(contract_file, solc_remaps)
+        key = get_compilation_key(source_hashes, solc_remaps, solc_version)
+        with _slither_lru_lock:
+            slither = _slither_lru.get(key)
+            if slither is not None:
+                _slither_lru.move_to_end(key)
+        if slither is not None and not is_compiled_from(slither.crytic_compile, source_hashes):
+            slither = None
+        if slither is None:
+            slither = Slither(load_crytic_compile(
+                contract_file, solc_remaps, solc_version, key, source_hashes))
+            with _slither_lru_lock:
+                _slither_lru[key] = slither
+                _slither_lru.move_to_end(key)
+                while len(_slither_lru) > SLITHER_LRU_SIZE:
+                    _slither_lru.popitem(last=False)
+        self.slither: Slither = slither
 
     def get_contract_from_name(self, contract_name):
         result = list(filter(lambda contract: contract.name ==
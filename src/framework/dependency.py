@@ -1,15 +1,104 @@
-from typing import List, Set, Dict
+import weakref
+from array import array
+from typing import Callable, List, Set, Dict, Optional, Tuple
 from typing_extensions import Self
 from slither.core.cfg.node import Node, NodeType, recheable
 from slither.analyses.data_dependency.data_dependency import is_dependent
+from slither.core.variables.variable import Variable
 from .compile import ContractWrapper, Function
+from .reachability import ReachabilityIndex
+
+
+DATA_DEP = 1
+CONTROL_DEP = 2
+DEPENDENCY_KINDS: Dict[str, int] = {"DataDep": DATA_DEP, "ControlDep": CONTROL_DEP}
+DEPENDENCY_NAMES: Dict[int, str] = {kind: name for name, kind in DEPENDENCY_KINDS.items()}
+
+
+class CompactPDG(object):
+    # Data and control dependencies of one function in flat arrays. Nodes are ints indexing `nodes`,
+    # edges of both PDGs sit in one edge list tagged with their kind, and queries go through CSR
+    # arrays (the edges of node i are at offsets[i]:offsets[i + 1]) rebuilt on first use after a change.
+    __slots__ = ("nodes", "ids", "members", "edge_sources",
+                 "edge_targets", "edge_kinds", "_forward", "_backward")
+
+    def __init__(self) -> None:
+        self.nodes: List[Node] = []
+        self.ids: Dict[Node, int] = dict()
+        # kind bits of the PDGs each node is registered in
+        self.members: array = array('B')
+        self.edge_sources: array = array('i')
+        self.edge_targets: array = array('i')
+        self.edge_kinds: array = array('B')
+        self._forward: Optional[Tuple[array, array, array]] = None
+        self._backward: Optional[Tuple[array, array, array]] = None
+
+    def add_node(self, node: Node, kind: int) -> int:
+        i = self.ids.get(node)
+        if i is None:
+            i = len(self.nodes)
+            self.ids[node] = i
+            self.nodes.append(node)
+            self.members.append(0)
+            self._forward = self._backward = None
+        self.members[i] |= kind
+        return i
+
+    def id_of(self, node: Node) -> Optional[int]:
+        return self.ids.get(node)
+
+    def contains(self, node: Node, kind: int) -> bool:
+        i = self.ids.get(node)
+        return i is not None and self.members[i] & kind != 0
+
+    def add_edge(self, source: int, target: int, kind: int) -> None:
+        self.edge_sources.append(source)
+        self.edge_targets.append(target)
+        self.edge_kinds.append(kind)
+        self._forward = self._backward = None
+
+    def edge_count(self, kind: int = DATA_DEP | CONTROL_DEP) -> int:
+        return sum(1 for edge_kind in self.edge_kinds if edge_kind & kind)
+
+    def _build_csr(self, sources: array, targets: array) -> Tuple[array, array, array]:
+        # counting sort by source, the edges of a node keep their insertion order
+        offsets = array('i', [0]) * (len(self.nodes) + 1)
+        for source in sources:
+            offsets[source + 1] += 1
+        for i in range(len(self.nodes)):
+            offsets[i + 1] += offsets[i]
+        positions = array('i', offsets[:-1])
+        csr_targets = array('i', [0]) * len(sources)
+        csr_kinds = array('B', [0]) * len(sources)
+        for source, target, kind in zip(sources, targets, self.edge_kinds):
+            csr_targets[positions[source]] = target
+            csr_kinds[positions[source]] = kind
+            positions[source] += 1
+        return offsets, csr_targets, csr_kinds
+
+    def successors(self, i: int, kind: int) -> List[int]:
+        if self._forward is None:
+            self._forward = self._build_csr(
+                self.edge_sources, self.edge_targets)
+        offsets, targets, kinds = self._forward
+        return [targets[p] for p in range(offsets[i], offsets[i + 1]) if kinds[p] & kind]
+
+    def predecessors(self, i: int, kind: int) -> List[int]:
+        if self._backward is None:
+            self._backward = self._build_csr(
+                self.edge_targets, self.edge_sources)
+        offsets, sources, kinds = self._backward
+        return [sources[p] for p in range(offsets[i], offsets[i + 1]) if kinds[p] & kind]
+
+    def successor_nodes(self, node: Node, kind: int) -> List[Node]:
+        i = self.ids.get(node)
+        return [] if i is None else [self.nodes[j] for j in self.successors(i, kind)]
 
 
 class PDGNode:
-    def __init__(self, node: Node):
-        self.node: Node = node
-        self.sons: List[Self] = []
-        self.fathers: Set[Self] = set()
+    __slots__ = ()
+
+    node: Node
 
     def get_state_variables_reads(self):
         return self.node.state_variables_read
@@ -31,9 +120,28 @@ class PDGNode:
 
 
 class APINode(PDGNode):
-    def __init__(self, node: Node, dependency_type: str = "ControlDep"):
-        super().__init__(node)
-        self.dependency_type = dependency_type
+    # view of node `id` of a CompactPDG from one of its PDGs, the factory keeps a single view per node
+    __slots__ = ("factory", "id")
+
+    def __init__(self, factory: "SingletonAPINodeFactory", id: int):
+        self.factory: SingletonAPINodeFactory = factory
+        self.id: int = id
+
+    @property
+    def node(self) -> Node:
+        return self.factory.graph.nodes[self.id]
+
+    @property
+    def dependency_type(self) -> str:
+        return DEPENDENCY_NAMES[self.factory.kind]
+
+    @property
+    def sons(self) -> List[Self]:
+        return [self.factory.get_view(j) for j in self.factory.graph.successors(self.id, self.factory.kind)]
+
+    @property
+    def fathers(self) -> Set[Self]:
+        return set(self.factory.get_view(j) for j in self.factory.graph.predecessors(self.id, self.factory.kind))
 
     def add_son(self, son: Self):
         if self.dependency_type == "ControlDep":
@@ -42,33 +150,58 @@ class APINode(PDGNode):
         else:
             print("[{0}]{1} -> {2}".format(self.dependency_type,
                                            self.node.expression, son.node.expression))
-        self.sons.append(son)
-        son.add_father(self)
+        self.factory.graph.add_edge(self.id, son.id, self.factory.kind)
 
     def add_father(self, father: Self):
-        self.fathers.add(father)
+        self.factory.graph.add_edge(father.id, self.id, self.factory.kind)
 
 
 class SingletonAPINodeFactory(object):
-    def __init__(self) -> None:
-        self.apinodes: List[APINode] = []
+    # the nodes of one PDG (data or control) of a CompactPDG, which may be shared with the other PDG
+    __slots__ = ("graph", "kind", "order", "views")
+
+    def __init__(self, graph: CompactPDG = None, kind: int = CONTROL_DEP) -> None:
+        self.graph: CompactPDG = CompactPDG() if graph is None else graph
+        self.kind: int = kind
+        # node ids in registration order, and the view of each registered id
+        self.order: array = array('i')
+        self.views: List[Optional[APINode]] = []
 
     def create_or_get_node(self, node: Node, dependency_type: str = "ControlDep") -> APINode:
-        result = list(
-            filter(lambda apinode: apinode.node == node, self.apinodes))
-        if len(result) == 1:
-            return result[0]
-        else:
-            assert len(result) == 0
-            apinode = APINode(node, dependency_type=dependency_type)
-            self.apinodes.append(apinode)
-            return apinode
+        i = self.graph.add_node(node, self.kind)
+        if i >= len(self.views):
+            self.views.extend([None] * (i + 1 - len(self.views)))
+        apinode = self.views[i]
+        if apinode is None:
+            apinode = APINode(self, i)
+            self.views[i] = apinode
+            self.order.append(i)
+        return apinode
+
+    def get_view(self, i: int) -> Optional[APINode]:
+        return self.views[i] if i < len(self.views) else None
+
+    def get_node(self, node: Node) -> Optional[APINode]:
+        i = self.graph.id_of(node)
+        return None if i is None else self.get_view(i)
+
+    def __contains__(self, node: Node) -> bool:
+        return self.get_node(node) is not None
+
+    @property
+    def apinodes(self) -> List[APINode]:
+        return [self.views[i] for i in self.order]
+
+    @property
+    def registry(self) -> Dict[Node, APINode]:
+        return {apinode.node: apinode for apinode in self.apinodes}
 
 
 class ControlPDG(object):
-    def __init__(self, function: Function) -> None:
+    def __init__(self, function: Function, graph: CompactPDG = None) -> None:
         self.function: Function = function
-        self.factory: SingletonAPINodeFactory = SingletonAPINodeFactory()
+        self.factory: SingletonAPINodeFactory = SingletonAPINodeFactory(
+            graph, CONTROL_DEP)
 
     def generate(self):
         def traverse_cfg(node, cur_conditional_nodes: List[Node] = [], visited: Set[Node] = set()):
@@ -125,7 +258,7 @@ class ControlPDG(object):
 
                 for son in node.sons:
                     traverse_cfg(son, cur_conditional_nodes.copy(), visited)
-        traverse_cfg(self.function.entry_point)
+        traverse_cfg(self.function.entry_point, [], set())
 
     @property
     def nodes(self):
@@ -133,30 +266,39 @@ class ControlPDG(object):
 
 
 class DataPDG(object):
-    def __init__(self, function: Function) -> None:
+    def __init__(self, function: Function, graph: CompactPDG = None) -> None:
         self.function: Function = function
-        self.factory: SingletonAPINodeFactory = SingletonAPINodeFactory()
+        self.factory: SingletonAPINodeFactory = SingletonAPINodeFactory(
+            graph, DATA_DEP)
+        self.reachability: ReachabilityIndex = None
 
     def generate(self) -> None:
         # TODO: support more fine-grained control over data dependencies
-        for i, node_a in enumerate(self.function.nodes):
-            apinode_a = self.factory.create_or_get_node(
-                node_a, dependency_type="DataDep")
-            for j, node_b in enumerate(self.function.nodes):
-                if i == j:
-                    continue
-                if not self.is_reachable(node_a, node_b):
+        self.reachability = ReachabilityIndex.from_function(self.function)
+
+        apinodes: List[APINode] = [self.factory.create_or_get_node(
+            node, dependency_type="DataDep") for node in self.function.nodes]
+
+        # def-use index: only nodes reading a variable written by node_a can depend on it
+        readers: Dict[Variable, List[int]] = dict()
+        for j, apinode_b in enumerate(apinodes):
+            for variable in apinode_b.get_variables_read():
+                readers.setdefault(variable, []).append(j)
+
+        for i, apinode_a in enumerate(apinodes):
+            candidates: Set[int] = set()
+            for variable in apinode_a.get_variables_write():
+                candidates.update(readers.get(variable, []))
+            candidates.discard(i)
+            for j in sorted(candidates):
+                apinode_b = apinodes[j]
+                if not self.is_reachable(apinode_a.node, apinode_b.node):
                     continue
-                apinode_b = self.factory.create_or_get_node(
-                    node_b, dependency_type="DataDep")
                 if self.is_dependent(left=apinode_a, right=apinode_b):
                     apinode_a.add_son(apinode_b)
 
-    def is_reachable(self, left: Node, right: Node, visited=set()):
-        # FIXME: this current implementation seems not work
-        # I need to figure out the reason
-
-        return right in recheable(left)
+    def is_reachable(self, left: Node, right: Node) -> bool:
+        return self.reachability.is_reachable(left, right)
 
     def is_dependent(self, left: APINode, right: APINode):
         left_variable_writes = left.get_variables_write()
@@ -173,107 +315,137 @@ class DataPDG(object):
         return self.factory.apinodes
 
 
+class DependenceClosure(object):
+    # Transitive closure of the data and control PDGs of one function, held as bitsets.
+    # backward/forward propagation queries become bit tests instead of graph searches.
+    def __init__(self, data_pdg: DataPDG, control_pdg: ControlPDG) -> None:
+        self.data_factory: SingletonAPINodeFactory = data_pdg.factory
+        self.control_factory: SingletonAPINodeFactory = control_pdg.factory
+
+        # function nodes come first so that ids are shared with the CFG reachability index
+        self.cfg: ReachabilityIndex = data_pdg.reachability
+        nodes: List[Node] = list(self.cfg.nodes)
+        nodes.extend(apinode.node for apinode in self.data_factory.apinodes
+                     if apinode.node not in self.cfg.ids)
+        nodes.extend(apinode.node for apinode in self.control_factory.apinodes
+                     if apinode.node not in self.cfg.ids and apinode.node not in self.data_factory)
+
+        self.data: ReachabilityIndex = ReachabilityIndex(
+            nodes, lambda node: self._sons(self.data_factory, node))
+        self.combined: ReachabilityIndex = ReachabilityIndex(
+            nodes, lambda node: self._sons(self.data_factory, node) + self._sons(self.control_factory, node))
+        self._control: ReachabilityIndex = None
+
+        # nodes registered in each PDG, a propagation step through a PDG needs its target in there
+        self.data_mask: int = self.data.to_mask(
+            apinode.node for apinode in self.data_factory.apinodes)
+        self.control_mask: int = self.data.to_mask(
+            apinode.node for apinode in self.control_factory.apinodes)
+
+    @staticmethod
+    def _sons(factory: SingletonAPINodeFactory, node: Node) -> List[Node]:
+        return factory.graph.successor_nodes(node, factory.kind)
+
+    @property
+    def control(self) -> ReachabilityIndex:
+        if self._control is None:
+            self._control = ReachabilityIndex(
+                self.data.nodes, lambda node: self._sons(self.control_factory, node))
+        return self._control
+
+    def backward_index(self, left: Node) -> Optional[ReachabilityIndex]:
+        # the edges usable to reach `left` depend on which PDGs `left` belongs to
+        in_data = left in self.data_factory
+        in_control = left in self.control_factory
+        if in_data and in_control:
+            return self.combined
+        elif in_data:
+            return self.data
+        elif in_control:
+            return self.control
+        return None
+
+    def backward_propagation(self, left: Node, right: Node) -> bool:
+        index = self.backward_index(left)
+        return index is not None and index.is_reachable(right, left)
+
+    def forward_propagation(self, left: Node, right: Node) -> bool:
+        return self.data.is_reachable(left, right)
+
+
 class ProgramDependency(object):
     def __init__(self, contract: ContractWrapper):
         self.contract: ContractWrapper = contract
         self.control_dependencies: Dict[Function, ControlPDG] = dict()
         self.data_dependencies: Dict[Function, DataPDG] = dict()
+        self.closures: Dict[Function, DependenceClosure] = dict()
+        # the data and control PDG of a function share one graph
+        self.graphs: Dict[Function, CompactPDG] = dict()
+        # callbacks dropping analysis results derived from a previous generation of the PDG,
+        # as references returning the callback or None once its owner has been collected
+        self.invalidation_hooks: List[Callable[[], Optional[Callable[[], None]]]] = []
+
+    def add_invalidation_hook(self, hook: Callable[[], None]) -> None:
+        # a bound method is held weakly: the PDG outlives the analyses registering on it
+        if hasattr(hook, "__self__"):
+            self.invalidation_hooks.append(weakref.WeakMethod(hook))
+        else:
+            self.invalidation_hooks.append(lambda: hook)
 
     def generate_dependencies(self):
+        self.closures.clear()
+        live_hooks = []
+        for hook_ref in self.invalidation_hooks:
+            hook = hook_ref()
+            if hook is not None:
+                hook()
+                live_hooks.append(hook_ref)
+        self.invalidation_hooks = live_hooks
         for function in self.contract.get_functions():
             if not function.pure:
                 print("**************************")
                 print(function.name)
-                data_pdg = DataPDG(function)
+                graph = CompactPDG()
+                self.graphs[function] = graph
+                data_pdg = DataPDG(function, graph)
                 data_pdg.generate()
 
                 self.data_dependencies[function] = data_pdg
 
-                control_pdg = ControlPDG(function)
+                control_pdg = ControlPDG(function, graph)
                 control_pdg.generate()
 
                 self.control_dependencies[function] = control_pdg
 
+    def get_dependence_closure(self, function: Function) -> DependenceClosure:
+        closure = self.closures.get(function)
+        if closure is None:
+            closure = DependenceClosure(
+                self.data_dependencies[function], self.control_dependencies[function])
+            self.closures[function] = closure
+        return closure
+
     def get_datadep_apinode(self, function: Function, node: Node) -> List[APINode]:
-        nodes = list(filter(
-            lambda apinode: apinode.node == node,  self.data_dependencies[function].nodes))
-        return nodes
+        apinode = self.lookup_datadep_apinode(function, node)
+        return [] if apinode is None else [apinode]
 
     def get_controldep_apinode(self, function: Function, node: Node) -> List[APINode]:
-        nodes = list(filter(
-            lambda apinode: apinode.node == node,  self.control_dependencies[function].nodes))
-        return nodes
+        apinode = self.lookup_controldep_apinode(function, node)
+        return [] if apinode is None else [apinode]
 
-    # later we will add some cache support to speed up the analysis
-    # backward propagation gather data dependencies and control dependencies to produce compilable program slice
-    def backward_propagation(self, left: Node, right: Node, visited: Set = None):
-        if visited is None:
-            visited = set()
-        if (left, right) in visited:
-            return False
-        visited.add((left, right))
-        assert left.function == right.function, "Function mismatch"
-        left_datadep_apinodes = self.get_datadep_apinode(left.function, left)
-        right_datadep_apinodes = self.get_datadep_apinode(
-            right.function, right)
-        left_controldep_apinodes = self.get_controldep_apinode(
-            left.function, left)
-        right_controldep_apinodes = self.get_controldep_apinode(
-            right.function, right)
-
-        assert len(left_datadep_apinodes) <= 1 and len(
-            right_datadep_apinodes) <= 1
-
-        if len(left_datadep_apinodes) == 1 and len(right_datadep_apinodes) == 1:
-
-            if left_datadep_apinodes[0] in right_datadep_apinodes[0].sons:
-                return True
-            else:
-                for son in right_datadep_apinodes[0].sons:
-                    if self.backward_propagation(left, son.node, visited):
-                        return True
+    def lookup_datadep_apinode(self, function: Function, node: Node) -> Optional[APINode]:
+        return self.data_dependencies[function].factory.get_node(node)
 
-        if len(left_controldep_apinodes) == 1 and len(right_controldep_apinodes) == 1:
+    def lookup_controldep_apinode(self, function: Function, node: Node) -> Optional[APINode]:
+        return self.control_dependencies[function].factory.get_node(node)
 
-            if left_controldep_apinodes[0] in right_controldep_apinodes[0].sons:
-                return True
-            else:
-                for son in right_controldep_apinodes[0].sons:
-                    if self.backward_propagation(left, son.node, visited):
-                        return True
-        return False
+    # backward propagation gather data dependencies and control dependencies to produce compilable program slice
+    # i.e. whether `left` is reachable from `right` through the PDG edges `left` takes part in
+    def backward_propagation(self, left: Node, right: Node, visited: Set = None) -> bool:
+        assert left.function == right.function, "Function mismatch"
+        return self.get_dependence_closure(left.function).backward_propagation(left, right)
 
     # foward propagation only gather more data nodes that flow out of the sinks
-    def forward_propagation(self, left: Node, right: Node, visited: Set = None):
-        if visited is None:
-            visited = set()
-        if (left, right) in visited:
-            return False
-        visited.add((left, right))
+    def forward_propagation(self, left: Node, right: Node, visited: Set = None) -> bool:
         assert left.function == right.function, "Function mismatch"
-        left_datadep_apinodes = list(filter(
-            lambda apinode: apinode.node == left,  self.data_dependencies[left.function].nodes))
-        right_datadep_apinodes = list(filter(
-            lambda apinode: apinode.node == right,  self.data_dependencies[right.function].nodes))
-        left_controldep_apinodes = list(filter(
-            lambda apinode: apinode.node == left,  self.control_dependencies[left.function].nodes))
-        right_controldep_apinodes = list(filter(
-            lambda apinode: apinode.node == right,  self.control_dependencies[right.function].nodes))
-
-        if len(left_datadep_apinodes) == 1 and len(right_datadep_apinodes) == 1:
-
-            if right_datadep_apinodes[0] in left_datadep_apinodes[0].sons:
-                return True
-            else:
-                for son in left_datadep_apinodes[0].sons:
-                    if self.forward_propagation(son.node, right, visited):
-                        return True
-
-        # if len(left_controldep_apinodes) == 1 and len(right_controldep_apinodes) == 1:
-        #     if right_controldep_apinodes[0] in left_controldep_apinodes[0].sons:
-        #         return True
-        #     else:
-        #         for son in left_controldep_apinodes[0].sons:
-        #             if self.depend_on_with_forward_propagation(son.node, right, visited):
-        #                 return True
-        return False
+        return self.get_dependence_closure(left.function).forward_propagation(left, right)
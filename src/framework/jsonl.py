@@ -0,0 +1,26 @@
+# Helpers for the append-only JSONL files (checkpoints, batch progress) that must survive a crash.
+import os
+
+BLOCK_SIZE = 4096
+
+
+def truncate_partial_line(path: str) -> None:
+    # A run killed in the middle of a write leaves a last line without its newline. Cut it off
+    # before appending, otherwise the next record is glued to it and both are lost on reload.
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        while end > 0:
+            start = max(0, end - BLOCK_SIZE)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                break
+            end = start
+        f.truncate(start + newline + 1 if end > 0 else 0)
+        f.flush()
+        os.fsync(f.fileno())
@@ -1,11 +1,16 @@
 import os
 import json
-from typing import Tuple
+import time
+from typing import Dict, Tuple
 from .dependency import ProgramDependency
 from .compile import Compilation, ContractWrapper
 from .slicer import Slicer
 from .taint_tracking import TaintTrack
+from .checkpoint import PartitionCheckpoint, get_config_hash, get_source_hash
+from . import solc_pool
 from src.extractor.nonascii_remove import remove_non_ascii_for_a_file
+from src.llmpartition import llm_cache
+from src.vector_db import embedding_backend
 
 PartitionMode = None
 
@@ -24,7 +29,8 @@ def taint_analysis(file_path, target_contract_name, sensitive_vars, solc_version
     return pdg, tainter
 
 
-def split(file_path, target_contract_name, sensitive_var_name, solc_version, solc_remaps=['@openzeppelin=node_modules/@openzeppelin'], mode="simple", outputdir="./"):
+def split(file_path, target_contract_name, sensitive_var_name, solc_version, solc_remaps=['@openzeppelin=node_modules/@openzeppelin'], mode="simple", outputdir="./") -> Dict[str, float]:
+    # returns the wall-clock seconds spent in each stage
     global PartitionMode
     PartitionMode = mode
     # instance = Compilation(contract_file=file_path,
@@ -38,12 +44,22 @@ def split(file_path, target_contract_name, sensitive_var_name, solc_version, sol
 
     # tainter = TaintTrack(pdg, sensitive_var_names=[sensitive_var_name])
     # tainter.compute()
+    stage_timings: Dict[str, float] = dict()
+    start = time.perf_counter()
+    # the LLM candidates are checked with the compiler version of the contract
+    solc_pool.SOLC_VERSION = solc_version
     remove_non_ascii_for_a_file(file_path)
     pdg, tainter = taint_analysis(
         file_path, target_contract_name, sensitive_var_name.split(","), solc_version, solc_remaps)
+    stage_timings["taint_analysis"] = time.perf_counter() - start
 
-    slicer = Slicer(tainter=tainter, pdg=pdg)
+    checkpoint = PartitionCheckpoint(os.path.join(outputdir, target_contract_name + ".partition.checkpoint.jsonl"),
+                                     get_source_hash(file_path), get_config_hash(target_contract_name, sensitive_var_name.split(","), solc_version, solc_remaps, mode))
+    slicer = Slicer(tainter=tainter, pdg=pdg, checkpoint=checkpoint)
     pragma, cs_privates, cs_publics, other_libraries_or_external_contracts, all_cfi_policies, all_temporal_lock_policies, all_partition_result = slicer.compute_all_function_slices()
+    stage_timings.update(slicer.stage_timings)
+
+    start = time.perf_counter()
 
     json.dump(all_partition_result, open(os.path.join(
         outputdir, target_contract_name+".partition.json"), "w"), indent=4)
@@ -69,3 +85,10 @@ def split(file_path, target_contract_name, sensitive_var_name, solc_version, sol
         outputdir, target_contract_name + ".lock.json")
     json.dump(all_temporal_lock_policies, open(
         temporal_policy_json, "w"), indent=4)
+
+    stage_timings["output"] = time.perf_counter() - start
+
+    for cache_summary in [llm_cache.summary(), embedding_backend.summary()]:
+        if cache_summary is not None:
+            print(cache_summary)
+    return stage_timings
@@ -0,0 +1,133 @@
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set
+from slither.core.cfg.node import Node
+from slither.core.declarations.function import Function
+
+
+def strongly_connected_components(roots: Iterable[Hashable], successors: Callable[[Hashable], Iterable[Hashable]]) -> List[List[Hashable]]:
+    # iterative Tarjan, deep CFGs/call graphs must not hit the recursion limit
+    # components are returned in reverse topological order (callees/sons first)
+    index: Dict[Hashable, int] = dict()
+    lowlink: Dict[Hashable, int] = dict()
+    on_stack: Set[Hashable] = set()
+    stack: List[Hashable] = []
+    components: List[List[Hashable]] = []
+
+    for root in roots:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors(root)))]
+        while work:
+            item, sons = work[-1]
+            pushed = False
+            for son in sons:
+                if son not in index:
+                    index[son] = lowlink[son] = len(index)
+                    stack.append(son)
+                    on_stack.add(son)
+                    work.append((son, iter(successors(son))))
+                    pushed = True
+                    break
+                elif son in on_stack:
+                    lowlink[item] = min(lowlink[item], index[son])
+            if pushed:
+                continue
+            work.pop()
+            if work:
+                father = work[-1][0]
+                lowlink[father] = min(lowlink[father], lowlink[item])
+            if lowlink[item] == index[item]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.remove(member)
+                    component.append(member)
+                    if member == item:
+                        break
+                components.append(component)
+    return components
+
+
+def transitive_closure(successors: List[Iterable[int]]) -> List[int]:
+    # closure[i] is a bitset of every id reachable from i through at least one edge,
+    # i.e. i itself is only included when it sits on a cycle (same as slither's recheable)
+    size = len(successors)
+    components = strongly_connected_components(
+        range(size), lambda i: successors[i])
+
+    component_of: List[int] = [0] * size
+    for c, component in enumerate(components):
+        for i in component:
+            component_of[i] = c
+
+    component_bits: List[int] = [0] * len(components)
+    component_closure: List[int] = [0] * len(components)
+    for c, component in enumerate(components):
+        bits = 0
+        for i in component:
+            bits |= 1 << i
+        component_bits[c] = bits
+
+        mask = 0
+        cyclic = False
+        for i in component:
+            for j in successors[i]:
+                d = component_of[j]
+                if d == c:
+                    cyclic = True
+                else:
+                    mask |= component_bits[d] | component_closure[d]
+        if cyclic:
+            mask |= bits
+        component_closure[c] = mask
+
+    return [component_closure[component_of[i]] for i in range(size)]
+
+
+class ReachabilityIndex(object):
+    # Built once per function, answers reachability queries with a single bit test
+    def __init__(self, nodes: List[Node], successors: Callable[[Node], Iterable[Node]] = lambda node: node.sons) -> None:
+        self.nodes: List[Node] = list(nodes)
+        self.ids: Dict[Node, int] = {node: i for i, node in enumerate(self.nodes)}
+        self.closure: List[int] = transitive_closure(
+            [[self.ids[son] for son in successors(node) if son in self.ids] for node in self.nodes])
+
+    @classmethod
+    def from_function(cls, function: Function):
+        return cls(function.nodes)
+
+    def id_of(self, node: Node) -> Optional[int]:
+        return self.ids.get(node)
+
+    def is_reachable(self, left: Node, right: Node) -> bool:
+        i = self.ids.get(left)
+        j = self.ids.get(right)
+        if i is None or j is None:
+            return False
+        return (self.closure[i] >> j) & 1 == 1
+
+    def reachable_mask(self, node: Node) -> int:
+        i = self.ids.get(node)
+        return 0 if i is None else self.closure[i]
+
+    def reachable_from(self, node: Node) -> Set[Node]:
+        # drop-in replacement of slither's recheable(node)
+        return set(self.from_mask(self.reachable_mask(node)))
+
+    def to_mask(self, nodes: Iterable[Node]) -> int:
+        mask = 0
+        for node in nodes:
+            i = self.ids.get(node)
+            if i is not None:
+                mask |= 1 << i
+        return mask
+
+    def from_mask(self, mask: int) -> List[Node]:
+        result = []
+        while mask:
+            low = mask & -mask
+            result.append(self.nodes[low.bit_length() - 1])
+            mask ^= low
+        return result
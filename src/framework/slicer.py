@@ -2,7 +2,10 @@
 # We will consider many practical factors.
 # In a program slice, all pertinent nodes are recorded and well-organized.
 import re
-from typing import List, Set, Dict
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Set, Dict, Tuple
 from itertools import chain
 from slither.core.declarations.contract import Contract
 from slither.core.declarations.function import Function, ModifierStatements
@@ -16,81 +19,118 @@ from .dependency import APINode, ProgramDependency
 from .program_slice import ProgramSlice, ContractSlice
 from .cfa import CFA
 from .rwlock import RWLock
+from .checkpoint import PartitionCheckpoint
 from src.extractor.sourcecode_catcher import SourceCodeCatcher
 from src.llmpartition.code_gen import transform
 
+# number of functions transformed at the same time, in a "thread" or "process" pool
+TRANSFORM_WORKERS = 1
+TRANSFORM_POOL = "thread"
+
 
 class Slicer(object):
-    def __init__(self, tainter: TaintTrack, pdg: ProgramDependency) -> None:
+    def __init__(self, tainter: TaintTrack, pdg: ProgramDependency, checkpoint: PartitionCheckpoint = None) -> None:
         self.tainter: TaintTrack = tainter
         self.pdg: ProgramDependency = pdg
+        # functions already transformed by an earlier (interrupted) run are not sent to the LLM again
+        self.checkpoint: PartitionCheckpoint = checkpoint
         self.target_contract_name = self.pdg.contract.target_contract_name
         self.slices: List[ProgramSlice] = []
+        # seconds spent slicing and in the LLM transformation, over all functions
+        self.stage_timings: Dict[str, float] = dict(slicing=0.0, transform=0.0)
 
         locker = RWLock(self.pdg.contract)
         self.temporal_policies = locker.get_temporal_lock_policies()
 
-    def compute_function_slice(self, function: Function, sources: Set[APINode], sinks: Set[APINode]):
-
-        nodes_slice: List[Node] = list()
-
-        # all operations read/write private data are sink nodes
-        actual_sinks = sinks.union(sources)
-        nodes_slice.extend(map(lambda sink: sink.node, actual_sinks))
-
-        def traverse_cfg_forward(node: Node, visited: Set = None):
-            if visited is None:
-                visited = set()
-            if node is None:
-                return
-            if node in visited:
-                return
+    @staticmethod
+    def cfg_preorder(entry_point: Node) -> List[Node]:
+        # same visiting order as a recursive depth-first traversal over node.sons
+        order: List[Node] = []
+        visited: Set[Node] = set()
+        worklist: List[Node] = [entry_point]
+        while worklist:
+            node = worklist.pop()
+            if node is None or node in visited:
+                continue
             visited.add(node)
-            if node in nodes_slice:
-                pass
-            elif any([node in recheable(sink_node) and self.pdg.forward_propagation(sink_node, node) for sink_node in nodes_slice]):
+            order.append(node)
+            worklist.extend(reversed(node.sons))
+        return order
+
+    def expand_slice(self, function: Function, nodes_slice: List[Node], order: List[Node]) -> List[Node]:
+        closure = self.pdg.get_dependence_closure(function)
+        in_slice: Set[Node] = set(nodes_slice)
+
+        # forward: gather the data nodes that flow out of the slice
+        forward_mask = 0
+        for node in nodes_slice:
+            forward_mask |= closure.data.reachable_mask(
+                node) & closure.cfg.reachable_mask(node)
+        for node in order:
+            if node in in_slice:
+                continue
+            i = closure.data.id_of(node)
+            if i is not None and (forward_mask >> i) & 1:
                 nodes_slice.append(node)
-            # elif node.type in [NodeType.IF, NodeType.IFLOOP, NodeType.ENDIF, NodeType.ENDLOOP]:
+                in_slice.add(node)
+                forward_mask |= closure.data.closure[i] & closure.cfg.reachable_mask(
+                    node)
             elif node.type in [NodeType.ENDIF, NodeType.ENDLOOP]:
                 # we use ENDIF and ENDLOOP to maintain nested structure in the code
                 # to ease the reproduction of compilable program partitions
                 nodes_slice.append(node)
-            else:
-                pass
-
-            for son in node.sons:
-                traverse_cfg_forward(son, visited)
-
-        def traverse_cfg_backward(node: Node, visited: Set = None):
-            if visited is None:
-                visited = set()
-            if node is None:
-                return
-            if node in visited:
-                return
-            visited.add(node)
-            if node in nodes_slice:
-                pass
-            elif any([sink_node in recheable(node) and self.pdg.backward_propagation(sink_node, node) for sink_node in nodes_slice]):
+                in_slice.add(node)
+                if i is not None:
+                    forward_mask |= closure.data.closure[i] & closure.cfg.reachable_mask(
+                        node)
+
+        # backward: gather the data and control dependencies of the slice, a slice node is reached
+        # through the edges of the PDGs it belongs to
+        both_mask = closure.data_mask & closure.control_mask
+        slice_mask = closure.data.to_mask(nodes_slice)
+        for node in order:
+            if node in in_slice:
+                continue
+            cfg_mask = closure.cfg.reachable_mask(node)
+            targets = slice_mask & cfg_mask
+            if targets == 0:
+                continue
+            reached = closure.combined.reachable_mask(node) & targets & both_mask
+            reached |= closure.data.reachable_mask(
+                node) & targets & closure.data_mask & ~closure.control_mask
+            if reached == 0 and targets & closure.control_mask & ~closure.data_mask:
+                reached = closure.control.reachable_mask(
+                    node) & targets & closure.control_mask & ~closure.data_mask
+            if reached:
                 nodes_slice.append(node)
-            else:
-                pass
-            for son in node.sons:
-                traverse_cfg_backward(son, visited)
+                in_slice.add(node)
+                slice_mask |= 1 << closure.data.id_of(node)
+        return nodes_slice
+
+    def compute_function_slice(self, function: Function, sources: Set[APINode], sinks: Set[APINode]):
+
+        nodes_slice: List[Node] = list()
+
+        # all operations read/write private data are sink nodes
+        actual_sinks = sinks.union(sources)
+        nodes_slice.extend(map(lambda sink: sink.node, actual_sinks))
 
         priv_nodes = nodes_slice.copy()
 
+        order = self.cfg_preorder(function.entry_point)
+
         # print(len(nodes_slice))
-        traverse_cfg_forward(function.entry_point)
-        traverse_cfg_backward(function.entry_point)
+        nodes_slice = self.expand_slice(function, nodes_slice, order)
         slice1 = ProgramSlice(function, nodes_slice)
 
-        nodes_slice = list(filter(lambda node: node.expression is not None, set(function.nodes).difference(
-            nodes_slice).difference([function.entry_point]).intersection(recheable(function.entry_point))))
+        reachable_nodes = self.pdg.get_dependence_closure(
+            function).cfg.reachable_from(function.entry_point)
+        slice1_nodes = set(slice1.nodes)
+        nodes_slice = [node for node in function.nodes if node.expression is not None and node not in slice1_nodes
+                       and node != function.entry_point and node in reachable_nodes]
 
         # print(len(nodes_slice))
-        traverse_cfg_forward(function.entry_point)
-        traverse_cfg_backward(function.entry_point)
+        nodes_slice = self.expand_slice(function, nodes_slice, order)
         slice2 = ProgramSlice(function, nodes_slice)
 
         mycfa = CFA(function=function, normal_slice=slice2,
@@ -99,6 +139,43 @@ class Slicer(object):
 
         return slice1, slice2, cfi_policies, priv_nodes
 
+    def run_transform_jobs(self, transform_jobs: List[Tuple[str, Dict]]) -> Dict[str, Dict]:
+        # the functions are independent, their transformations (LLM requests, solc, candidate analyses)
+        # run side by side; results are checkpointed in completion order and reordered by the caller
+        results: Dict[str, Dict] = dict()
+        if TRANSFORM_WORKERS <= 1 or len(transform_jobs) <= 1:
+            for name, kwargs in transform_jobs:
+                results[name] = transform(**kwargs)
+                if self.checkpoint is not None:
+                    self.checkpoint.add(name, results[name])
+            return results
+
+        if TRANSFORM_POOL == "process":
+            # forked workers inherit the configuration and rebuild their own Slither objects
+            # through the compilation cache
+            executor = ProcessPoolExecutor(
+                max_workers=TRANSFORM_WORKERS, mp_context=multiprocessing.get_context("fork"))
+        else:
+            executor = ThreadPoolExecutor(max_workers=TRANSFORM_WORKERS)
+        # a failing function does not stop the loop: every other completed function is still
+        # checkpointed, and the first failure is raised once all jobs are done
+        failures: List[Tuple[str, BaseException]] = []
+        with executor:
+            futures = {executor.submit(transform, **kwargs): name for name, kwargs in transform_jobs}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print("Transformation of {0} failed: {1}".format(name, e))
+                    failures.append((name, e))
+                    continue
+                if self.checkpoint is not None:
+                    self.checkpoint.add(name, results[name])
+        if len(failures) > 0:
+            raise failures[0][1]
+        return results
+
     def compute_all_function_slices(self):
         sources = self.tainter.get_taint_sources()
         sinks = self.tainter.get_taint_sinks()
@@ -122,17 +199,23 @@ class Slicer(object):
             [node.get_variables_write() for node in sources.union(sinks)])) + list(self.tainter.sensitive_vars))
         new_sensitive_variables = set(
             filter(lambda x: x.name != "msg.sender", new_sensitive_variables))
+        sensitive_variable_names = sorted(
+            set([variable.name for variable in new_sensitive_variables]))
 
         ps_private_list: List[ProgramSlice] = list()
         ps_public_list: List[ProgramSlice] = list()
         all_cfi_policies: Dict[str, Dict] = dict()
         all_temporal_policies: Dict[str, Dict] = dict()
-        all_partition_results = []
-        for func in critical_funcs:
+        function_order: List[str] = []
+        partition_results: Dict[str, Dict] = dict()
+        transform_jobs: List[Tuple[str, Dict]] = []
+        # sorted so that the slices, prompts and results come out in the same order on every run
+        for func in sorted(critical_funcs, key=lambda f: f.full_name):
             if func.visibility not in ["public", "external"]:
                 continue
             if func.is_constructor:
                 continue
+            start = time.perf_counter()
             ps1, ps2, cfi_policies, priv_nodes = self.compute_function_slice(
                 func, func_sources[func] if func in func_sources else set(), func_sinks[func] if func in func_sinks else set())
             # print("Slice-1:")
@@ -159,11 +242,26 @@ class Slicer(object):
                     all_sink_source_nodes.update(
                         self.tainter.get_taint_sink_source_node_for_func(internal_func))
 
-            priv_nodes = set(map(lambda x: x.node, all_sink_source_nodes))
+            priv_nodes = sorted(set(map(lambda x: x.node, all_sink_source_nodes)),
+                                key=lambda node: (node.function.full_name, node.node_id))
+            self.stage_timings["slicing"] += time.perf_counter() - start
 
-            partition_result = transform(original_code, all_extern_deps, priv_slice=ps1.generate_code(), normal_slice=ps2.generate_code(
-            ), priv_nodes="\n".join([node.source_mapping.content for node in priv_nodes]), sensitive_variables=new_sensitive_variables, target_contract_name=self.target_contract_name, target_func_name=func.name)
-            all_partition_results.append(partition_result)
+            partition_result = None if self.checkpoint is None else self.checkpoint.get(
+                func.full_name)
+            if partition_result is not None:
+                print("Reuse checkpointed partition of {0}".format(func.full_name))
+                partition_results[func.full_name] = partition_result
+            else:
+                # plain strings only, a transform job can run in another thread or process
+                transform_jobs.append((func.full_name, dict(original_code=original_code, all_extern_deps_code=all_extern_deps, priv_slice=ps1.generate_code(), normal_slice=ps2.generate_code(
+                ), priv_nodes="\n".join([node.source_mapping.content for node in priv_nodes]), sensitive_variables=sensitive_variable_names, target_contract_name=self.target_contract_name, target_func_name=func.name)))
+            function_order.append(func.full_name)
+
+        start = time.perf_counter()
+        partition_results.update(self.run_transform_jobs(transform_jobs))
+        self.stage_timings["transform"] += time.perf_counter() - start
+        all_partition_results = [partition_results[name]
+                                 for name in function_order]
         
         # print("Slice done.")
 
@@ -0,0 +1,289 @@
+# Warm solc workers for the compile/fix loop of the LLM transformation.
+# Sources are passed in memory as standard-JSON input and structured diagnostics come back,
+# instead of forking `solc file.sol` for every fix round and grepping its stderr.
+import os
+import re
+import glob
+import json
+import queue
+import atexit
+import shutil
+import hashlib
+import threading
+import subprocess
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+# "auto" uses persistent solc-js workers when node and a solc-js build of the requested solc
+# version are available, and one `solc --standard-json` process per check otherwise
+SOLC_BACKEND = "auto"
+SOLCJS_MODULE = os.environ.get(
+    "PARTITIONGPT_SOLCJS", "examples/benchmark/curated/raw/node_modules/solc")
+# soljson builds of other versions, named as on binaries.soliditylang.org (soljson-v0.8.25+commit.b61c2a91.js)
+SOLJSON_DIR = os.environ.get(
+    "PARTITIONGPT_SOLJSON_DIR", ".partitiongpt-cache/soljson")
+# a missing build is fetched from there once (as solc-js' downloadCurrentVersion.js does); without it,
+# a solc-js module of another version falls back to one solc process per check
+SOLJSON_DOWNLOAD = True
+SOLJSON_URL = "https://binaries.soliditylang.org/bin"
+# compiler version of the contract being partitioned, set by split(); None takes whatever is installed
+SOLC_VERSION: Optional[str] = None
+SOLC_POOL_SIZE = 2
+SOLC_WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "solc_worker.js")
+SOLC_VERSION_PATTERN = re.compile(r"Version: (\d+\.\d+\.\d+)")
+
+# parsing and type checking only, no code generation: the same checks as a plain `solc file.sol`
+DIAGNOSTIC_SETTINGS = {"outputSelection": {"*": {"": ["ast"]}}}
+
+
+def source_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf8")).hexdigest()
+
+
+def get_errors(diagnostics: List[dict]) -> List[dict]:
+    return [diagnostic for diagnostic in diagnostics if diagnostic.get("severity") == "error"]
+
+
+def format_diagnostics(diagnostics: List[dict]) -> str:
+    return "\n".join([diagnostic.get("formattedMessage", diagnostic.get("message", "")) for diagnostic in diagnostics])
+
+
+class SolcJsWorker(object):
+    # one node process running solc_worker.js, remembers which sources it already holds
+    def __init__(self, solcjs_module: str, soljson: Optional[str] = None) -> None:
+        # soljson: a build to load instead of the one shipped with the solc-js module
+        command = ["node", SOLC_WORKER_SCRIPT, os.path.abspath(solcjs_module)]
+        if soljson is not None:
+            command.append(os.path.abspath(soljson))
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.known_sources = set()
+        self.next_id = 0
+
+    def request(self, sources: Dict[str, str], settings: dict, send_all: bool = False) -> dict:
+        self.next_id += 1
+        payload = dict()
+        for name, content in sources.items():
+            digest = source_hash(content)
+            if send_all or digest not in self.known_sources:
+                payload[name] = dict(hash=digest, content=content)
+            else:
+                payload[name] = dict(hash=digest)
+        self.process.stdin.write(json.dumps(
+            dict(id=self.next_id, sources=payload, settings=settings)) + "\n")
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("solc-js worker exited")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        for name, content in sources.items():
+            self.known_sources.add(source_hash(content))
+        return response
+
+    def compile(self, sources: Dict[str, str], settings: dict) -> dict:
+        response = self.request(sources, settings)
+        if "missing" in response:
+            # the worker evicted some sources from its cache
+            self.known_sources.clear()
+            response = self.request(sources, settings, send_all=True)
+        return response["output"]
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+
+
+class StandardJsonSolc(object):
+    # fallback: `solc --standard-json` reading the input from stdin, no temporary files
+    def __init__(self, solc_binary: str = "solc") -> None:
+        self.solc_binary: str = solc_binary
+
+    def compile(self, sources: Dict[str, str], settings: dict) -> dict:
+        standard_input = dict(language="Solidity", sources={
+            name: dict(content=content) for name, content in sources.items()}, settings=settings)
+        result = subprocess.run([self.solc_binary, "--standard-json"], input=json.dumps(standard_input),
+                                capture_output=True, text=True)
+        return json.loads(result.stdout)
+
+    def close(self) -> None:
+        pass
+
+
+def get_solcjs_version(solcjs_module: str) -> Optional[str]:
+    try:
+        with open(os.path.join(solcjs_module, "package.json")) as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def find_soljson(solcjs_module: str, solc_version: Optional[str]) -> Optional[Tuple[str, Optional[str]]]:
+    # (solc-js module, soljson build to load into it or None for its own) compiling solc_version
+    if shutil.which("node") is None:
+        return None
+    if os.path.exists(os.path.join(solcjs_module, "soljson.js")) and \
+            (solc_version is None or get_solcjs_version(solcjs_module) == solc_version):
+        return solcjs_module, None
+    if solc_version is None or not os.path.exists(os.path.join(solcjs_module, "wrapper.js")):
+        return None
+    builds = sorted(glob.glob(os.path.join(SOLJSON_DIR, "soljson-v{0}+commit.*.js".format(solc_version))) +
+                    glob.glob(os.path.join(SOLJSON_DIR, "soljson-v{0}.js".format(solc_version))))
+    return (solcjs_module, builds[0]) if len(builds) > 0 else None
+
+
+def download_soljson(solc_version: str) -> Optional[str]:
+    # the release build of solc_version in SOLJSON_DIR, checked against the sha256 of the release list;
+    # None when it cannot be fetched
+    try:
+        with urllib.request.urlopen(SOLJSON_URL + "/list.json", timeout=60) as response:
+            releases = json.load(response)
+        file_name = releases["releases"][solc_version]
+        build = [build for build in releases["builds"] if build["path"] == file_name][0]
+        with urllib.request.urlopen(SOLJSON_URL + "/" + file_name, timeout=300) as response:
+            content = response.read()
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        print("Warning: cannot download soljson {0}: {1}".format(solc_version, e))
+        return None
+    if "0x" + hashlib.sha256(content).hexdigest() != build.get("sha256"):
+        print("Warning: the downloaded soljson {0} does not match its sha256".format(solc_version))
+        return None
+    os.makedirs(SOLJSON_DIR, exist_ok=True)
+    path = os.path.join(SOLJSON_DIR, file_name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_solc_binary_version(solc_binary: str) -> Optional[str]:
+    try:
+        result = subprocess.run([solc_binary, "--version"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = SOLC_VERSION_PATTERN.search(result.stdout)
+    return match.group(1) if match is not None else None
+
+
+def find_solc_binary(solc_version: Optional[str]) -> Optional[str]:
+    # a solc of that version: installed by solc-select (as crytic-compile does), solc-<version>
+    # or solc on the PATH; None when there is none
+    if solc_version is None:
+        return shutil.which("solc")
+    candidates = []
+    for root in [os.environ.get("VIRTUAL_ENV"), os.path.expanduser("~")]:
+        if root is not None:
+            artifacts = os.path.join(root, ".solc-select", "artifacts")
+            candidates += [os.path.join(artifacts, "solc-" + solc_version, "solc-" + solc_version),
+                           os.path.join(artifacts, "solc-" + solc_version)]
+    candidates += [shutil.which("solc-" + solc_version), shutil.which("solc")]
+    for candidate in candidates:
+        if candidate is not None and os.path.isfile(candidate) and get_solc_binary_version(candidate) == solc_version:
+            return candidate
+    return None
+
+
+class SolcPool(object):
+    def __init__(self, size: int = None, backend: str = None, solcjs_module: str = None, solc_version: str = None) -> None:
+        self.size: int = SOLC_POOL_SIZE if size is None else size
+        self.solcjs_module: str = SOLCJS_MODULE if solcjs_module is None else solcjs_module
+        self.solc_version: Optional[str] = solc_version
+        # the solc-js build loaded by the workers, or the solc binary run for each check
+        self.soljson: Optional[str] = None
+        self.solc_binary: Optional[str] = None
+        backend = SOLC_BACKEND if backend is None else backend
+        solcjs = find_soljson(self.solcjs_module, solc_version) if backend in ["auto", "solcjs"] else None
+        if solcjs is None and backend in ["auto", "solcjs"] and solc_version is not None and SOLJSON_DOWNLOAD and \
+                shutil.which("node") is not None and os.path.exists(os.path.join(self.solcjs_module, "wrapper.js")):
+            print("Downloading soljson {0} to {1}".format(solc_version, SOLJSON_DIR))
+            if download_soljson(solc_version) is not None:
+                solcjs = find_soljson(self.solcjs_module, solc_version)
+        if solcjs is not None:
+            self.backend: str = "solcjs"
+            self.solcjs_module, self.soljson = solcjs
+        elif backend == "solcjs":
+            raise ValueError("No solc-js build of solc {0}: {1} holds {2}, and {3} has no soljson-v{0}".format(
+                solc_version, self.solcjs_module, get_solcjs_version(self.solcjs_module), SOLJSON_DIR))
+        else:
+            self.backend = "standard-json"
+            self.solc_binary = find_solc_binary(solc_version)
+            if self.solc_binary is None:
+                print("Warning: no solc {0} found, candidates are checked with the solc on the PATH; put its "
+                      "soljson build in {1} or install it with solc-select".format(solc_version, SOLJSON_DIR))
+                self.solc_binary = "solc"
+        print("Solc backend: {0}".format(self.describe()))
+        self.idle = queue.Queue()
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def describe(self) -> str:
+        if self.backend == "solcjs":
+            build = self.soljson or os.path.join(self.solcjs_module, "soljson.js")
+            return "solc-js ({0}) in up to {1} persistent node workers".format(build, self.size)
+        return "{0} --standard-json, one process per check (up to {1} at a time)".format(self.solc_binary, self.size)
+
+    def create_worker(self):
+        if self.backend == "solcjs":
+            return SolcJsWorker(self.solcjs_module, self.soljson)
+        return StandardJsonSolc(self.solc_binary)
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.workers) < self.size:
+                worker = self.create_worker()
+                self.workers.append(worker)
+                return worker
+        return self.idle.get()
+
+    def release(self, worker, broken: bool = False) -> None:
+        if broken:
+            worker.close()
+            with self.lock:
+                self.workers.remove(worker)
+        else:
+            self.idle.put(worker)
+
+    def compile(self, sources: Dict[str, str], settings: dict = DIAGNOSTIC_SETTINGS) -> dict:
+        # a worker that died (e.g. solc-js ran out of memory) is replaced once
+        for attempt in range(2):
+            worker = self.acquire()
+            try:
+                output = worker.compile(sources, settings)
+            except (RuntimeError, OSError, ValueError):
+                self.release(worker, broken=True)
+                if attempt == 1:
+                    raise
+                continue
+            self.release(worker)
+            return output
+
+    def check(self, sources: Dict[str, str]) -> List[dict]:
+        return self.compile(sources).get("errors", [])
+
+    def close(self) -> None:
+        with self.lock:
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.close()
+        self.idle = queue.Queue()
+
+
+_pools: Dict[Optional[str], SolcPool] = dict()
+_pools_lock = threading.Lock()
+
+
+def get_solc_pool(solc_version: Optional[str] = None) -> SolcPool:
+    # one pool per solc version and process
+    solc_version = SOLC_VERSION if solc_version is None else solc_version
+    with _pools_lock:
+        if solc_version not in _pools:
+            _pools[solc_version] = SolcPool(solc_version=solc_version)
+            atexit.register(_pools[solc_version].close)
+        return _pools[solc_version]
@@ -0,0 +1,56 @@
+// Long-lived solc-js worker used by src/framework/solc_pool.py.
+// Reads one JSON request per line on stdin and answers one JSON line on stdout:
+//   request:  {"id": 1, "sources": {"a.sol": {"hash": "...", "content": "..."}, "deps.sol": {"hash": "..."}}, "settings": {...}}
+//   response: {"id": 1, "output": <standard-json output>}  or  {"id": 1, "missing": ["<hash>"]}
+// Sources are remembered by hash, so unchanged dependency code is only sent once per worker.
+// Usage: node solc_worker.js <solc-js module> [<soljson build>]; with a build, the module's wrapper
+// loads it instead of the module's own soljson.js (another compiler version).
+const path = require("path");
+const readline = require("readline");
+const solc = process.argv.length > 3
+    ? require(path.join(process.argv[2], "wrapper"))(require(process.argv[3]))
+    : require(process.argv[2]);
+
+const MAX_CACHED_SOURCES = 256;
+const sourceCache = new Map();
+
+function remember(hash, content) {
+    sourceCache.delete(hash);
+    sourceCache.set(hash, content);
+    if (sourceCache.size > MAX_CACHED_SOURCES) {
+        sourceCache.delete(sourceCache.keys().next().value);
+    }
+}
+
+function handle(request) {
+    const sources = {};
+    const missing = [];
+    for (const [name, source] of Object.entries(request.sources)) {
+        if (source.content !== undefined) {
+            remember(source.hash, source.content);
+            sources[name] = { content: source.content };
+        } else if (sourceCache.has(source.hash)) {
+            const content = sourceCache.get(source.hash);
+            remember(source.hash, content);
+            sources[name] = { content: content };
+        } else {
+            missing.push(source.hash);
+        }
+    }
+    if (missing.length > 0) {
+        return { id: request.id, missing: missing };
+    }
+    const input = { language: "Solidity", sources: sources, settings: request.settings };
+    return { id: request.id, output: JSON.parse(solc.compile(JSON.stringify(input))) };
+}
+
+const lines = readline.createInterface({ input: process.stdin });
+lines.on("line", (line) => {
+    let response;
+    try {
+        response = handle(JSON.parse(line));
+    } catch (e) {
+        response = { id: null, error: String(e) };
+    }
+    process.stdout.write(JSON.stringify(response) + "\n");
+});
@@ -1,101 +1,151 @@
-from typing import List, Set, Union
+from typing import Callable, Dict, FrozenSet, List, Set, Union
 
+from slither.core.cfg.node import Node
 from slither.core.variables.variable import Variable
 from slither.analyses.data_dependency.data_dependency import is_dependent
 from slither.core.declarations.function import Function
 from .dependency import ProgramDependency, ContractWrapper, APINode
+from .reachability import strongly_connected_components
 
 # TODO: Currently we don't support propogation of taint analysis
 
+IGNORED_VARIABLES = ["msg.sender", "msg.value",
+                     "block.timestamp", "block.number", "msg.gas"]
+
+
+def get_internal_callees(function: Function) -> List[Function]:
+    callees: List[Function] = []
+    for node in function.nodes:
+        for internal_call in node.internal_calls:
+            if isinstance(internal_call, Function) and internal_call not in callees:
+                callees.append(internal_call)
+    return callees
+
+
+class TaintLattice(object):
+    # A node is labelled with a bitmask of the sensitive variables it depends on (one bit per variable),
+    # so a single pass over the nodes handles every sensitive variable at once.
+    # `depends(sensitive_var, variable)` decides the direction of the dependency.
+    def __init__(self, sensitive_vars: Set[Variable], depends: Callable[[Variable, Variable], bool]) -> None:
+        self.sensitive_vars: List[Variable] = list(sensitive_vars)
+        self.bits: Dict[Variable, int] = {
+            sensitive_var: 1 << i for i, sensitive_var in enumerate(self.sensitive_vars)}
+        self.depends = depends
+        self.variable_masks: Dict[Variable, int] = dict()
+        self.local_masks: Dict[Node, int] = dict()
+        # summary of a function = mask of its nodes, callees included
+        self.summaries: Dict[Function, int] = dict()
+
+    def to_variables(self, mask: int) -> Set[Variable]:
+        return set(sensitive_var for sensitive_var in self.sensitive_vars if mask & self.bits[sensitive_var])
+
+    def variable_mask(self, variable: Variable) -> int:
+        mask = self.variable_masks.get(variable)
+        if mask is None:
+            mask = 0
+            for sensitive_var in self.sensitive_vars:
+                if self.depends(sensitive_var, variable):
+                    mask |= self.bits[sensitive_var]
+            self.variable_masks[variable] = mask
+        return mask
+
+    def local_mask(self, node: Node) -> int:
+        mask = self.local_masks.get(node)
+        if mask is None:
+            mask = 0
+            for variable in node.variables_read:
+                if variable is not None and variable.name not in IGNORED_VARIABLES:
+                    mask |= self.variable_mask(variable)
+                mask |= self.bits.get(variable, 0)
+            for variable in node.variables_written:
+                mask |= self.variable_mask(variable)
+                mask |= self.bits.get(variable, 0)
+            self.local_masks[node] = mask
+        return mask
+
+    def node_mask(self, node: Node) -> int:
+        mask = self.local_mask(node)
+        for internal_call in node.internal_calls:
+            if isinstance(internal_call, Function):
+                mask |= self.get_summary(internal_call)
+        return mask
+
+    def get_summary(self, function: Function) -> int:
+        if function not in self.summaries:
+            self.summarize(function)
+        return self.summaries[function]
+
+    def summarize(self, root: Function) -> None:
+        def callees(function: Function) -> List[Function]:
+            return [callee for callee in get_internal_callees(function) if callee not in self.summaries]
+
+        # summaries are computed once, bottom-up over the internal call graph, and reused at every call site.
+        # components come callees first, recursive functions share one summary
+        for component in strongly_connected_components([root], callees):
+            mask = 0
+            for function in component:
+                for node in function.nodes:
+                    mask |= self.local_mask(node)
+                for callee in get_internal_callees(function):
+                    if callee not in component:
+                        mask |= self.summaries[callee]
+            for function in component:
+                self.summaries[function] = mask
+
 
 class TaintSources(object):
     def __init__(self, pdg: ProgramDependency, sensitive_vars: Set[Variable] = set()) -> None:
         self.pdg = pdg
         self.sensitive_vars = sensitive_vars
         self.sources: Set[APINode] = set()
+        self.labels: Dict[APINode, int] = dict()
+        self.lattice = TaintLattice(sensitive_vars, lambda sensitive_var, variable: is_dependent(
+            variable, sensitive_var, self.pdg.contract.contract))
 
     def is_dependent(self, sensitive_var: Variable, node: APINode) -> bool:
-        for variables_read in node.get_variables_read():
-            if variables_read is not None and variables_read.name not in ["msg.sender", "msg.value", "block.timestamp", "block.number", "msg.gas"]:
-                if is_dependent(variables_read, sensitive_var, self.pdg.contract.contract):
-                    return True
-
-        for variables_write in node.get_variables_write():
-            if is_dependent(variables_write, sensitive_var, self.pdg.contract.contract):
-                return True
-
-        for variable in node.get_variables_read():
-            if variable == sensitive_var:
-                return True
-
-        for variable in node.get_variables_write():
-            if variable == sensitive_var:
-                return True
-
-        for internal_call in node.node.internal_calls:
-            if isinstance(internal_call, Function):
-                for _node in internal_call.nodes:
-                    if self.is_dependent(sensitive_var,  APINode(_node,dependency_type=None)):
-                        return True 
-
-      
-        return False
+        return self.lattice.node_mask(node.node) & self.lattice.bits[sensitive_var] != 0
 
     def forward_analysis(self) -> None:
         for func in self.pdg.data_dependencies:
             for node in self.pdg.data_dependencies[func].nodes:
-                for sensitive_var in self.sensitive_vars:
-                    if self.is_dependent(sensitive_var=sensitive_var, node=node):
-                        self.sources.add(node)
-                        break
+                mask = self.lattice.node_mask(node.node)
+                if mask:
+                    self.sources.add(node)
+                    self.labels[node] = mask
 
     def get_taint_sources(self) -> Set[APINode]:
         return self.sources
 
+    def get_tainting_variables(self, node: APINode) -> Set[Variable]:
+        return self.lattice.to_variables(self.labels.get(node, 0))
+
 
 class TaintSinks(object):
     def __init__(self, pdg: ProgramDependency, sensitive_vars: Set[Variable] = set()) -> None:
         self.pdg = pdg
         self.sensitive_vars = sensitive_vars
         self.sinks: Set[APINode] = set()
+        self.labels: Dict[APINode, int] = dict()
+        self.lattice = TaintLattice(sensitive_vars, lambda sensitive_var, variable: is_dependent(
+            sensitive_var, variable, self.pdg.contract.contract))
 
     def is_dependent(self, sensitive_var: Variable, node: APINode) -> bool:
-        for variables_read in node.get_variables_read():
-            if variables_read is not None and variables_read.name not in ["msg.sender", "msg.value", "block.timestamp", "block.number", "msg.gas"]:
-                if is_dependent(sensitive_var, variables_read, self.pdg.contract.contract):
-                    return True
-
-        for variables_write in node.get_variables_write():
-            if is_dependent(sensitive_var, variables_write, self.pdg.contract.contract):
-                return True
-
-        for variable in node.get_variables_read():
-            if variable == sensitive_var:
-                return True
-
-        for variable in node.get_variables_write():
-            if variable == sensitive_var:
-                return True
-        
-        for internal_call in node.node.internal_calls:
-            if isinstance(internal_call, Function):
-                for _node in internal_call.nodes:
-                    if self.is_dependent(sensitive_var,  APINode(_node,dependency_type=None)):
-                        return True 
-
-        return False
+        return self.lattice.node_mask(node.node) & self.lattice.bits[sensitive_var] != 0
 
     def backward_analysis(self) -> None:
         for func in self.pdg.data_dependencies:
             for node in self.pdg.data_dependencies[func].nodes:
-                for sensitive_var in self.sensitive_vars:
-                    if self.is_dependent(sensitive_var=sensitive_var, node=node):
-                        self.sinks.add(node)
-                        break
+                mask = self.lattice.node_mask(node.node)
+                if mask:
+                    self.sinks.add(node)
+                    self.labels[node] = mask
 
     def get_taint_sinks(self) -> Set[APINode]:
         return self.sinks
 
+    def get_tainting_variables(self, node: APINode) -> Set[Variable]:
+        return self.lattice.to_variables(self.labels.get(node, 0))
+
 
 class TaintTrack(object):
     def __init__(self, pdg: ProgramDependency, sensitive_var_names: Set[Union[str | Variable]]) -> None:
@@ -111,37 +161,83 @@ class TaintTrack(object):
                 sensitive_vars.add(
                     pdg.contract.get_state_variable_from_name(var_name))
 
+        self.pdg = pdg
         self.taintsources = TaintSources(pdg, sensitive_vars)
         self.taintsinks = TaintSinks(pdg, sensitive_vars)
         self.sensitive_vars = sensitive_vars
 
+        # function -> its own source/sink nodes, and the memoized closure over callees and modifiers
+        self.func_taint_nodes: Dict[Function, Set[APINode]] = None
+        self.func_taint_closures: Dict[Function, FrozenSet[APINode]] = dict()
+        # set when the PDG is generated again after compute(): the sources and sinks are nodes of
+        # the previous generation and are recomputed on the next lookup
+        self.stale: bool = False
+        self.pdg.add_invalidation_hook(self.invalidate)
+
     def compute(self):
+        if self.stale:
+            self.taintsources = TaintSources(self.pdg, self.sensitive_vars)
+            self.taintsinks = TaintSinks(self.pdg, self.sensitive_vars)
+            self.stale = False
         self.taintsources.forward_analysis()
         self.taintsinks.backward_analysis()
+        self.build_function_index()
+
+    def refresh(self) -> None:
+        if self.stale:
+            self.compute()
+
+    def build_function_index(self) -> None:
+        self.func_taint_nodes = dict()
+        self.func_taint_closures = dict()
+        for apinode in self.get_taint_sources().union(self.get_taint_sinks()):
+            self.func_taint_nodes.setdefault(
+                apinode.node.function, set()).add(apinode)
+
+    def invalidate(self) -> None:
+        # only a computed tracker has results to redo, one not computed yet is computed on the new PDG
+        self.stale = self.stale or self.func_taint_nodes is not None
+        self.func_taint_nodes = None
+        self.func_taint_closures = dict()
 
     def get_taint_sources(self) -> Set[APINode]:
+        self.refresh()
         return self.taintsources.get_taint_sources()
 
     def get_taint_sinks(self) -> Set[APINode]:
+        self.refresh()
         return self.taintsinks.get_taint_sinks()
 
-    def get_taint_sink_source_node_for_func(self, func: Function):
-        result: Set = set()
-
-        for source in self.taintsources.get_taint_sources():
-            if source.node.function == func:
-                result.add(source)
-
-        for sink in self.taintsinks.get_taint_sinks():
-            if sink.node.function == func:
-                result.add(sink)
-
-        for internal_call in func.all_internal_calls():
-            if isinstance(internal_call, Function):
-                result.update(
-                    self.get_taint_sink_source_node_for_func(internal_call))
-
-        for c in func.modifiers_statements:
-            result.update(self.get_taint_sink_source_node_for_func(c.modifier))
-
-        return result
+    # sensitive variables a source/sink node depends on
+    def get_tainting_variables(self, node: APINode) -> Set[Variable]:
+        self.refresh()
+        return self.taintsources.get_tainting_variables(node).union(self.taintsinks.get_tainting_variables(node))
+
+    def get_taint_sink_source_node_for_func(self, func: Function) -> Set[APINode]:
+        self.refresh()
+        if self.func_taint_nodes is None:
+            self.build_function_index()
+        if func not in self.func_taint_closures:
+            self.compute_func_taint_closure(func)
+        return set(self.func_taint_closures[func])
+
+    def compute_func_taint_closure(self, root: Function) -> None:
+        def callees(func: Function) -> List[Function]:
+            result = [internal_call for internal_call in func.all_internal_calls()
+                      if isinstance(internal_call, Function)]
+            result.extend(c.modifier for c in func.modifiers_statements)
+            return result
+
+        def pending_callees(func: Function) -> List[Function]:
+            return [callee for callee in callees(func) if callee not in self.func_taint_closures]
+
+        # components come callees first, so every callee closure is ready when its callers are merged
+        for component in strongly_connected_components([root], pending_callees):
+            result: Set[APINode] = set()
+            for func in component:
+                result.update(self.func_taint_nodes.get(func, set()))
+                for callee in callees(func):
+                    if callee not in component:
+                        result.update(self.func_taint_closures[callee])
+            for func in component:
+                self.func_taint_closures[func] = frozenset(result)
@@ -0,0 +1,33 @@
+# Scratch workspace of a job (a contract, a function or a partition candidate).
+# Every job writes its temporary sources into its own directory, so jobs can run side by side.
+import os
+import shutil
+import tempfile
+
+
+class Workspace(object):
+    def __init__(self, prefix: str = "partitiongpt-", root: str = None) -> None:
+        if root is not None:
+            os.makedirs(root, exist_ok=True)
+        self.path: str = tempfile.mkdtemp(prefix=prefix, dir=root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def get_file_path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def write(self, name: str, content: str) -> str:
+        file_path = self.get_file_path(name)
+        with open(file_path, "w") as f:
+            f.write(content)
+        return file_path
+
+    def subworkspace(self, prefix: str) -> "Workspace":
+        return Workspace(prefix=prefix, root=self.path)
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -3,14 +3,12 @@ import glob
 import json
 import pandas as pd 
 import numpy as np 
+# run from the repository root: python -m src.linear_regression.ranking
+from src.linear_regression.scoring import predict_score
 
 work_dir = "./advanced"
 partition_files = glob.glob(os.path.join(work_dir, "*.partition.json"))
 
-distance_weight = 0.59421478
-global_ratio_weight = 0.19162208
-local_ratio_weight = 0.21416315
-
 data = dict()
 contracts = []
 func_counts = []
@@ -35,10 +33,10 @@ for partition_file in partition_files:
         for index in partitions:
             partition = partitions[index]
             if "global_ratio" in partition:
-                predict_score = distance_weight * partition["normalized_distance"] + \
-                    global_ratio_weight * partition["global_ratio"] + local_ratio_weight * partition["local_ratio"] 
+                score = predict_score(
+                    partition["normalized_distance"], partition["global_ratio"], partition["local_ratio"])
                 groundtruth_similarity = partition["groundtruth_similarity"]
-                results.append((predict_score, groundtruth_similarity))
+                results.append((score, groundtruth_similarity))
 
         ranking = sorted(results, key=lambda x: x[0], reverse=True)
 
@@ -0,0 +1,15 @@
+# Weights of the candidate ranking formula, fitted by regression.py on the benchmark results.
+# Shared by ranking.py (offline evaluation) and code_gen.transform (early-exit candidate search).
+from typing import Optional
+
+distance_weight = 0.59421478
+global_ratio_weight = 0.19162208
+local_ratio_weight = 0.21416315
+
+
+def predict_score(normalized_distance, global_ratio, local_ratio) -> Optional[float]:
+    # higher is better, None when a ratio could not be computed for the candidate
+    if normalized_distance is None or global_ratio is None or local_ratio is None:
+        return None
+    return distance_weight * normalized_distance + \
+        global_ratio_weight * global_ratio + local_ratio_weight * local_ratio
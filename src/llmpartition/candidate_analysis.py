@@ -0,0 +1,154 @@
+from typing import List, Optional, Set, Tuple
+from slither.core.cfg.node import NodeType
+from slither.core.declarations.function import Function
+from src.framework import compile as compilation
+from src.framework.compile import Compilation, ContractWrapper
+from src.framework.dependency import ProgramDependency
+from src.framework.taint_tracking import TaintTrack
+from src.framework.workspace import Workspace
+from src.extractor.sourcecode_catcher import SourceCodeCatcher
+
+
+def create_contract_wrapper(file_path, target_contract_name, solc_version, solc_remaps) -> ContractWrapper:
+    instance = Compilation(contract_file=file_path,
+                           solc_remaps=solc_remaps, solc_version=solc_version)
+
+    wrapper = ContractWrapper(
+        target_contract_name=target_contract_name, compilation=instance)
+    return wrapper
+
+
+def taint_analysis_for_wrapper(wrapper: ContractWrapper, sensitive_vars) -> Tuple[ProgramDependency, TaintTrack]:
+    pdg = ProgramDependency(contract=wrapper)
+    pdg.generate_dependencies()
+
+    match_name_sensitive_vars = set()
+    for func in wrapper.contract.functions:
+        for variable in func.variables_read_or_written:
+            # sensitive variables come as slither variables or as plain names
+            if any([variable.name == getattr(item, "name", item) for item in sensitive_vars]):
+                match_name_sensitive_vars.add(variable)
+
+    tainter = TaintTrack(pdg, sensitive_var_names=match_name_sensitive_vars)
+    tainter.compute()
+    return pdg, tainter
+
+
+class CandidateAnalysis(object):
+    # A partition candidate is compiled once, its PDG and taint results are built once,
+    # and the security check, the privilege ratios and function context queries all share them.
+    def __init__(self, file_path, target_contract_name, sensitive_variables, solc_version="0.8.25", solc_remaps=[]) -> None:
+        self.file_path = file_path
+        self.sensitive_variables = sensitive_variables
+        self.wrapper: ContractWrapper = create_contract_wrapper(
+            file_path, target_contract_name, solc_version, solc_remaps)
+        self._pdg: ProgramDependency = None
+        self._tainter: TaintTrack = None
+
+    @classmethod
+    def from_code(cls, transformed_code, all_extern_deps_code, sensitive_variables, target_contract_name, workspace: Workspace):
+        complete_code = "{0}\n{1}".format(
+            transformed_code, all_extern_deps_code)
+        if compilation.COMPILATION_CACHE_ENABLED:
+            # same code, same path: candidates seen before (in any job) reuse their compilation
+            tmp_file = compilation.write_cached_source(complete_code)
+        else:
+            tmp_file = workspace.write("analysis.sol", complete_code)
+        return cls(tmp_file, target_contract_name, sensitive_variables)
+
+    def _analyze(self) -> None:
+        if self._tainter is None:
+            self._pdg, self._tainter = taint_analysis_for_wrapper(
+                self.wrapper, self.sensitive_variables)
+
+    @property
+    def pdg(self) -> ProgramDependency:
+        self._analyze()
+        return self._pdg
+
+    @property
+    def tainter(self) -> TaintTrack:
+        self._analyze()
+        return self._tainter
+
+    def get_target_function(self, target_func_name) -> Function:
+        target_contract_funcs = self.wrapper.get_functions_from_name(
+            target_func_name)
+        assert len(target_contract_funcs) > 0, "did not find function {0}".format(
+            target_func_name)
+        return target_contract_funcs[0]
+
+    def get_priv_nodes_code(self, func: Function) -> List[str]:
+        return [node.source_mapping.content for node in set(map(
+            lambda x: x.node, self.tainter.get_taint_sink_source_node_for_func(func)))]
+
+    def check_is_secure_partition(self, target_func_name) -> Tuple[bool, str]:
+        target_contract_func = self.get_target_function(target_func_name)
+
+        all_priv_nodes = self.get_priv_nodes_code(target_contract_func)
+        for internal_call in target_contract_func.internal_calls:
+            if isinstance(internal_call, Function) and internal_call.name.endswith("_priv"):
+                included_priv_nodes = self.get_priv_nodes_code(internal_call)
+                unexpected_priv_nodes = set(
+                    all_priv_nodes).difference(included_priv_nodes)
+                unexpected_priv_nodes = list(
+                    filter(lambda x: x.find("_priv") == -1 and x.find("_callback") == -1 and x.find("return") == -1, unexpected_priv_nodes))
+                if len(unexpected_priv_nodes) > 0:
+                    return False, "Insecure! the function body of {0} has privilege operations: {1}".format(target_func_name, "\n".join(unexpected_priv_nodes))
+                else:
+                    return True, ""
+
+        return False, "Incorrect! the function body of {0} does not have a privileged sub function in the form of XXX_priv".format(target_func_name)
+
+    def compute_normalized_ratio_of_privilege_function(self, target_func_name) -> Optional[float]:
+        try:
+            func = self.wrapper.get_functions_from_name(target_func_name)[0]
+            func_code = SourceCodeCatcher.get_function_full_context(
+                func, self.wrapper)
+            priv_sub_funcs = []
+            for internal_call in func.internal_calls:
+                if isinstance(internal_call, Function):
+                    if internal_call.name.endswith("_priv"):
+                        # TODO: currently we assume that LLM will strictly follow my instruction to generate xxx_priv function
+                        priv_sub_funcs.append(internal_call)
+                        break
+                    else:
+                        continue
+            if len(priv_sub_funcs) == 1:
+                priv_sub_func = priv_sub_funcs[0]
+                priv_func_code = SourceCodeCatcher.get_function_full_context(
+                    priv_sub_func, self.wrapper)
+                ratio = len(priv_func_code) / len(func_code)
+                return ratio
+            else:
+                print("Do not find a internal function ending with `_priv`")
+                return None
+        except:
+            return None
+
+    def get_priv_ratio(self, target_func_name) -> Tuple[Optional[float], float]:
+        target_contract_func = self.get_target_function(target_func_name)
+
+        global_ratio = self.compute_normalized_ratio_of_privilege_function(
+            target_func_name)
+        for internal_call in target_contract_func.internal_calls:
+            if isinstance(internal_call, Function) and internal_call.name.endswith("_priv"):
+                size_priv_nodes = len(set(map(
+                    lambda x: x.node, self.tainter.get_taint_sink_source_node_for_func(
+                        internal_call))))
+                all_funcs: List[Function] = SourceCodeCatcher.get_function_full_context_raw(
+                    internal_call, self.wrapper)
+
+                size_func_nodes = 0
+                for func in all_funcs:
+                    size_func_nodes += len(list(filter(lambda node: node.type not in [
+                                           NodeType.ENTRYPOINT, NodeType.OTHER_ENTRYPOINT, NodeType.ENDLOOP, NodeType.ENDIF], func.nodes)))
+
+                ratio = size_priv_nodes / size_func_nodes
+                if ratio > 1:
+                    # TODO: Error if ratio is greater than 1
+                    return global_ratio, 1
+                else:
+                    return global_ratio, ratio
+
+        assert False, "Invalid partition"
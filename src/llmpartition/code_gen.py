@@ -1,173 +1,92 @@
 import os
+import asyncio
 import traceback
-import subprocess
 import json
 import openai
 from ollama import Client
 
 import editdistance
-from typing import Set, Tuple, List
+from typing import Dict, Optional, Set, Tuple, List
 from sklearn.metrics.pairwise import cosine_similarity
 from slither.core.cfg.node import NodeType
 from slither.core.declarations.function import Function, FunctionType, FunctionLanguage
 from src.framework.compile import Compilation, ContractWrapper
+from src.framework.workspace import Workspace
+from src.framework.solc_pool import format_diagnostics, get_errors, get_solc_pool
 from src.extractor.sourcecode_catcher import SourceCodeCatcher
 
 from src.framework.taint_tracking import TaintTrack
 from src.framework.dependency import APINode, ProgramDependency
 from src.vector_db import config
-from .prompt import format_template, transformation_template, transformation_example, transformation_example2, grammar_fix_template, instrumentation_template, verification_question_template, secure_fix_question_template
-from ..vector_db.cosine_similarity_getter import EmbeddingAnalyzer
+from .prompt import format_template, transformation_template, transformation_example, transformation_example2, grammar_fix_template, grammar_fix_span_template, instrumentation_template, verification_question_template, secure_fix_question_template
+from ..vector_db.embedding_backend import embed_texts
 from . import model_config as model_config
+from . import llm_cache
+from .diagnostics import FixContext, count_tokens, get_fix_context
+from .early_exit import EarlyExitRule, get_search_stats
+from .llm_client import AsyncLLMSession, build_messages, gather_candidates
+from .candidate_analysis import CandidateAnalysis, create_contract_wrapper, taint_analysis_for_wrapper
 
 openai.api_key = config.OPENAI_API_KEY
-client = Client(
-  host='http://localhost:11434',
-  headers={'x-some-header': 'some-value'}
-)
+client = None
+
+
+def get_ollama_client() -> Client:
+    # created on first use so that model_config.OLLAMA_HOST can still be changed at startup
+    global client
+    if client is None:
+        client = Client(
+          host=model_config.OLLAMA_HOST,
+          headers={'x-some-header': 'some-value'}
+        )
+    return client
+
 
 # LIMIT_COUNT =  10
 LIMIT_COUNT = 10
 CANDIDATE_LIMIT = 10
 
-def get_llm_result(prompt, example_prompts):
-    # few-shot learning
-    if model_config.LLM == "gpt-4o-mini":
-        chat_completion = openai.ChatCompletion.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": example,
-                } for example in example_prompts] + [
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            model= model_config.LLM,
-        )
+def get_llm_result(prompt, example_prompts, candidate=0):
+    # candidate: which generation (and fix/repair step) the request belongs to, part of the cache key
+    messages = build_messages(prompt, example_prompts)
 
-        response = chat_completion.choices[0].message
-        refusal = response.refusal
-        content = response.content
-        # print(content)
-        return content
-    else:
-        response = client.chat(messages=[
-                {
-                    "role": "user",
-                    "content": example,
-                } for example in example_prompts] + [
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            model= model_config.LLM,
+    def request():
+        if model_config.LLM == "gpt-4o-mini":
+            chat_completion = openai.ChatCompletion.create(
+                messages=messages,
+                model= model_config.LLM,
             )
-        content = response.message.content
-        return content
 
-def create_contract_wrapper(file_path, target_contract_name, solc_version, solc_remaps) -> ContractWrapper:
-    instance = Compilation(contract_file=file_path,
-                           solc_remaps=solc_remaps, solc_version=solc_version)
-
-    wrapper = ContractWrapper(
-        target_contract_name=target_contract_name, compilation=instance)
-    return wrapper
+            response = chat_completion.choices[0].message
+            refusal = response.refusal
+            content = response.content
+            # print(content)
+            return content
+        else:
+            response = get_ollama_client().chat(messages=messages,
+                model= model_config.LLM,
+                )
+            content = response.message.content
+            return content
 
+    return llm_cache.cached_completion(model_config.LLM, messages, {}, candidate, request)
 
 def compute_normalized_ratio_of_privilege_function(file_path, target_contract_name, solc_version, solc_remaps, target_func_name):
+    analysis = CandidateAnalysis(
+        file_path, target_contract_name, set(), solc_version, solc_remaps)
+    return analysis.compute_normalized_ratio_of_privilege_function(target_func_name)
 
-    wrapper = create_contract_wrapper(
-        file_path, target_contract_name, solc_version, solc_remaps)
-    try:
-        func = wrapper.get_functions_from_name(target_func_name)[0]
-        func_code = SourceCodeCatcher.get_function_full_context(func, wrapper)
-        priv_sub_funcs = []
-        for internal_call in func.internal_calls:
-            if isinstance(internal_call, Function):
-                if internal_call.name.endswith("_priv"):
-                    # TODO: currently we assume that LLM will strictly follow my instruction to generate xxx_priv function
-                    priv_sub_funcs.append(internal_call)
-                    break
-                else:
-                    continue
-        if len(priv_sub_funcs) == 1:
-            priv_sub_func = priv_sub_funcs[0]
-            priv_func_code = SourceCodeCatcher.get_function_full_context(
-                priv_sub_func, wrapper)
-            ratio = len(priv_func_code) / len(func_code)
-            return ratio
-        else:
-            print("Do not find a internal function ending with `_priv`")
-            return None
-    except:
-        return None
-
-
-def get_priv_ratio(transformed_code, all_extern_deps_code, sensitive_variables, target_contract_name, target_func_name):
-    complete_code = "{0}\n{1}".format(all_extern_deps_code, transformed_code)
-    tmp_file = ".{0}.tmp.sol".format(model_config.LLM)
-    open(tmp_file, "w").write(complete_code)
-
-    pdg, tainter = taint_analysis(file_path=tmp_file, target_contract_name=target_contract_name,
-                                  sensitive_vars=sensitive_variables, solc_version="0.8.25", solc_remaps=[])
-    target_contract_funcs = pdg.contract.get_functions_from_name(
-        target_func_name)
-    assert len(target_contract_funcs) > 0, "did not find function {0}".format(
-        target_func_name)
-    target_contract_func = target_contract_funcs[0]
-    # sink_or_sources: Set = tainter.get_taint_sink_source_node_for_func(
-    #     target_contract_func)
-
-    global_ratio = compute_normalized_ratio_of_privilege_function(file_path=tmp_file, target_contract_name=target_contract_name,
-                                                                  solc_version="0.8.25", solc_remaps=[], target_func_name=target_func_name)
-    # size_priv_nodes = len(set(map(
-    #     lambda x: x.node, tainter.get_taint_sinks().union(tainter.get_taint_sources()))))
-    for internal_call in target_contract_func.internal_calls:
-        if isinstance(internal_call, Function) and internal_call.name.endswith("_priv"):
-            size_priv_nodes = len(set(map(
-                lambda x: x.node, tainter.get_taint_sink_source_node_for_func(
-                    internal_call))))
-            all_funcs: List[Function] = SourceCodeCatcher.get_function_full_context_raw(
-                internal_call, pdg.contract)
-
-            size_func_nodes = 0
-            for func in all_funcs:
-                size_func_nodes += len(list(filter(lambda node: node.type not in [NodeType.ENTRYPOINT,NodeType.OTHER_ENTRYPOINT, NodeType.ENDLOOP, NodeType.ENDIF] , func.nodes)))
-
-            ratio = size_priv_nodes / size_func_nodes
-            if ratio > 1:
-                # TODO: Error if ratio is greater than 1
-                return global_ratio, 1
-            else:
-                return global_ratio, ratio
-
-    assert False, "Invalid partition"
+
+def get_priv_ratio(transformed_code, all_extern_deps_code, sensitive_variables, target_contract_name, target_func_name, workspace: Workspace):
+    analysis = CandidateAnalysis.from_code(
+        transformed_code, all_extern_deps_code, sensitive_variables, target_contract_name, workspace)
+    return analysis.get_priv_ratio(target_func_name)
 
 
 def taint_analysis(file_path, target_contract_name, sensitive_vars, solc_version, solc_remaps) -> Tuple[ProgramDependency, TaintTrack]:
-    # instance = Compilation(contract_file=file_path,
-    #                        solc_remaps=solc_remaps, solc_version=solc_version)
-    # wrapper = ContractWrapper(
-    #     target_contract_name=target_contract_name, compilation=instance)
     wrapper = create_contract_wrapper(
         file_path, target_contract_name, solc_version, solc_remaps)
-    pdg = ProgramDependency(contract=wrapper)
-    pdg.generate_dependencies()
-
-    match_name_sensitive_vars = set()
-    for func in wrapper.contract.functions:
-        for variable in func.variables_read_or_written:
-            if any([variable.name == item.name for item in sensitive_vars]):
-                match_name_sensitive_vars.add(variable)
-
-    tainter = TaintTrack(pdg, sensitive_var_names=match_name_sensitive_vars)
-    tainter.compute()
-    return pdg, tainter
-
-
+    return taint_analysis_for_wrapper(wrapper, sensitive_vars)
 
 
 def get_groundtruth_partition(target_contract_name, target_func_name):
@@ -180,47 +99,51 @@ def get_groundtruth_partition(target_contract_name, target_func_name):
     return None
 
 
-def check_is_secure_partition(transformed_code, all_extern_deps_code, sensitive_variables, target_contract_name, target_func_name):
-    complete_code = "{0}\n{1}".format(transformed_code, all_extern_deps_code)
-    tmp_file = ".{0}.tmp.sol".format(model_config.LLM)
-    open(tmp_file, "w").write(complete_code)
-    pdg, tainter = taint_analysis(file_path=tmp_file, target_contract_name=target_contract_name,
-                                  sensitive_vars=sensitive_variables, solc_version="0.8.25", solc_remaps=[])
-    target_contract_funcs = pdg.contract.get_functions_from_name(
-        target_func_name)
-    assert len(target_contract_funcs) > 0, "did not find function {0}".format(
-        target_func_name)
-    target_contract_func = target_contract_funcs[0]
-
-    all_priv_nodes = [node.source_mapping.content for node in set(map(
-                    lambda x: x.node, tainter.get_taint_sink_source_node_for_func(target_contract_func)))]
-    for internal_call in target_contract_func.internal_calls:
-        if isinstance(internal_call, Function) and internal_call.name.endswith("_priv"):
-            # print("\n".join(all_priv_nodes))
-            # print("--------------------------------")
-            included_priv_nodes = [node.source_mapping.content for node in set(map(
-                    lambda x: x.node, tainter.get_taint_sink_source_node_for_func(
-                        internal_call)))]
-            # print("\n".join(included_priv_nodes))
-            unexpected_priv_nodes = set(
-                    all_priv_nodes).difference(included_priv_nodes)
-            unexpected_priv_nodes = list(
-                    filter(lambda x: x.find("_priv") == -1 and x.find("_callback") == -1 and x.find("return") == -1, unexpected_priv_nodes))
-            if len(unexpected_priv_nodes)>0:
-                return False, "Insecure! the function body of {0} has privilege operations: {1}".format(target_func_name, "\n".join(unexpected_priv_nodes))
-            else:
-                return True, ""
-
-    return False, "Incorrect! the function body of {0} does not have a privileged sub function in the form of XXX_priv".format(target_func_name)
-
-
-def transform(original_code, all_extern_deps_code, priv_nodes, priv_slice, normal_slice, sensitive_variables, target_contract_name, target_func_name):
+def check_is_secure_partition(transformed_code, all_extern_deps_code, sensitive_variables, target_contract_name, target_func_name, workspace: Workspace):
+    analysis = CandidateAnalysis.from_code(
+        transformed_code, all_extern_deps_code, sensitive_variables, target_contract_name, workspace)
+    return analysis.check_is_secure_partition(target_func_name)
+
+
+def transform(original_code, all_extern_deps_code, priv_nodes, priv_slice, normal_slice, sensitive_variables, target_contract_name, target_func_name, workspace: Workspace = None):
+    if workspace is None:
+        with Workspace(prefix="{0}-{1}-".format(target_contract_name, target_func_name)) as workspace:
+            return transform(original_code, all_extern_deps_code, priv_nodes, priv_slice, normal_slice, sensitive_variables, target_contract_name, target_func_name, workspace)
+
+    return asyncio.run(transform_async(original_code, all_extern_deps_code, priv_nodes, priv_slice, normal_slice, sensitive_variables, target_contract_name, target_func_name, workspace))
+
+
+async def transform_async(original_code, all_extern_deps_code, priv_nodes, priv_slice, normal_slice, sensitive_variables, target_contract_name, target_func_name, workspace: Workspace):
     print("\n>>Contract:{0}\n>>Function:{1}".format(target_contract_name, target_func_name))
     all_partitions: dict = dict()
 
-    analyzer = EmbeddingAnalyzer()
+    # in sync mode the blocking client and the analyses run in place with one candidate at a time,
+    # in async mode the requests are awaited and compilation/analysis is moved off the event loop
+    if model_config.ASYNC_LLM:
+        session = AsyncLLMSession()
+        ask_llm = session.get_llm_result
+        concurrency = model_config.LLM_CONCURRENCY
+
+        async def offload(func, *args):
+            return await asyncio.to_thread(func, *args)
+    else:
+        async def ask_llm(prompt, example_prompts, candidate=0):
+            return get_llm_result(prompt, example_prompts, candidate)
+        concurrency = 1
 
-    result = get_llm_result(format_template.format(
+        async def offload(func, *args):
+            return func(*args)
+
+    # LLM calls per generation round, to estimate what an early exit saved
+    llm_calls: Dict[int, int] = dict()
+    # size of the grammar fix prompts sent, against the whole-contract prompts they replace
+    fix_tokens: Dict[str, int] = dict(prompt=0, full_prompt=0)
+
+    async def ask_candidate(gen_round, prompt, example_prompts, gen_step):
+        llm_calls[gen_round] = llm_calls.get(gen_round, 0) + 1
+        return await ask_llm(prompt, example_prompts, gen_step)
+
+    result = await ask_llm(format_template.format(
         original_contract=original_code), [])
     original_code = result.replace(
         "```solidity", "").replace("```", "")
@@ -231,17 +154,43 @@ def transform(original_code, all_extern_deps_code, priv_nodes, priv_slice, norma
     else:
         all_extern_deps_code = ""
 
-    def compile_multiple_tries(output_code):
-        success, error_feeback = compile(output_code, all_extern_deps_code)
+    def analyze(output_code, candidate_workspace: Workspace):
+        # one compilation/PDG/taint analysis per candidate version, shared by every check below
+        analysis = CandidateAnalysis.from_code(transformed_code=output_code, all_extern_deps_code=all_extern_deps_code,
+                                               sensitive_variables=sensitive_variables, target_contract_name=target_contract_name, workspace=candidate_workspace)
+        isSecure, failure_reason = analysis.check_is_secure_partition(
+            target_func_name)
+        return analysis, isSecure, failure_reason
+
+    async def compile_multiple_tries(output_code, gen_round: int, gen_step: str):
+        diagnostics = await offload(
+            compile_diagnostics, output_code, all_extern_deps_code)
         fixCount = 0
         fixCountLimit = LIMIT_COUNT
-        while not success and fixCount < fixCountLimit:
-            grammar_fix_prompt = grammar_fix_template.format(
-                input_contract=output_code, error_msg=error_feeback)
-            result = get_llm_result(grammar_fix_prompt, [])
-            output_code = result.replace(
+        while len(get_errors(diagnostics)) > 0 and fixCount < fixCountLimit:
+            print("Compilation Error: " + format_diagnostics(diagnostics))
+            grammar_fix_prompt, fix_context = get_grammar_fix_prompt(
+                output_code, all_extern_deps_code, diagnostics)
+            fix_tokens["prompt"] += count_tokens(grammar_fix_prompt)
+            fix_tokens["full_prompt"] += count_tokens(grammar_fix_template.format(
+                input_contract=output_code, error_msg=format_diagnostics(diagnostics)))
+            result = await ask_candidate(gen_round, grammar_fix_prompt, [], "{0}.fix{1}".format(gen_step, fixCount))
+            fixed_code = result.replace(
                 "```solidity", "").replace("```", "")
-            success, error_feeback = compile(output_code, all_extern_deps_code)
+            if fix_context is not None and not fix_context.is_replacement(fixed_code):
+                print("The fix of {0} is not a single {1}, fixing the whole contract".format(
+                    fix_context.member.name, fix_context.member.kind))
+                grammar_fix_prompt = grammar_fix_template.format(
+                    input_contract=output_code, error_msg=format_diagnostics(diagnostics))
+                fix_tokens["prompt"] += count_tokens(grammar_fix_prompt)
+                result = await ask_candidate(gen_round, grammar_fix_prompt, [], "{0}.fix{1}.full".format(gen_step, fixCount))
+                fixed_code = result.replace(
+                    "```solidity", "").replace("```", "")
+                fix_context = None
+            output_code = fixed_code if fix_context is None else fix_context.splice(
+                fixed_code)
+            diagnostics = await offload(
+                compile_diagnostics, output_code, all_extern_deps_code)
             fixCount += 1
         if fixCount > 0 and fixCount < fixCountLimit:
             print("Take {0} fix!".format(fixCount))
@@ -252,7 +201,11 @@ def transform(original_code, all_extern_deps_code, priv_nodes, priv_slice, norma
         else:
             return output_code
 
-    def multi_steps(gen_round):
+    async def multi_steps(gen_round):
+        print("--------------------------------------------")
+        print("{0}th Attempt to generate partition candidate...".format(gen_round - 1))
+        candidate_workspace = workspace.subworkspace(
+            "candidate-{0}-".format(gen_round))
         transformation_promt = transformation_template.format(
             original_function_code="\n".join(original_code) if isinstance(original_code, list) else original_code, privilege_code=priv_nodes, slice_priv=priv_slice, slice_normal=normal_slice)
 
@@ -260,91 +213,101 @@ def transform(original_code, all_extern_deps_code, priv_nodes, priv_slice, norma
 
         print(transformation_promt)
 
-        result = get_llm_result(transformation_promt, [transformation_example, transformation_example2])
+        result = await ask_candidate(gen_round, transformation_promt, [transformation_example, transformation_example2], gen_round)
 
         output_code = result.replace(
             "```solidity", "").replace("```", "")
 
-        try:
-            output_code = compile_multiple_tries(output_code)
-            isSecure, failure_reason = check_is_secure_partition(transformed_code=output_code, all_extern_deps_code=all_extern_deps_code,
-                                                                 sensitive_variables=sensitive_variables, target_contract_name=target_contract_name, target_func_name=target_func_name)
-
-            repairCount = 0
-            repairCountLimit = LIMIT_COUNT
-            while not isSecure and repairCount < repairCountLimit:
-
-                secure_fix_question = secure_fix_question_template.format(privilege_code=priv_nodes,
-                                                                          original_contract=original_code, transformed_contract=output_code, explanation=failure_reason,
-                                                                          slice_priv=priv_slice, slice_normal=normal_slice)
-                print("Repair unsecure partition")
-                print(secure_fix_question)
-                result = get_llm_result(secure_fix_question, [
-                    transformation_example, transformation_example2])
-                output_code = result.replace(
-                    "```solidity", "").replace("```", "")
-                output_code = compile_multiple_tries(output_code)
-
-                isSecure, failure_reason = check_is_secure_partition(transformed_code=output_code, all_extern_deps_code=all_extern_deps_code,
-                                                                     sensitive_variables=sensitive_variables, target_contract_name=target_contract_name, target_func_name=target_func_name)
-                repairCount += 1
-
-            if repairCount == repairCountLimit:
-                print("Cannot repair! exceeding {0} times".format(repairCount))
-                raise Exception("Cannot repair! exceeding {0} times".format(repairCount))
-            else:
-                if repairCount > 0:
-                    print("Take {0} repair!".format(repairCount))
-                distance = editdistance.eval(original_code, output_code)
-                normalized_distance = distance / \
-                    max(len(original_code), len(output_code))
-                print("Edit distance(normalized) {0}".format(
-                    normalized_distance))
-
-                global_ratio, ratio = get_priv_ratio(transformed_code=output_code, all_extern_deps_code=all_extern_deps_code, sensitive_variables=sensitive_variables,
-                                                     target_contract_name=target_contract_name, target_func_name=target_func_name)
-                print(
-                    "Ratio of privilege codebase size: global {0} local {1}".format(global_ratio, ratio))
-                print("Candidate#{0}:".format(gen_round))
-                print(output_code)
-                return output_code, normalized_distance, global_ratio, ratio, repairCount
-        except Exception as e:
-            traceback.print_exc()
-            raise e
-
-    candidateCountLimit = CANDIDATE_LIMIT
-    candidateCount = 0
+        output_code = await compile_multiple_tries(
+            output_code, gen_round, str(gen_round))
+        analysis, isSecure, failure_reason = await offload(
+            analyze, output_code, candidate_workspace)
+
+        repairCount = 0
+        repairCountLimit = LIMIT_COUNT
+        while not isSecure and repairCount < repairCountLimit:
+
+            secure_fix_question = secure_fix_question_template.format(privilege_code=priv_nodes,
+                                                                      original_contract=original_code, transformed_contract=output_code, explanation=failure_reason,
+                                                                      slice_priv=priv_slice, slice_normal=normal_slice)
+            print("Repair unsecure partition")
+            print(secure_fix_question)
+            gen_step = "{0}.repair{1}".format(gen_round, repairCount)
+            result = await ask_candidate(gen_round, secure_fix_question, [
+                transformation_example, transformation_example2], gen_step)
+            output_code = result.replace(
+                "```solidity", "").replace("```", "")
+            output_code = await compile_multiple_tries(
+                output_code, gen_round, gen_step)
+
+            analysis, isSecure, failure_reason = await offload(
+                analyze, output_code, candidate_workspace)
+            repairCount += 1
+
+        if repairCount == repairCountLimit:
+            print("Cannot repair! exceeding {0} times".format(repairCount))
+            raise Exception("Cannot repair! exceeding {0} times".format(repairCount))
+        else:
+            if repairCount > 0:
+                print("Take {0} repair!".format(repairCount))
+            distance = editdistance.eval(original_code, output_code)
+            normalized_distance = distance / \
+                max(len(original_code), len(output_code))
+            print("Edit distance(normalized) {0}".format(
+                normalized_distance))
+
+            global_ratio, ratio = await offload(
+                analysis.get_priv_ratio, target_func_name)
+            print(
+                "Ratio of privilege codebase size: global {0} local {1}".format(global_ratio, ratio))
+            print("Candidate#{0}:".format(gen_round))
+            print(output_code)
+            return output_code, normalized_distance, global_ratio, ratio, repairCount
+
     groundtruth_transformed_code = get_groundtruth_partition(
         target_contract_name=target_contract_name, target_func_name=target_func_name)
-    while candidateCount < candidateCountLimit:
-        try:
-            print("--------------------------------------------")
-            print("{0}th Attempt to generate partition candidate...".format(candidateCount))
-            output_code, normalized_distance, global_ratio, local_ratio, repair_count = multi_steps(
-                gen_round=candidateCount+1)
-            candidateCount += 1
-
-            if output_code is not None and groundtruth_transformed_code is not None:
-                input_embedding_result = analyzer.convert_to_embedding(
-                    output_code)
-                input_embedding_groundtruth = analyzer.convert_to_embedding(
-                    groundtruth_transformed_code)
-                similarities = cosine_similarity([input_embedding_result], [
-                    input_embedding_groundtruth])
-                similarity = similarities[0]
-                # print("Similarity Score: " + str(similarity))
-                # print("Ground truth: " + groundtruth_transformed_code)
-
-                print("\n********************************")
-                print("Summary(Edit distance, Size of privilege (global), Size of privilege (local),Similarity score):({0}, {1}, {2},  {3})".format(
-                    normalized_distance, global_ratio, local_ratio, similarity[0]))
-                print("********************************\n")
-                all_partitions[candidateCount] = dict(
-                    output_code=output_code, normalized_distance=normalized_distance, global_ratio=global_ratio, local_ratio=local_ratio, groundtruth_similarity=float(similarity[0]), repair_count = repair_count)
-        except:
-            print("Error: {0}th Attempt failed".format(candidateCount))
-            candidateCount += 1
-    return dict(target_contract_name=target_contract_name, target_func_name=target_func_name, original_code=original_code, all_extern_deps_code=all_extern_deps_code, groundtruth_transformed_code=groundtruth_transformed_code, partitions=all_partitions)
+    if model_config.SEARCH_MODE == "adaptive":
+        rule = EarlyExitRule(model_config.EARLY_EXIT_SCORE_THRESHOLD,
+                             model_config.EARLY_EXIT_TOP_K, model_config.EARLY_EXIT_PATIENCE)
+        candidates = await gather_candidates(multi_steps, CANDIDATE_LIMIT, concurrency,
+                                             should_stop=rule.should_stop, on_result=rule.update)
+        if rule.should_stop():
+            print("Stop candidate search: {0}".format(rule.stop_reason))
+    else:
+        rule = None
+        candidates = await gather_candidates(multi_steps, CANDIDATE_LIMIT, concurrency)
+    search_stats = get_search_stats(rule, CANDIDATE_LIMIT, llm_calls)
+    search_stats.update(grammar_fix_prompt_tokens=fix_tokens["prompt"],
+                        grammar_fix_full_prompt_tokens=fix_tokens["full_prompt"])
+    if fix_tokens["full_prompt"] > 0:
+        print("Grammar fix prompt tokens: {0} (whole contract: {1})".format(
+            fix_tokens["prompt"], fix_tokens["full_prompt"]))
+    # the ground truth and the candidates are embedded in one batch, identical code only once
+    groundtruth_similarities = dict()
+    scored_rounds = [gen_round for gen_round, candidate in enumerate(candidates, start=1)
+                     if candidate is not None and candidate[0] is not None]
+    if groundtruth_transformed_code is not None and len(scored_rounds) > 0:
+        embeddings = embed_texts([groundtruth_transformed_code] +
+                                 [candidates[gen_round - 1][0] for gen_round in scored_rounds])
+        groundtruth_similarities = dict(
+            zip(scored_rounds, cosine_similarity(embeddings[1:], embeddings[:1])))
+    for gen_round, candidate in enumerate(candidates, start=1):
+        if candidate is None:
+            continue
+        output_code, normalized_distance, global_ratio, local_ratio, repair_count = candidate
+
+        if gen_round in groundtruth_similarities:
+            similarity = groundtruth_similarities[gen_round]
+            # print("Similarity Score: " + str(similarity))
+            # print("Ground truth: " + groundtruth_transformed_code)
+
+            print("\n********************************")
+            print("Summary(Edit distance, Size of privilege (global), Size of privilege (local),Similarity score):({0}, {1}, {2},  {3})".format(
+                normalized_distance, global_ratio, local_ratio, similarity[0]))
+            print("********************************\n")
+            all_partitions[gen_round] = dict(
+                output_code=output_code, normalized_distance=normalized_distance, global_ratio=global_ratio, local_ratio=local_ratio, groundtruth_similarity=float(similarity[0]), repair_count = repair_count)
+    return dict(target_contract_name=target_contract_name, target_func_name=target_func_name, original_code=original_code, all_extern_deps_code=all_extern_deps_code, groundtruth_transformed_code=groundtruth_transformed_code, partitions=all_partitions, search_stats=search_stats)
 
 
 def verify(original_code, output_code):
@@ -357,24 +320,48 @@ def verify(original_code, output_code):
         return False, result
 
 
+CANDIDATE_SOURCE = "candidate.sol"
+DEPS_SOURCE = "deps.sol"
+
+
+def get_candidate_sources(transformed_function_code, all_extern_deps_code) -> Dict[str, str]:
+    # the dependencies go in their own source unit so that the solc workers only receive and parse
+    # them once. The two units import each other, so every declaration sees the same names as in
+    # the former single file; the import shares the first line to keep the candidate's line numbers
+    if not all_extern_deps_code:
+        return {CANDIDATE_SOURCE: transformed_function_code}
+    return {CANDIDATE_SOURCE: 'import "{0}"; {1}'.format(DEPS_SOURCE, transformed_function_code),
+            DEPS_SOURCE: 'import "{0}";\n{1}'.format(CANDIDATE_SOURCE, all_extern_deps_code)}
+
+
+def compile_diagnostics(transformed_function_code, all_extern_deps_code) -> List[dict]:
+    # warnings about the unchanged dependencies (e.g. their missing pragma) are not the candidate's to fix
+    diagnostics = get_solc_pool().check(get_candidate_sources(
+        transformed_function_code, all_extern_deps_code))
+    return [diagnostic for diagnostic in diagnostics if diagnostic.get("severity") == "error" or
+            diagnostic.get("sourceLocation", dict()).get("file") != DEPS_SOURCE]
+
+
+def get_grammar_fix_prompt(transformed_function_code, all_extern_deps_code, diagnostics: List[dict]) -> Tuple[str, Optional[FixContext]]:
+    # only the failing member and the declarations it uses when the errors sit in one member,
+    # the whole contract otherwise
+    sources = get_candidate_sources(
+        transformed_function_code, all_extern_deps_code)
+    fix_context = get_fix_context(
+        transformed_function_code, sources, CANDIDATE_SOURCE, get_errors(diagnostics))
+    if fix_context is None:
+        return grammar_fix_template.format(input_contract=transformed_function_code, error_msg=format_diagnostics(diagnostics)), None
+    return grammar_fix_span_template.format(declarations=fix_context.get_declarations_code(),
+                                            input_code=fix_context.code, error_msg=fix_context.get_error_msg()), fix_context
+
+
 def compile(transformed_function_code, all_extern_deps_code):
-    complete_contract_code = "{0} \n {1}".format(
+    diagnostics = compile_diagnostics(
         transformed_function_code, all_extern_deps_code)
-    tmp_file = ".{0}.tmp.sol".format(model_config.LLM)
-    open(tmp_file, "w").write(complete_contract_code)
-    # Example: Running a shell command and capturing its output
-    result = subprocess.run(
-        ["solc", tmp_file],  # Command as a list
-        capture_output=True,  # Captures both stdout and stderr
-        text=True        # Returns the output as a string instead of bytes
-    )
-
-    # Access the output and error
-    # print("Output:\n", result.stdout)
-    # print("Error:\n", result.stderr)
-    if result.stderr.find("Error:") != -1:
-        print("Compilation Error: " + str(result.stderr))
-        return False, result.stderr
+    if len(get_errors(diagnostics)) > 0:
+        error_msg = format_diagnostics(diagnostics)
+        print("Compilation Error: " + error_msg)
+        return False, error_msg
     else:
         return True, None
 
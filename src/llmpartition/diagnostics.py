@@ -0,0 +1,229 @@
+# Narrows a grammar fix down to the code solc complains about: the contract member holding the
+# errors plus the declarations it refers to, instead of the whole contract.
+import re
+from typing import Dict, List, Optional
+
+MEMBER_NAME_PATTERN = re.compile(
+    r"\b(function|modifier|struct|enum|event|error)\s+(\w+)")
+CONTRACT_PATTERN = re.compile(
+    r"\b(?:abstract\s+contract|contract|interface|library)\s+(\w+)[^{;]*\{")
+IDENTIFIER_PATTERN = re.compile(r"\b[A-Za-z_]\w*\b")
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+INITIALIZER_PATTERN = re.compile(r"(?<![=!<>])=(?![=>])")
+CALLABLE_KINDS = ["function", "modifier", "constructor", "fallback", "receive"]
+
+
+def count_tokens(text: str) -> int:
+    # words and punctuation, close enough to BPE token counts of code to compare prompt sizes
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def mask_comments_and_strings(code: str) -> str:
+    # same length as code, comments and string literals blanked out so braces inside them are ignored
+    masked = list(code)
+    i = 0
+    while i < len(code):
+        if code.startswith("//", i):
+            end = code.find("\n", i)
+            end = len(code) if end == -1 else end
+        elif code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            end = len(code) if end == -1 else end + 2
+        elif code[i] in "\"'":
+            end = i + 1
+            while end < len(code) and code[end] != code[i] and code[end] != "\n":
+                end += 2 if code[end] == "\\" else 1
+            end = min(end + 1, len(code))
+        else:
+            i += 1
+            continue
+        for j in range(i, end):
+            if masked[j] != "\n":
+                masked[j] = " "
+        i = end
+    return "".join(masked)
+
+
+def find_closing_brace(masked: str, open_index: int) -> Optional[int]:
+    depth = 0
+    for i in range(open_index, len(masked)):
+        if masked[i] == "{":
+            depth += 1
+        elif masked[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+class Member(object):
+    # a top-level member of a contract body, [start, end) in the candidate code
+    def __init__(self, kind: str, name: str, start: int, end: int, body_start: Optional[int]) -> None:
+        self.kind: str = kind
+        self.name: str = name
+        self.start: int = start
+        self.end: int = end
+        self.body_start: Optional[int] = body_start
+
+    def declaration(self, code: str) -> str:
+        # callables are summarized by their signature
+        if self.kind in CALLABLE_KINDS and self.body_start is not None:
+            return code[self.start:self.body_start].strip() + " { ... }"
+        return code[self.start:self.end].strip()
+
+
+class Contract(object):
+    def __init__(self, name: str, start: int, body_start: int, end: int, members: List[Member]) -> None:
+        self.name: str = name
+        self.start: int = start
+        self.body_start: int = body_start
+        self.end: int = end
+        self.members: List[Member] = members
+
+
+def parse_members(masked: str, body_start: int, body_end: int) -> Optional[List[Member]]:
+    members = []
+    i = body_start
+    while i < body_end:
+        while i < body_end and masked[i].isspace():
+            i += 1
+        if i >= body_end:
+            break
+        paren = 0
+        j = i
+        end = None
+        body = None
+        while j < body_end:
+            c = masked[j]
+            if c == "(":
+                paren += 1
+            elif c == ")":
+                paren -= 1
+            elif c == ";" and paren == 0:
+                end = j + 1
+                break
+            elif c == "{" and paren == 0:
+                body = j
+                closing = find_closing_brace(masked, j)
+                if closing is None or closing > body_end:
+                    return None
+                end = closing + 1
+                break
+            j += 1
+        if end is None:
+            return None
+        text = masked[i:end]
+        keyword = text.split(None, 1)[0].split("(")[0]
+        match = MEMBER_NAME_PATTERN.match(text)
+        if match is not None:
+            kind, name = match.group(1), match.group(2)
+        elif keyword in ["constructor", "fallback", "receive"]:
+            kind, name = keyword, keyword
+        elif keyword == "using":
+            kind, name = "using", ""
+        else:
+            # state variable: the last identifier before the initializer
+            names = IDENTIFIER_PATTERN.findall(
+                INITIALIZER_PATTERN.split(text, 1)[0])
+            kind, name = "variable", names[-1] if names else ""
+        members.append(Member(kind, name, i, end, body))
+        i = end
+    return members
+
+
+def parse_contracts(code: str) -> Optional[List[Contract]]:
+    masked = mask_comments_and_strings(code)
+    contracts = []
+    for match in CONTRACT_PATTERN.finditer(masked):
+        body_start = match.end() - 1
+        closing = find_closing_brace(masked, body_start)
+        if closing is None:
+            return None
+        members = parse_members(masked, body_start + 1, closing)
+        if members is None:
+            return None
+        contracts.append(Contract(match.group(1), match.start(),
+                         body_start + 1, closing, members))
+    return contracts
+
+
+class FixContext(object):
+    # the failing member of the candidate, what it refers to, and the errors located in it
+    def __init__(self, code: str, contract: Contract, member: Member, declarations: List[Member], errors: List[dict]) -> None:
+        self.full_code: str = code
+        self.contract: Contract = contract
+        self.member: Member = member
+        self.declarations: List[Member] = declarations
+        self.errors: List[dict] = errors
+
+    @property
+    def code(self) -> str:
+        return self.full_code[self.member.start:self.member.end]
+
+    def get_declarations_code(self) -> str:
+        header = self.full_code[self.contract.start:self.contract.body_start].strip()
+        lines = ["    " + member.declaration(self.full_code)
+                 for member in self.declarations]
+        return "\n".join([header] + lines + ["}"])
+
+    def get_error_msg(self) -> str:
+        return "\n".join([error.get("formattedMessage", error.get("message", "")) for error in self.errors])
+
+    def is_replacement(self, fixed_code: str) -> bool:
+        # the reply has to be the failing member alone, anything else (the whole contract, extra
+        # members, unbalanced braces) would corrupt the candidate once spliced in
+        contracts = parse_contracts("contract FixedMember {\n" + fixed_code + "\n}")
+        if contracts is None or len(contracts) != 1 or len(contracts[0].members) != 1:
+            return False
+        member = contracts[0].members[0]
+        return member.kind == self.member.kind and member.name == self.member.name
+
+    def splice(self, fixed_code: str) -> str:
+        return self.full_code[:self.member.start] + fixed_code.strip() + self.full_code[self.member.end:]
+
+
+def get_error_offset(error: dict, sources: Dict[str, str], source_name: str, code: str) -> Optional[int]:
+    # solc reports byte offsets into the source unit of the error. Only errors in source_name, the unit
+    # holding the candidate code (after an import of the other units), map into the code
+    location = error.get("sourceLocation")
+    if location is None or location.get("file") != source_name or location.get("start", -1) < 0:
+        return None
+    source = sources[source_name]
+    code_start = source.find(code)
+    if code_start < 0:
+        return None
+    offset = len(source.encode("utf8")[:location["start"]].decode(
+        "utf8", errors="ignore")) - code_start
+    return offset if 0 <= offset < len(code) else None
+
+
+def get_fix_context(code: str, sources: Dict[str, str], source_name: str, errors: List[dict]) -> Optional[FixContext]:
+    # None when the errors cannot be pinned to a single contract member,
+    # the caller then falls back to sending the whole contract
+    if len(errors) == 0:
+        return None
+    contracts = parse_contracts(code)
+    if not contracts:
+        return None
+
+    located = None
+    for error in errors:
+        offset = get_error_offset(error, sources, source_name, code)
+        if offset is None:
+            return None
+        found = None
+        for contract in contracts:
+            for member in contract.members:
+                if member.start <= offset < member.end:
+                    found = (contract, member)
+        if found is None or (located is not None and found[1] is not located[1]):
+            return None
+        located = found
+
+    contract, member = located
+    masked = mask_comments_and_strings(code)
+    identifiers = set(IDENTIFIER_PATTERN.findall(
+        masked[member.start:member.end]))
+    declarations = [other for other in contract.members
+                    if other is not member and other.name in identifiers]
+    return FixContext(code, contract, member, declarations, errors)
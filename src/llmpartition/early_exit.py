@@ -0,0 +1,56 @@
+# Adaptive candidate search: stop generating partition candidates for a function once more of
+# them are unlikely to change the outcome.
+from typing import Dict, List, Optional
+from src.linear_regression.scoring import predict_score
+
+
+class EarlyExitRule(object):
+    # A finished candidate has already compiled and passed the security check (failing ones are None).
+    # Stop when a candidate's predicted score reaches `threshold`, or when the best `top_k` candidates
+    # have stayed the same for `patience` further candidates.
+    def __init__(self, threshold: Optional[float], top_k: int, patience: int) -> None:
+        self.threshold: Optional[float] = threshold
+        self.top_k: int = top_k
+        self.patience: int = patience
+        self.scores: Dict[int, float] = dict()
+        self.top: List[int] = []
+        self.stable_rounds: int = 0
+        self.stop_reason: Optional[str] = None
+
+    def update(self, gen_round: int, candidate) -> None:
+        if candidate is None:
+            return
+        output_code, normalized_distance, global_ratio, local_ratio, repair_count = candidate
+        score = predict_score(normalized_distance, global_ratio, local_ratio)
+        if score is None:
+            return
+        self.scores[gen_round] = score
+
+        if self.stop_reason is None and self.threshold is not None and score >= self.threshold:
+            self.stop_reason = "candidate#{0} scored {1:.4f} >= {2}".format(
+                gen_round, score, self.threshold)
+
+        top = sorted(self.scores, key=lambda r: (-self.scores[r], r))[:self.top_k]
+        if len(top) == self.top_k and set(top) == set(self.top):
+            self.stable_rounds += 1
+        else:
+            self.stable_rounds = 0
+        self.top = top
+        if self.stop_reason is None and self.patience > 0 and self.stable_rounds >= self.patience:
+            self.stop_reason = "top-{0} unchanged for {1} candidates".format(
+                self.top_k, self.stable_rounds)
+
+    def should_stop(self) -> bool:
+        return self.stop_reason is not None
+
+
+def get_search_stats(rule: Optional[EarlyExitRule], candidate_limit: int, llm_calls: Dict[int, int]) -> dict:
+    # calls saved are estimated from the mean number of calls of the candidates that did run
+    generated = len(llm_calls)
+    skipped = candidate_limit - generated
+    calls = sum(llm_calls.values())
+    calls_per_candidate = calls / generated if generated > 0 else 1
+    return dict(search_mode="full" if rule is None else "adaptive", candidates_generated=generated,
+                candidates_skipped=skipped, llm_calls=calls,
+                estimated_llm_calls_saved=round(skipped * calls_per_candidate, 2),
+                stop_reason=None if rule is None else rule.stop_reason)
@@ -0,0 +1,127 @@
+# Persistent LLM response cache: reruns (e.g. after a crash) replay the answers of the previous run
+# instead of paying for the same requests again.
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, List, Optional
+
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = ".partitiongpt-cache/llm.sqlite"
+# seconds before an entry expires, None keeps entries forever
+LLM_CACHE_TTL: Optional[float] = None
+# least recently used entries are evicted beyond this size
+LLM_CACHE_MAX_ENTRIES = 100000
+
+
+def get_cache_key(model: str, messages: List[dict], params: dict, candidate) -> str:
+    # the candidate index is part of the key: the candidates of a function are sampled from the
+    # same prompt and must not collapse into a single cached answer
+    key = json.dumps([model, messages, params, str(candidate)], sort_keys=True)
+    return hashlib.sha256(key.encode("utf8")).hexdigest()
+
+
+class LLMResponseCache(object):
+    def __init__(self, path: str = None, ttl: Optional[float] = None, max_entries: int = None) -> None:
+        self.path: str = LLM_CACHE_PATH if path is None else path
+        self.ttl: Optional[float] = LLM_CACHE_TTL if ttl is None else ttl
+        self.max_entries: int = LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock = threading.Lock()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, accessed REAL)")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                with self.connection:
+                    self.connection.execute(
+                        "DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        with self.lock:
+            now = time.time()
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, model, response, now, now))
+                self.evict()
+
+    def evict(self) -> None:
+        if self.ttl is not None:
+            self.connection.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        count = self.connection.execute(
+            "SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)", (count - self.max_entries,))
+
+    def clear(self) -> None:
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def summary(self) -> str:
+        return "LLM cache: {0} hits, {1} misses".format(self.hits, self.misses)
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
+
+
+def get_cached_response(model: str, messages: List[dict], params: dict, candidate) -> Optional[str]:
+    if not LLM_CACHE_ENABLED:
+        return None
+    return get_cache().get(get_cache_key(model, messages, params, candidate))
+
+
+def put_cached_response(model: str, messages: List[dict], params: dict, candidate, response: str) -> None:
+    if LLM_CACHE_ENABLED and response is not None:
+        get_cache().put(get_cache_key(model, messages, params, candidate), model, response)
+
+
+def cached_completion(model: str, messages: List[dict], params: dict, candidate, request: Callable[[], str]) -> str:
+    response = get_cached_response(model, messages, params, candidate)
+    if response is None:
+        response = request()
+        put_cached_response(model, messages, params, candidate, response)
+    return response
+
+
+def summary() -> Optional[str]:
+    # None when no request went through the cache in this process
+    return None if _cache is None else _cache.summary()
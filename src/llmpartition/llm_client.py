@@ -0,0 +1,96 @@
+import asyncio
+import time
+import traceback
+import openai
+from ollama import AsyncClient
+from typing import Any, Awaitable, Callable, List, Optional
+from . import model_config as model_config
+from . import llm_cache
+
+
+def build_messages(prompt, example_prompts) -> List[dict]:
+    # few-shot learning
+    return [
+        {
+            "role": "user",
+            "content": example,
+        } for example in example_prompts] + [
+        {
+            "role": "user",
+            "content": prompt,
+        }
+    ]
+
+
+class RateLimiter(object):
+    # Spaces out request starts so that at most `rate` requests begin per second, 0 disables it
+    def __init__(self, rate: float) -> None:
+        self.interval: float = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_slot: float = 0.0
+        self.lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> None:
+        if self.interval == 0.0:
+            return
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AsyncLLMSession(object):
+    # One session per event loop: the httpx based clients are bound to the loop they first ran on
+    def __init__(self, rate: float = None) -> None:
+        self.limiter = RateLimiter(
+            model_config.LLM_RATE_LIMIT if rate is None else rate)
+        self.ollama_client: Optional[AsyncClient] = None
+
+    async def get_llm_result(self, prompt, example_prompts, candidate=0) -> str:
+        messages = build_messages(prompt, example_prompts)
+        response = llm_cache.get_cached_response(
+            model_config.LLM, messages, {}, candidate)
+        if response is not None:
+            return response
+
+        await self.limiter.acquire()
+        if model_config.LLM == "gpt-4o-mini":
+            chat_completion = await openai.ChatCompletion.acreate(
+                messages=messages,
+                model=model_config.LLM,
+            )
+            response = chat_completion.choices[0].message.content
+        else:
+            if self.ollama_client is None:
+                self.ollama_client = AsyncClient(host=model_config.OLLAMA_HOST)
+            response = (await self.ollama_client.chat(messages=messages, model=model_config.LLM)).message.content
+        llm_cache.put_cached_response(
+            model_config.LLM, messages, {}, candidate, response)
+        return response
+
+
+async def gather_candidates(generate: Callable[[int], Awaitable], candidate_limit: int, concurrency: int,
+                            should_stop: Callable[[], bool] = None, on_result: Callable[[int, Any], None] = None) -> List:
+    # runs generate(1..candidate_limit) with at most `concurrency` candidates in flight,
+    # results keep the generation order and a failed candidate yields None.
+    # Candidates that have not started yet are skipped (None) once should_stop() holds.
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(gen_round):
+        async with semaphore:
+            if should_stop is not None and should_stop():
+                return None
+            try:
+                result = await generate(gen_round)
+            except Exception:
+                print("Error: {0}th Attempt failed".format(gen_round - 1))
+                traceback.print_exc()
+                result = None
+            if on_result is not None:
+                on_result(gen_round, result)
+            return result
+
+    return await asyncio.gather(*[run(gen_round) for gen_round in range(1, candidate_limit + 1)])
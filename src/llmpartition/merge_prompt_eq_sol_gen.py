@@ -27,25 +27,31 @@ import numpy as np
 import openai
 from tqdm import tqdm
 from src.vector_db import config
+from src.llmpartition import llm_cache
 openai.api_key = config.OPENAI_API_KEY
 
 def get_llm_result(prompt):
     # few-shot learning
-    chat_completion = openai.ChatCompletion.create(
-        messages=[
-            {
-                "role": "user",
-                "content": prompt,
-            }
-        ],
-        model="gpt-4o",
-    )
-
-    response = chat_completion.choices[0].message
-    refusal = response.refusal
-    content = response.content
-    # print(content)
-    return content
+    messages = [
+        {
+            "role": "user",
+            "content": prompt,
+        }
+    ]
+
+    def request():
+        chat_completion = openai.ChatCompletion.create(
+            messages=messages,
+            model="gpt-4o",
+        )
+
+        response = chat_completion.choices[0].message
+        refusal = response.refusal
+        content = response.content
+        # print(content)
+        return content
+
+    return llm_cache.cached_completion("gpt-4o", messages, {}, 0, request)
 
 def extract_functions(solidity_code):
     # Regex to match function definitions with modifiers, visibility, and returns
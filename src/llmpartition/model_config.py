@@ -1 +1,13 @@
-LLM="gpt-4o-mini"
\ No newline at end of file
+LLM="gpt-4o-mini"
+OLLAMA_HOST="http://localhost:11434"
+# async candidate generation: candidates of a function run concurrently on the event loop
+ASYNC_LLM=False
+LLM_CONCURRENCY=4
+# maximum LLM requests started per second, 0 means unlimited
+LLM_RATE_LIMIT=0
+# candidate search: "full" always generates CANDIDATE_LIMIT candidates, "adaptive" stops early
+# once a candidate scores EARLY_EXIT_SCORE_THRESHOLD or the top-k candidates stop changing
+SEARCH_MODE="full"
+EARLY_EXIT_SCORE_THRESHOLD=0.5
+EARLY_EXIT_TOP_K=3
+EARLY_EXIT_PATIENCE=2
@@ -195,6 +195,30 @@ All the resulting code MUST satisfy the grammar of Solidity programming language
 MUST Output only the Fixed Code: Provide the corrected Solidity code in proper format, and avoid unnecessary text description.
 """
 
+grammar_fix_span_template = """
+
+You are an expert Solidity developer. Your task is to fix grammar errors in a fragment of a Solidity smart contract while ensuring the logic and functionality remain intact. Follow these steps:
+
+Declarations of the contract that the fragment refers to (function bodies are omitted), for reference only:
+```
+{declarations}
+```
+
+Syntactically incorrect code fragment as the input:
+```
+{input_code}
+```
+
+Below is the error output from Solidity compiler.
+```
+{error_msg}
+```
+
+Your task is to correct syntax issues of the code fragment based on Solidity grammar rules and the above-mentioned compiler's error message.
+All the resulting code MUST satisfy the grammar of Solidity programming language.
+MUST Output only the Fixed Code Fragment: Provide the corrected fragment alone (not the whole contract and not the declarations) in proper format, and avoid unnecessary text description.
+"""
+
 instrumentation_template = """
 Suppose you are an expert developers for Solidity smart contracts. There is a code partitioning task of smart contract function encompassing privilege and normal sub functions. Your job is to isolate these sub function into two indepedent functions that will eventually run in different smart contracts. Please instrument message passing events to orchestrate the execution of the two functions from different contracts. 
 
@@ -4,7 +4,12 @@ import argparse
 # from FineGrainedPartitionStrategy import main_advanced
 # from SimplePartitionStrategy import main_simple
 from src.framework.partition import split
-from src.llmpartition import model_config
+from src.llmpartition import model_config, llm_cache
+from src.framework import compile as compilation
+from src.framework import solc_pool
+from src.framework import batch
+from src.framework import slicer
+from src.vector_db import embedding_backend
 
 def main():
     parser = argparse.ArgumentParser(
@@ -18,6 +23,46 @@ def main():
         "--output_dir", dest="output_dir", type=str, required=False, default="./", help="output directory of the partitioned contract files.")
     parser.add_argument("--llm", dest="llm", required=False,
                         type=str, default="gpt-4o-mini", help="Specify LLM models to be used")
+    parser.add_argument("--no-compilation-cache", dest="compilation_cache", action="store_false",
+                        help="Always invoke solc instead of reusing cached compilations")
+    parser.add_argument("--solc-backend", dest="solc_backend", required=False, choices=["auto", "solcjs", "standard-json"],
+                        default=solc_pool.SOLC_BACKEND, help="Compiler used to check LLM candidates: persistent solc-js workers or solc --standard-json")
+    parser.add_argument("--no-soljson-download", dest="soljson_download", action="store_false",
+                        help="Do not download the solc-js build of the contract's solc version; without one, candidates are checked by one solc process each")
+    parser.add_argument("--solc-workers", dest="solc_workers", required=False,
+                        type=int, default=solc_pool.SOLC_POOL_SIZE, help="Number of persistent solc-js workers (concurrent solc processes with standard-json)")
+    parser.add_argument("--transform-workers", dest="transform_workers", required=False,
+                        type=int, default=slicer.TRANSFORM_WORKERS, help="Number of functions transformed at the same time")
+    parser.add_argument("--transform-pool", dest="transform_pool", required=False, choices=["thread", "process"],
+                        default=slicer.TRANSFORM_POOL, help="Run the concurrent function transformations in threads or processes")
+    parser.add_argument("--no-llm-cache", dest="llm_cache", action="store_false",
+                        help="Always query the LLM instead of replaying cached responses")
+    parser.add_argument("--llm-cache-ttl", dest="llm_cache_ttl", required=False,
+                        type=float, default=None, help="Seconds after which cached LLM responses expire")
+    parser.add_argument("--llm-cache-max-entries", dest="llm_cache_max_entries", required=False,
+                        type=int, default=llm_cache.LLM_CACHE_MAX_ENTRIES, help="Maximum number of cached LLM responses")
+    parser.add_argument("--embedding-backend", dest="embedding_backend", required=False, choices=sorted(embedding_backend.BACKENDS),
+                        default=embedding_backend.EMBEDDING_BACKEND, help="Embedding model: OpenAI, or a local one for offline runs")
+    parser.add_argument("--embedding-batch-size", dest="embedding_batch_size", required=False,
+                        type=int, default=embedding_backend.EMBEDDING_BATCH_SIZE, help="Number of texts embedded per request")
+    parser.add_argument("--no-embedding-cache", dest="embedding_cache", action="store_false",
+                        help="Embed every text again instead of reusing cached embeddings")
+    parser.add_argument("--search-mode", dest="search_mode", required=False, choices=["full", "adaptive"],
+                        default=model_config.SEARCH_MODE, help="Generate all candidates of a function, or stop early once a good one is found")
+    parser.add_argument("--early-exit-threshold", dest="early_exit_threshold", required=False,
+                        type=float, default=model_config.EARLY_EXIT_SCORE_THRESHOLD, help="Predicted ranking score that ends an adaptive search")
+    parser.add_argument("--early-exit-top-k", dest="early_exit_top_k", required=False,
+                        type=int, default=model_config.EARLY_EXIT_TOP_K, help="Size of the top-k set watched by an adaptive search")
+    parser.add_argument("--early-exit-patience", dest="early_exit_patience", required=False,
+                        type=int, default=model_config.EARLY_EXIT_PATIENCE, help="Number of candidates the top-k set must stay unchanged for")
+    parser.add_argument("--ollama-host", dest="ollama_host", required=False,
+                        type=str, default=model_config.OLLAMA_HOST, help="Address of the ollama server")
+    parser.add_argument("--async-llm", dest="async_llm", action="store_true",
+                        help="Generate the partition candidates of a function concurrently")
+    parser.add_argument("--llm-concurrency", dest="llm_concurrency", required=False,
+                        type=int, default=model_config.LLM_CONCURRENCY, help="Maximum number of candidates generated at the same time (with --async-llm)")
+    parser.add_argument("--llm-rate-limit", dest="llm_rate_limit", required=False,
+                        type=float, default=model_config.LLM_RATE_LIMIT, help="Maximum number of LLM requests started per second, 0 means unlimited (with --async-llm)")
 
     subparsers = parser.add_subparsers(
         dest="command", required=True)  # required=True 强制要求输入子命令
@@ -42,6 +87,21 @@ def main():
     parser_advanced.add_argument(
         "sensitive_var_name", type=str, help="Name of the sensitive variable to analyze.")
 
+    parser_batch = subparsers.add_parser(
+        'batch', help="Partition every contract listed in a manifest, one process per job.")
+    parser_batch.add_argument(
+        "manifest", type=str, help="JSON or CSV manifest with file, contract, sensitive_vars and optional solc_version, solc_remaps, mode.")
+    parser_batch.add_argument("--mode", dest="batch_mode", choices=["simple", "advanced"], default="simple",
+                              help="Partition mode of the jobs that do not set one")
+    parser_batch.add_argument("--workers", dest="workers", type=int, default=1,
+                              help="Number of jobs running at the same time")
+    parser_batch.add_argument("--timeout", dest="timeout", type=float, default=None,
+                              help="Seconds after which a job is killed")
+    parser_batch.add_argument("--max-memory", dest="max_memory", type=int, default=None,
+                              help="Address space limit of a job in MB")
+    parser_batch.add_argument("--no-resume", dest="resume", action="store_false",
+                              help="Rerun the jobs already recorded as done in the progress file")
+
     # 解析命令行参数
     args = parser.parse_args()
 
@@ -55,8 +115,34 @@ def main():
         if not os.path.exists(args.output_dir):
             os.mkdir(args.output_dir)
         model_config.LLM = args.llm 
-        split(args.filepath, args.target_contract_name,
-              args.sensitive_var_name, solc_remaps=solc_remaps, solc_version=args.solc, mode=args.command, outputdir=args.output_dir)
+        model_config.OLLAMA_HOST = args.ollama_host
+        model_config.SEARCH_MODE = args.search_mode
+        model_config.EARLY_EXIT_SCORE_THRESHOLD = args.early_exit_threshold
+        model_config.EARLY_EXIT_TOP_K = args.early_exit_top_k
+        model_config.EARLY_EXIT_PATIENCE = args.early_exit_patience
+        llm_cache.LLM_CACHE_ENABLED = args.llm_cache
+        llm_cache.LLM_CACHE_TTL = args.llm_cache_ttl
+        llm_cache.LLM_CACHE_MAX_ENTRIES = args.llm_cache_max_entries
+        embedding_backend.EMBEDDING_BACKEND = args.embedding_backend
+        embedding_backend.EMBEDDING_BATCH_SIZE = args.embedding_batch_size
+        embedding_backend.EMBEDDING_CACHE_ENABLED = args.embedding_cache
+        model_config.ASYNC_LLM = args.async_llm
+        model_config.LLM_CONCURRENCY = args.llm_concurrency
+        model_config.LLM_RATE_LIMIT = args.llm_rate_limit
+        compilation.COMPILATION_CACHE_ENABLED = args.compilation_cache
+        solc_pool.SOLC_BACKEND = args.solc_backend
+        solc_pool.SOLC_POOL_SIZE = args.solc_workers
+        solc_pool.SOLJSON_DOWNLOAD = args.soljson_download
+        slicer.TRANSFORM_WORKERS = args.transform_workers
+        slicer.TRANSFORM_POOL = args.transform_pool
+        if args.command == "batch":
+            jobs = batch.load_manifest(
+                args.manifest, default_solc_version=args.solc, default_solc_remaps=solc_remaps, default_mode=args.batch_mode)
+            batch.run_batch(jobs, args.output_dir, workers=args.workers, timeout=args.timeout,
+                            memory_limit_mb=args.max_memory, resume=args.resume)
+        else:
+            split(args.filepath, args.target_contract_name,
+                  args.sensitive_var_name, solc_remaps=solc_remaps, solc_version=args.solc, mode=args.command, outputdir=args.output_dir)
     else:
         parser.print_help()
 
@@ -0,0 +1,54 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+from src.vector_db import ann_index
+from src.vector_db.ann_index import IVFIndex
+from src.vector_db.embedding_store import EmbeddingStore
+
+
+def make_store(tmp_dir, size, random):
+    centers = random.normal(size=(20, 32))
+    rows = centers[random.integers(0, 20, size)] + random.normal(scale=0.1, size=(size, 32))
+    pkl_path = os.path.join(tmp_dir, "embeddings.pkl")
+    pickle.dump(({str(i): row.tolist() for i, row in enumerate(rows)}, [
+                dict(id=i) for i in range(size)]), open(pkl_path, "wb"))
+    return EmbeddingStore.load(pkl_path), centers
+
+
+def test_ivf_search():
+    random = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store, centers = make_store(tmp_dir, 2000, random)
+        ann_index.ANN_ENABLED = True
+        try:
+            index = ann_index.get_index(store)
+            assert os.path.exists(ann_index.get_index_path(store))
+            assert sorted(index.list_ids.tolist()) == list(range(2000))
+            # reused from disk, and ignored once the matrix it was built for changes
+            source_mtime = os.path.getmtime(EmbeddingStore.get_paths(store.path)[0])
+            assert IVFIndex.load(ann_index.get_index_path(store), 2000, source_mtime) is not None
+            assert IVFIndex.load(ann_index.get_index_path(store), 2001, source_mtime) is None
+
+            queries = centers + random.normal(scale=0.1, size=centers.shape)
+            recalls = []
+            for query in queries:
+                indices, scores = ann_index.search(store, query, 10)
+                exact_indices, exact_scores = store.top_k(query, 10)
+                assert np.all(np.diff(scores) <= 0)
+                recalls.append(len(set(indices) & set(exact_indices)) / 10)
+            assert np.mean(recalls) >= 0.9
+
+            # more neighbours than the probed lists hold falls back to exact search
+            indices, _ = ann_index.search(store, queries[0], 2000)
+            assert sorted(indices.tolist()) == list(range(2000))
+        finally:
+            ann_index.ANN_ENABLED = False
+
+        # disabled, the search is exact
+        assert ann_index.get_index(store) is None
+        assert ann_index.search(store, queries[0], 5)[0].tolist() == store.top_k(queries[0], 5)[0].tolist()
+
+
+if __name__ == "__main__":
+    test_ivf_search()
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.llmpartition import llm_cache, model_config
+from src.llmpartition.llm_client import AsyncLLMSession, gather_candidates
+
+LATENCY = 0.5
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+    # minimal ollama /api/chat endpoint, echoes the last message after a fixed latency
+    def do_POST(self):
+        request = json.loads(self.rfile.read(
+            int(self.headers["Content-Length"])))
+        time.sleep(LATENCY)
+        body = json.dumps(dict(model=request["model"], created_at="2024-01-01T00:00:00Z", done=True,
+                               message=dict(role="assistant", content="echo:" + request["messages"][-1]["content"]))).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_candidates(candidate_limit, concurrency):
+    async def run():
+        session = AsyncLLMSession(rate=0)
+
+        async def generate(gen_round):
+            if gen_round == 2:
+                raise Exception("broken candidate")
+            return await session.get_llm_result("candidate {0}".format(gen_round), [])
+
+        return await gather_candidates(generate, candidate_limit, concurrency)
+
+    start = time.time()
+    results = asyncio.run(run())
+    return results, time.time() - start
+
+
+def test_concurrent_candidates():
+    server = start_fake_server()
+    settings = (model_config.LLM, model_config.OLLAMA_HOST,
+                llm_cache.LLM_CACHE_ENABLED)
+    model_config.LLM = "fake-model"
+    llm_cache.LLM_CACHE_ENABLED = False
+    model_config.OLLAMA_HOST = "http://127.0.0.1:{0}".format(
+        server.server_address[1])
+    try:
+        results, elapsed = run_candidates(candidate_limit=6, concurrency=6)
+        assert results == [None if i == 2 else "echo:candidate {0}".format(i)
+                           for i in range(1, 7)]
+        # all candidates overlap, close to the latency of one request
+        assert elapsed < 3 * LATENCY
+
+        results, elapsed = run_candidates(candidate_limit=4, concurrency=1)
+        assert results[0] == "echo:candidate 1" and results[1] is None
+        assert elapsed >= 3 * LATENCY
+    finally:
+        server.shutdown()
+        model_config.LLM, model_config.OLLAMA_HOST, llm_cache.LLM_CACHE_ENABLED = settings
+
+
+def test_rate_limiter():
+    async def run():
+        session = AsyncLLMSession(rate=10)
+        start = time.time()
+        await asyncio.gather(*[session.limiter.acquire() for _ in range(5)])
+        return time.time() - start
+
+    assert asyncio.run(run()) >= 0.35
+
+
+if __name__ == "__main__":
+    test_concurrent_candidates()
+    test_rate_limiter()
@@ -0,0 +1,70 @@
+import os
+import json
+import time
+import tempfile
+from src.framework.batch import BatchJob, load_manifest, load_progress, run_batch, PROGRESS_FILE
+
+
+def fake_job(job: BatchJob, job_output_dir, memory_limit_mb, connection):
+    # the contract name tells the fake job how to behave
+    os.makedirs(job_output_dir, exist_ok=True)
+    open(os.path.join(job_output_dir, "started"), "a").write("x")
+    if job.target_contract_name == "Hang":
+        time.sleep(60)
+    elif job.target_contract_name == "Crash":
+        os._exit(3)
+    elif job.target_contract_name == "Fail":
+        connection.send(dict(status="failed", error="ValueError: bad"))
+    else:
+        connection.send(dict(status="ok", stage_timings=dict(taint_analysis=1.0, transform=2.0)))
+
+
+def test_load_manifest():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_manifest = os.path.join(tmp_dir, "jobs.json")
+        json.dump([dict(file="a.sol", contract="A", sensitive_vars=["x", "y"], solc_remaps="@a=b,@c=d"),
+                   dict(file="b.sol", contract="B", sensitive_vars="z", solc_version="0.8.20", mode="advanced")],
+                  open(json_manifest, "w"))
+        csv_manifest = os.path.join(tmp_dir, "jobs.csv")
+        open(csv_manifest, "w").write(
+            'file,contract,sensitive_vars,solc_version,solc_remaps,mode\na.sol,A,"x,y",,"@a=b,@c=d",\nb.sol,B,z,0.8.20,,advanced\n')
+
+        for manifest in [json_manifest, csv_manifest]:
+            jobs = load_manifest(manifest, default_solc_version="0.8.25")
+            assert [job.to_dict() for job in jobs] == [
+                dict(file="a.sol", contract="A", sensitive_vars="x,y", solc_version="0.8.25",
+                     solc_remaps=["@a=b", "@c=d"], mode="simple"),
+                dict(file="b.sol", contract="B", sensitive_vars="z", solc_version="0.8.20",
+                     solc_remaps=[], mode="advanced")]
+
+
+def test_batch_failures_and_resume():
+    jobs = [BatchJob("a.sol", name, "x") for name in ["A", "Hang", "Crash", "Fail", "B"]]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        summary = run_batch(jobs, tmp_dir, workers=3,
+                            timeout=1, target=fake_job)
+        statuses = [record["status"] for record in summary["records"]]
+        assert statuses == ["ok", "timeout", "crashed", "failed", "ok"]
+        assert summary["stage_totals"] == dict(taint_analysis=2.0, transform=4.0)
+
+        # only the jobs that did not succeed run again
+        summary = run_batch(jobs, tmp_dir, workers=3,
+                            timeout=1, target=fake_job)
+        started = [len(open(os.path.join(tmp_dir, job.job_id, "started")).read())
+                   for job in jobs]
+        assert started == [1, 2, 2, 2, 1]
+        assert len(load_progress(os.path.join(tmp_dir, PROGRESS_FILE))) == 5
+
+        # a batch killed in the middle of writing a record: the records appended
+        # by the next run are not glued to the cut line
+        progress_path = os.path.join(tmp_dir, PROGRESS_FILE)
+        lines = open(progress_path).readlines()
+        open(progress_path, "w").write("".join(lines[:-1]) + lines[-1][:20])
+        run_batch(jobs, tmp_dir, workers=3, timeout=1, target=fake_job)
+        records = [json.loads(line) for line in open(progress_path)]
+        assert len(records) == len(lines) - 1 + 3
+
+
+if __name__ == "__main__":
+    test_load_manifest()
+    test_batch_failures_and_resume()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+from src.framework.checkpoint import PartitionCheckpoint, get_config_hash, get_source_hash
+from src.framework.jsonl import truncate_partial_line
+from src.llmpartition import model_config
+
+
+def test_checkpoint_resume():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "A.partition.checkpoint.jsonl")
+        checkpoint = PartitionCheckpoint(path, "source-1", "config-1")
+        checkpoint.add("bid(uint256)", dict(target_func_name="bid", partitions={}))
+        checkpoint.add("withdraw()", dict(target_func_name="withdraw", partitions={}))
+        # a run killed in the middle of writing a record
+        open(path, "a").write('{"source_hash": "source-1", "con')
+
+        resumed = PartitionCheckpoint(path, "source-1", "config-1")
+        assert resumed.get("bid(uint256)")["target_func_name"] == "bid"
+        assert resumed.get("withdraw()") is not None
+        assert resumed.get("close()") is None
+
+        # the cut record is dropped, the next one starts on its own line
+        resumed.add("close()", dict(target_func_name="close", partitions={}))
+        assert open(path).read().endswith("}\n") and len(open(path).readlines()) == 3
+        resumed = PartitionCheckpoint(path, "source-1", "config-1")
+        assert sorted(resumed.results) == ["bid(uint256)", "close()", "withdraw()"]
+
+        # a changed source or configuration does not reuse anything
+        assert PartitionCheckpoint(path, "source-2", "config-1").results == dict()
+        assert PartitionCheckpoint(path, "source-1", "config-2").results == dict()
+
+
+def test_truncate_partial_line():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "progress.jsonl")
+        for content, expected in [("", ""), ("{}\n", "{}\n"), ('{"a"', ""),
+                                  ("{}\n" + "x" * 10000, "{}\n"), ("{}\n{}\n{", "{}\n{}\n")]:
+            open(path, "w").write(content)
+            truncate_partial_line(path)
+            assert open(path).read() == expected
+
+
+def test_hashes():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "A.sol")
+        open(file_path, "w").write("contract A {}")
+        source_hash = get_source_hash(file_path)
+        open(file_path, "w").write("contract A { uint x; }")
+        assert get_source_hash(file_path) != source_hash
+
+    config_hash = get_config_hash("A", ["x", "y"], "0.8.25", [], "simple")
+    assert config_hash == get_config_hash("A", ["y", "x"], "0.8.25", [], "simple")
+    assert config_hash != get_config_hash("A", ["x"], "0.8.25", [], "simple")
+    llm = model_config.LLM
+    model_config.LLM = "llama3.1"
+    try:
+        assert config_hash != get_config_hash("A", ["x", "y"], "0.8.25", [], "simple")
+    finally:
+        model_config.LLM = llm
+
+
+if __name__ == "__main__":
+    test_checkpoint_resume()
+    test_truncate_partial_line()
+    test_hashes()
@@ -0,0 +1,57 @@
+import io
+import contextlib
+from src.framework.dependency import CONTROL_DEP, DATA_DEP, CompactPDG, SingletonAPINodeFactory
+
+
+class FakeNode(object):
+    # hashable by identity, like slither's Node
+    def __init__(self, expression):
+        self.expression = expression
+
+
+def test_shared_graph_views():
+    a, b, c, d = [FakeNode(name) for name in "abcd"]
+    graph = CompactPDG()
+    data = SingletonAPINodeFactory(graph, DATA_DEP)
+    control = SingletonAPINodeFactory(graph, CONTROL_DEP)
+
+    data_a, data_b, data_c = [data.create_or_get_node(node, dependency_type="DataDep") for node in [a, b, c]]
+    control_c, control_a = control.create_or_get_node(c), control.create_or_get_node(a)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_a.add_son(data_c)
+        data_a.add_son(data_b)
+        data_b.add_son(data_c)
+        control_c.add_son(control_a)
+
+    # one node table for both PDGs, one view per node and PDG
+    assert graph.nodes == [a, b, c] and len(graph.edge_kinds) == 4
+    assert data.create_or_get_node(a) is data_a and data.get_node(a) is data_a
+    assert [apinode.node for apinode in data.apinodes] == [a, b, c]
+    assert [apinode.node for apinode in control.apinodes] == [c, a]
+    assert a in data and a in control and b not in control and d not in data
+
+    # edges keep their insertion order and stay within their PDG
+    assert data_a.sons == [data_c, data_b] and data_c.fathers == {data_a, data_b}
+    assert control_c.sons == [control_a] and control_a.fathers == {control_c}
+    assert data_c.sons == [] and control_a.sons == []
+    assert data_a.dependency_type == "DataDep" and control_a.dependency_type == "ControlDep"
+    assert graph.successor_nodes(c, CONTROL_DEP) == [a] and graph.successor_nodes(d, DATA_DEP) == []
+
+    # nodes and edges added after a query are seen by the next one
+    data_d = data.create_or_get_node(d)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_c.add_son(data_d)
+    assert data_c.sons == [data_d] and data_d.fathers == {data_c}
+    assert graph.edge_count(DATA_DEP) == 4 and graph.edge_count(CONTROL_DEP) == 1
+
+
+def test_slots():
+    graph = CompactPDG()
+    apinode = SingletonAPINodeFactory(graph, DATA_DEP).create_or_get_node(FakeNode("a"))
+    for obj in [graph, apinode]:
+        assert not hasattr(obj, "__dict__")
+
+
+if __name__ == "__main__":
+    test_shared_graph_views()
+    test_slots()
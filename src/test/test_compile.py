@@ -1,4 +1,7 @@
-from src.framework.compile import Compilation, ContractWrapper
+import os
+import tempfile
+import src.framework.compile as compile_module
+from src.framework.compile import Compilation, ContractWrapper, evict_cache, get_compilation_key, get_source_hashes, write_cached_source
 
 
 def compile():
@@ -22,5 +25,57 @@ def compile():
     return wrapper
 
 
+def test_compilation_key():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for directory in ["a", "b", "a/lib", "b/lib", "remapped"]:
+            os.makedirs(os.path.join(tmp_dir, directory))
+        sources = {"main.sol": 'import "./lib/Lib.sol";\nimport {X} from "@x/X.sol";\ncontract Main {}',
+                   "lib/Lib.sol": 'import * as Up from "../Up.sol";\nlibrary Lib {}', "Up.sol": "contract Up {}"}
+        for directory in ["a", "b"]:
+            for name, content in sources.items():
+                open(os.path.join(tmp_dir, directory, name), "w").write(content)
+        open(os.path.join(tmp_dir, "remapped", "X.sol"), "w").write("contract X {}")
+        remaps = "@x={0}/remapped".format(tmp_dir)
+
+        first = get_source_hashes(os.path.join(tmp_dir, "a", "main.sol"), remaps)
+        assert list(first) == [os.path.join(tmp_dir, *path) for path in [
+            ["a", "main.sol"], ["a", "lib", "Lib.sol"], ["a", "Up.sol"], ["remapped", "X.sol"]]]
+        # the same sources elsewhere give the same key
+        second = get_source_hashes(os.path.join(tmp_dir, "b", "main.sol"), remaps)
+        key = get_compilation_key(first, remaps, "0.8.25")
+        assert get_compilation_key(second, remaps, "0.8.25") == key
+        assert get_compilation_key(first, remaps, "0.8.24") != key
+        # so does an imported file, directly or not
+        open(os.path.join(tmp_dir, "b", "Up.sol"), "w").write("contract Up { }")
+        second = get_source_hashes(os.path.join(tmp_dir, "b", "main.sol"), remaps)
+        assert get_compilation_key(second, remaps, "0.8.25") != key
+        os.remove(os.path.join(tmp_dir, "remapped", "X.sol"))
+        assert get_source_hashes(os.path.join(tmp_dir, "a", "main.sol"), remaps)[
+            os.path.join(tmp_dir, "remapped", "X.sol")] is None
+
+
+def test_evict_cache():
+    cache_dir = compile_module.COMPILATION_CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        compile_module.COMPILATION_CACHE_DIR = tmp_dir
+        try:
+            for i in range(4):
+                file_path = os.path.join(tmp_dir, "{0}_export.json".format(i))
+                open(file_path, "w").write("x" * 100)
+                os.utime(file_path, (1000 + i, 1000 + i))
+            # a hit refreshes the entry
+            os.utime(os.path.join(tmp_dir, "0_export.json"), (2000, 2000))
+            source_file = write_cached_source("x" * 100)
+            assert write_cached_source("x" * 100) == source_file
+            assert os.path.dirname(source_file) == os.path.join(tmp_dir, "sources")
+            evict_cache(max_size=250)
+            assert sorted(os.listdir(tmp_dir)) == ["0_export.json", "sources"]
+            assert os.listdir(os.path.join(tmp_dir, "sources")) == [os.path.basename(source_file)]
+        finally:
+            compile_module.COMPILATION_CACHE_DIR = cache_dir
+
+
 if __name__ == "__main__":
     compile()
+    test_compilation_key()
+    test_evict_cache()
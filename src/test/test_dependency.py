@@ -1,4 +1,6 @@
+from slither.core.cfg.node import recheable
 from src.framework.dependency import ProgramDependency
+from src.framework.reachability import ReachabilityIndex
 from src.extractor.benchmark_compile import compile
 
 
@@ -9,5 +11,13 @@ def generate_dependency():
     return pdg
 
 
+def test_reachability_index():
+    wrapper = compile()
+    for function in wrapper.get_functions():
+        index = ReachabilityIndex.from_function(function)
+        for node in function.nodes:
+            assert index.reachable_from(node) == recheable(node)
+
+
 if __name__ == "__main__":
     generate_dependency()
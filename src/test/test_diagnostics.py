@@ -0,0 +1,111 @@
+import json
+from src.llmpartition.diagnostics import count_tokens, get_fix_context, parse_contracts
+
+CODE = """contract Vault {
+    // a } in a comment
+    mapping(address => uint256) balances;
+    uint256 total = 0;
+    string name = "vault }";
+    event Deposit(address who, uint256 amount);
+
+    modifier positive(uint256 amount) { require(amount > 0); _; }
+
+    function deposit(uint256 amount) public positive(amount) {
+        balances[msg.sender] += amount
+        total += amount;
+        emit Deposit(msg.sender, amount);
+    }
+
+    function withdraw() public {
+        balances[msg.sender] = 0;
+    }
+}
+"""
+DEPS = "library Math { function add(uint256 a, uint256 b) internal pure returns (uint256) { return a + b; } }"
+
+
+def get_sources(code):
+    # the candidate and its dependencies in two units importing each other, as code_gen compiles them
+    return {"candidate.sol": 'import "deps.sol"; ' + code, "deps.sol": 'import "candidate.sol";\n' + DEPS}
+
+
+def error_at(sources, needle, source_name="candidate.sol"):
+    source = sources[source_name]
+    start = len(source[:source.index(needle)].encode("utf8"))
+    return dict(severity="error", type="ParserError", message="Expected ';'",
+                formattedMessage="ParserError: Expected ';' but got identifier",
+                sourceLocation=dict(file=source_name, start=start, end=start + 1))
+
+
+def test_parse_members():
+    contracts = parse_contracts(CODE)
+    assert [contract.name for contract in contracts] == ["Vault"]
+    members = contracts[0].members
+    assert [(member.kind, member.name) for member in members] == [
+        ("variable", "balances"), ("variable", "total"), ("variable", "name"), ("event", "Deposit"),
+        ("modifier", "positive"), ("function", "deposit"), ("function", "withdraw")]
+
+
+def test_fix_context_and_splice():
+    errors = [error_at(get_sources(CODE), "total += amount")]
+    context = get_fix_context(CODE, get_sources(CODE), "candidate.sol", errors)
+    assert context.code.startswith("function deposit") and context.code.endswith("}")
+    assert [member.name for member in context.declarations] == [
+        "balances", "total", "Deposit", "positive"]
+    declarations = context.get_declarations_code()
+    assert "modifier positive(uint256 amount) { ... }" in declarations
+    assert "withdraw" not in declarations
+
+    fixed = context.code.replace("+= amount\n", "+= amount;\n", 1)
+    assert context.splice(fixed) == CODE.replace(
+        "+= amount\n", "+= amount;\n", 1)
+    assert count_tokens(context.code) < count_tokens(CODE)
+
+
+def test_is_replacement():
+    errors = [error_at(get_sources(CODE), "total += amount")]
+    context = get_fix_context(CODE, get_sources(CODE), "candidate.sol", errors)
+    fixed = context.code.replace("+= amount\n", "+= amount;\n", 1)
+    assert context.is_replacement(fixed)
+    assert context.is_replacement("\n" + fixed + "\n")
+    # the whole contract, another member, an extra member, a cut reply
+    assert not context.is_replacement(CODE)
+    assert not context.is_replacement(fixed.replace("function deposit", "function deposit2"))
+    assert not context.is_replacement(fixed.replace("function deposit", "modifier deposit"))
+    assert not context.is_replacement(fixed + "\n    function withdraw() public {}")
+    assert not context.is_replacement(fixed[:-1])
+    assert not context.is_replacement("")
+
+
+def test_fallback_to_whole_contract():
+    # errors in two members, in the dependencies, in another file, or without a location
+    sources = get_sources(CODE)
+    errors = [error_at(sources, "total += amount"), error_at(sources, "= 0;\n    }")]
+    assert get_fix_context(CODE, sources, "candidate.sol", errors) is None
+    assert get_fix_context(CODE, sources, "candidate.sol",
+                           [error_at(sources, "return a + b", "deps.sol")]) is None
+    other = dict(sources, **{"other.sol": CODE})
+    assert get_fix_context(CODE, other, "candidate.sol",
+                           [error_at(other, "total", "other.sol")]) is None
+    assert get_fix_context(CODE, sources, "candidate.sol",
+                           [dict(severity="error", message="stack too deep")]) is None
+    assert get_fix_context(CODE[:-3], get_sources(CODE[:-3]), "candidate.sol",
+                           [error_at(sources, "total += amount")]) is None
+
+
+def test_benchmark_partitions_parse():
+    benchmark = json.load(open("src/partition_benchmark.json"))
+    for items in benchmark.values():
+        for item in items:
+            contracts = parse_contracts(item["partition"])
+            assert contracts is not None and len(contracts) > 0
+            names = [member.name for contract in contracts for member in contract.members]
+            assert item["target_func_name"] in names
+
+
+if __name__ == "__main__":
+    test_parse_members()
+    test_fix_context_and_splice()
+    test_is_replacement()
+    test_fallback_to_whole_contract()
+    test_benchmark_partitions_parse()
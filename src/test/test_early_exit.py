@@ -0,0 +1,61 @@
+import asyncio
+from src.linear_regression.scoring import predict_score
+from src.llmpartition.early_exit import EarlyExitRule, get_search_stats
+from src.llmpartition.llm_client import gather_candidates
+
+
+def candidate(normalized_distance, global_ratio=0.0, local_ratio=0.0):
+    return "code", normalized_distance, global_ratio, local_ratio, 0
+
+
+def run_search(scores, rule, concurrency=1):
+    started = []
+
+    async def generate(gen_round):
+        started.append(gen_round)
+        return scores[gen_round - 1]
+
+    results = asyncio.run(gather_candidates(generate, len(scores), concurrency,
+                                            should_stop=rule.should_stop, on_result=rule.update))
+    return started, results
+
+
+def test_predict_score():
+    assert predict_score(1, 0, 0) == 0.59421478
+    assert predict_score(0.5, None, 0.1) is None
+
+
+def test_threshold_exit():
+    rule = EarlyExitRule(threshold=0.5, top_k=3, patience=0)
+    scores = [candidate(0.1), None, candidate(0.9), candidate(1.0)]
+    started, results = run_search(scores, rule)
+    assert started == [1, 2, 3]
+    assert results == scores[:3] + [None]
+    assert rule.stop_reason.startswith("candidate#3")
+
+    stats = get_search_stats(rule, len(scores), {1: 2, 2: 4, 3: 3})
+    assert stats["candidates_skipped"] == 1
+    assert stats["estimated_llm_calls_saved"] == 3
+
+
+def test_stable_top_k_exit():
+    rule = EarlyExitRule(threshold=None, top_k=2, patience=2)
+    scores = [candidate(0.9), candidate(0.8), candidate(0.1),
+              candidate(0.2), candidate(0.95)]
+    started, results = run_search(scores, rule)
+    assert started == [1, 2, 3, 4]
+    assert rule.top == [1, 2]
+
+
+def test_full_search():
+    rule = EarlyExitRule(threshold=2.0, top_k=3, patience=0)
+    scores = [candidate(0.1) for _ in range(4)]
+    started, results = run_search(scores, rule, concurrency=4)
+    assert started == [1, 2, 3, 4] and not rule.should_stop()
+
+
+if __name__ == "__main__":
+    test_predict_score()
+    test_threshold_exit()
+    test_stable_top_k_exit()
+    test_full_search()
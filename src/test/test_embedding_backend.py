@@ -0,0 +1,56 @@
+import os
+import tempfile
+import numpy as np
+from src.vector_db import embedding_backend
+from src.vector_db.embedding_backend import EmbeddingCache, HashingEmbeddingBackend, embed_texts
+
+
+class CountingBackend(object):
+    name = "counting"
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_batch(self, texts):
+        self.batches.append(list(texts))
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_batches_and_cache():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        embedding_backend._cache = EmbeddingCache(
+            os.path.join(tmp_dir, "embeddings.sqlite"))
+        try:
+            backend = CountingBackend()
+            texts = ["a", "bb", "a", "ccc", "dddd", "bb"]
+            vectors = embed_texts(texts, backend, batch_size=2)
+            assert vectors.tolist() == [[len(text), 1.0] for text in texts]
+            # duplicates are embedded once, two texts per request
+            assert backend.batches == [["a", "bb"], ["ccc", "dddd"]]
+
+            vectors = embed_texts(["dddd", "eeeee", "a"], backend, batch_size=2)
+            assert vectors[:, 0].tolist() == [4, 5, 1]
+            assert backend.batches[2:] == [["eeeee"]]
+            assert len(embedding_backend._cache) == 5
+
+            embedding_backend.EMBEDDING_CACHE_ENABLED = False
+            embed_texts(["a"], backend)
+            assert backend.batches[3:] == [["a"]]
+        finally:
+            embedding_backend.EMBEDDING_CACHE_ENABLED = True
+            embedding_backend._cache = None
+
+
+def test_hashing_backend():
+    backend = HashingEmbeddingBackend()
+    withdraw = "function withdraw(uint256 amount) public { balances[msg.sender] -= amount; }"
+    vectors = backend.embed_batch([withdraw, withdraw.replace("amount", "value"), "contract A { event E(); }"])
+    assert vectors.shape == (3, embedding_backend.HASHING_DIMENSION)
+    assert np.allclose(vectors[0], backend.embed_batch([withdraw])[0])
+    similarities = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)) @ (vectors[0] / np.linalg.norm(vectors[0]))
+    assert similarities[1] > similarities[2]
+
+
+if __name__ == "__main__":
+    test_batches_and_cache()
+    test_hashing_backend()
@@ -0,0 +1,134 @@
+import os
+import json
+import shutil
+import pickle
+import tempfile
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from src.vector_db.embedding_store import EMBEDDINGS_PKL, PICKLE_BACKEND, EmbeddingStore, find_elbow_points, get_store, top_k_indices
+
+
+def test_matches_sklearn():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pkl_path = os.path.join(tmp_dir, "embeddings.pkl")
+        shutil.copy(EMBEDDINGS_PKL, pkl_path)
+        embeddings, metadata_list = pickle.load(open(pkl_path, "rb"))
+        store = EmbeddingStore.load(pkl_path)
+        assert isinstance(store.matrix, np.memmap)
+        assert store.matrix.dtype == np.float32 and store.metadata_list == metadata_list
+        assert store.ids == list(embeddings.keys())
+
+        all_embeddings = list(embeddings.values())
+        queries = np.array(all_embeddings[:4]) + 0.01
+        for query in queries:
+            expected = cosine_similarity([query], all_embeddings)[0]
+            assert np.allclose(store.similarities(query), expected, atol=1e-5)
+            indices, scores = store.top_k(query, 5)
+            assert list(indices) == list(np.argsort(expected)[::-1][:5])
+            assert np.allclose(scores, expected[indices], atol=1e-5)
+
+        batch_indices, batch_scores = store.top_k_batch(queries, 5)
+        for query, indices, scores in zip(queries, batch_indices, batch_scores):
+            assert list(indices) == list(store.top_k(query, 5)[0])
+            assert np.allclose(scores, store.top_k(query, 5)[1])
+
+
+def test_zero_vectors_and_rebuild():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pkl_path = os.path.join(tmp_dir, "embeddings.pkl")
+        embeddings = {"a": [1.0, 0.0], "b": [0.0, 0.0], "c": [1.0, 1.0]}
+        pickle.dump((embeddings, [dict(id=key) for key in embeddings]), open(pkl_path, "wb"))
+        store = EmbeddingStore.load(pkl_path)
+        # like sklearn, a zero vector has similarity 0 with everything
+        assert np.allclose(store.similarities([2.0, 0.0]), cosine_similarity([[2.0, 0.0]], list(embeddings.values()))[0])
+        assert np.allclose(store.similarities([0.0, 0.0]), 0)
+        assert list(store.top_k([1.0, 0.0], 10)[0]) == [0, 2, 1]
+
+        # a newer pickle rebuilds the matrix
+        embeddings["d"] = [0.0, 1.0]
+        pickle.dump((embeddings, [dict(id=key) for key in embeddings]), open(pkl_path, "wb"))
+        matrix_path = EmbeddingStore.get_paths(pkl_path)[0]
+        os.utime(pkl_path, (os.path.getmtime(matrix_path) + 1,) * 2)
+        assert len(EmbeddingStore.load(pkl_path)) == 4
+
+
+def test_backend():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pkl_path = os.path.join(tmp_dir, "embeddings.pkl")
+        embeddings = {"a": [1.0, 0.0], "b": [0.0, 1.0]}
+        pickle.dump((embeddings, [dict(id=key) for key in embeddings], "hashing:2"), open(pkl_path, "wb"))
+        store = EmbeddingStore.load(pkl_path)
+        assert store.backend == "hashing:2"
+        assert EmbeddingStore.load(pkl_path).backend == "hashing:2"
+        store.check_backend("hashing:2")
+        try:
+            store.check_backend(PICKLE_BACKEND)
+            assert False, "OpenAI queries against hashing vectors"
+        except ValueError:
+            pass
+
+        # a pickle without a backend predates it and holds OpenAI vectors; a matrix built from a
+        # pickle before the backend was recorded is built again
+        pickle.dump((embeddings, [dict(id=key) for key in embeddings]), open(pkl_path, "wb"))
+        matrix_path, meta_path = EmbeddingStore.get_paths(pkl_path)
+        json.dump(dict(ids=list(embeddings), metadata=[dict(id=key) for key in embeddings]), open(meta_path, "w"))
+        os.utime(matrix_path, (os.path.getmtime(pkl_path) + 1,) * 2)
+        store = EmbeddingStore.load(pkl_path)
+        assert store.backend == PICKLE_BACKEND
+        assert json.load(open(meta_path))["backend"] == PICKLE_BACKEND
+        try:
+            store.check_backend("hashing:2")
+            assert False, "hashing queries against OpenAI vectors"
+        except ValueError:
+            pass
+        # a store built in memory does not know its backend
+        EmbeddingStore.from_embeddings(embeddings, []).check_backend("hashing:2")
+
+
+def test_top_k_indices():
+    similarities = np.array([[0.1, 0.9, 0.5, 0.9], [0.3, 0.2, 0.1, 0.0]])
+    assert top_k_indices(similarities, 2).tolist() == [[1, 3], [0, 1]]
+    assert top_k_indices(similarities[1], 10).tolist() == [0, 1, 2, 3]
+    assert top_k_indices(similarities[1], 0).tolist() == []
+
+
+def test_shared_store():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pkl_path = os.path.join(tmp_dir, "embeddings.pkl")
+        shutil.copy(EMBEDDINGS_PKL, pkl_path)
+        store = get_store(pkl_path)
+        # loaded once per process, whichever path spelling is used
+        assert get_store(os.path.join(tmp_dir, ".", "embeddings.pkl")) is store
+        assert not store.matrix.flags.writeable
+
+
+def loop_elbow_point(similarities, m):
+    # the original point by point implementation
+    m = max(0, min(m, len(similarities) - 1))
+    points = [(i, s) for i, s in enumerate(similarities[m:])]
+    p1, pn = points[0], points[-1]
+    with np.errstate(invalid="ignore"):
+        distances = np.array([np.abs((pn[1] - p1[1]) * p[0] - (pn[0] - p1[0]) * p[1] + pn[0] * p1[1] - pn[1] * p1[0]) / np.sqrt(
+            (pn[1] - p1[1]) ** 2 + (pn[0] - p1[0]) ** 2) for p in points])
+    return np.argmax(distances) + 1
+
+
+def test_find_elbow_points():
+    random = np.random.default_rng(0)
+    similarities = -np.sort(-random.random((20, 50)) ** 3, axis=1)
+    for m in [0, 3, 49, 100]:
+        expected = [loop_elbow_point(row, m) for row in similarities]
+        assert find_elbow_points(similarities, m).tolist() == expected
+        assert [find_elbow_points(row, m) for row in similarities] == expected
+    assert find_elbow_points([0.9], 0) == 1
+    assert find_elbow_points([0.5, 0.5, 0.5], 0) == 1
+    assert find_elbow_points(np.zeros((2, 0)), 0).tolist() == [0, 0]
+
+
+if __name__ == "__main__":
+    test_matches_sklearn()
+    test_zero_vectors_and_rebuild()
+    test_backend()
+    test_top_k_indices()
+    test_shared_store()
+    test_find_elbow_points()
@@ -0,0 +1,66 @@
+import os
+import time
+import tempfile
+from src.llmpartition import llm_cache
+from src.llmpartition.llm_cache import LLMResponseCache, get_cache_key
+
+
+def test_cache_key():
+    messages = [{"role": "user", "content": "prompt"}]
+    key = get_cache_key("gpt-4o-mini", messages, {}, 1)
+    assert key == get_cache_key("gpt-4o-mini", list(messages), {}, 1)
+    assert key != get_cache_key("gpt-4o-mini", messages, {}, 2)
+    assert key != get_cache_key("llama3.1", messages, {}, 1)
+    assert key != get_cache_key("gpt-4o-mini", messages, {"temperature": 0}, 1)
+
+
+def test_hits_ttl_and_eviction():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = LLMResponseCache(path=os.path.join(
+            tmp_dir, "llm.sqlite"), max_entries=2)
+        assert cache.get("a") is None
+        cache.put("a", "model", "response a")
+        assert cache.get("a") == "response a"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        cache.put("b", "model", "response b")
+        time.sleep(0.01)
+        cache.get("a")
+        cache.put("c", "model", "response c")
+        # b is the least recently used entry
+        assert len(cache) == 2 and cache.get("b") is None
+
+        cache.ttl = 0.05
+        time.sleep(0.1)
+        assert cache.get("a") is None and cache.get("c") is None
+
+
+def test_cached_completion_and_bypass():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        llm_cache._cache = LLMResponseCache(
+            path=os.path.join(tmp_dir, "llm.sqlite"))
+        calls = []
+
+        def request():
+            calls.append(1)
+            return "answer {0}".format(len(calls))
+
+        messages = [{"role": "user", "content": "prompt"}]
+        assert llm_cache.cached_completion(
+            "model", messages, {}, 0, request) == "answer 1"
+        assert llm_cache.cached_completion(
+            "model", messages, {}, 0, request) == "answer 1"
+        llm_cache.LLM_CACHE_ENABLED = False
+        try:
+            assert llm_cache.cached_completion(
+                "model", messages, {}, 0, request) == "answer 2"
+        finally:
+            llm_cache.LLM_CACHE_ENABLED = True
+        assert llm_cache.summary() == "LLM cache: 1 hits, 1 misses"
+        llm_cache._cache = None
+
+
+if __name__ == "__main__":
+    test_cache_key()
+    test_hits_ttl_and_eviction()
+    test_cached_completion_and_bypass()
@@ -0,0 +1,163 @@
+import os
+import tempfile
+import numpy as np
+from src.vector_db import embedding_backend, segment_store, vector_processor
+from src.vector_db.segment_store import SegmentedEmbeddingStore
+
+
+class FlakyBackend(object):
+    name = "flaky"
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.embedded = []
+
+    def embed_batch(self, texts):
+        if self.failures > 0:
+            self.failures -= 1
+            raise Exception("rate limited")
+        self.embedded.extend(texts)
+        return np.array([[len(text), text.count("a") + 1.0] for text in texts], dtype=np.float32)
+
+
+def make_benchmarks(functions):
+    return {contract: [dict(original=[original], partition=[partition]) for original, partition in partitions]
+            for contract, partitions in functions.items()}
+
+
+def test_incremental_updates():
+    backend = FlakyBackend()
+    embedding_backend.BACKENDS["flaky"] = lambda: backend
+    embedding_backend.EMBEDDING_BACKEND = "flaky"
+    embedding_backend.EMBEDDING_CACHE_ENABLED = False
+    vector_processor.RETRY_DELAY = 0
+    # compacted explicitly below
+    segment_store.COMPACTION_MAX_DEAD_RATIO = 1.0
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = SegmentedEmbeddingStore(tmp_dir)
+            benchmarks = make_benchmarks(
+                dict(A=[("a1", "p1"), ("a22", "p2")], B=[("b333", "p3")], Test=[("t", "t")]))
+            vector_processor.update_segment_store(benchmarks, ["Test"], store)
+            assert store.ids == ["A-0", "A-1", "B-0"] and backend.embedded == ["a1", "a22", "b333"]
+            first_segment = open(os.path.join(tmp_dir, "segment-00000.npy"), "rb").read()
+
+            # a changed partition, a new function and a removed one, the first try fails
+            backend.embedded, backend.failures = [], 1
+            benchmarks = make_benchmarks(
+                dict(A=[("a1", "p1 changed"), ("a22", "p2"), ("a4444", "p4")]))
+            vector_processor.update_segment_store(benchmarks, [], store)
+            assert backend.embedded == ["a1", "a4444"]
+            assert len(store.segments) == 2
+            assert open(os.path.join(tmp_dir, "segment-00000.npy"), "rb").read() == first_segment
+            assert sorted(store.ids) == ["A-0", "A-1", "A-2"]
+            assert store.metadata_list[store.ids.index("A-0")]["Partition"] == "p1 changed"
+
+            # a batch that keeps failing is not stored and embedded by the next run
+            backend.embedded, backend.failures = [], vector_processor.EMBEDDING_RETRIES
+            benchmarks["A"].append(dict(original=["a55555"], partition=["p5"]))
+            vector_processor.update_segment_store(benchmarks, [], store)
+            assert len(store) == 3 and len(store.segments) == 2
+            vector_processor.update_segment_store(benchmarks, [], store)
+            assert backend.embedded == ["a55555"] and len(store) == 4
+
+            query = [5.0, 2.0]
+            before = dict(zip(store.ids, store.similarities(query)))
+            reloaded = SegmentedEmbeddingStore(tmp_dir)
+            assert dict(zip(reloaded.ids, reloaded.similarities(query))) == before
+
+            store.compact()
+            assert len(store.segments) == 1 and not os.path.exists(
+                os.path.join(tmp_dir, "segment-00000.npy"))
+            after = dict(zip(store.ids, store.similarities(query)))
+            assert after.keys() == before.keys()
+            assert all(np.isclose(after[row_id], before[row_id]) for row_id in before)
+            indices, scores = store.top_k_batch([query, [1.0, 0.0]], 2)
+            assert indices[0].tolist() == store.top_k(query, 2)[0].tolist()
+    finally:
+        embedding_backend.BACKENDS.pop("flaky")
+        embedding_backend._backends.pop("flaky", None)
+        embedding_backend.EMBEDDING_BACKEND = "openai"
+        embedding_backend.EMBEDDING_CACHE_ENABLED = True
+        segment_store.COMPACTION_MAX_DEAD_RATIO = 0.3
+
+
+def test_needs_compaction():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = SegmentedEmbeddingStore(tmp_dir)
+        for i in range(segment_store.COMPACTION_MAX_SEGMENTS):
+            store.append(["f{0}".format(i)], [[1.0, float(i)]], [dict()], ["h"], "fake")
+        assert not store.needs_compaction()
+        store.append(["f0"], [[0.0, 1.0]], [dict()], ["h2"], "fake")
+        assert store.needs_compaction() and len(store) == segment_store.COMPACTION_MAX_SEGMENTS
+        store.compact()
+        assert not store.needs_compaction() and store.hashes["f0"] == "h2"
+
+
+
+class WideBackend(FlakyBackend):
+    # another model: other vectors, of another size
+    name = "wide"
+
+    def embed_batch(self, texts):
+        return np.concatenate([super().embed_batch(texts), np.ones((len(texts), 1), dtype=np.float32)], axis=1)
+
+
+def test_backend_change():
+    flaky, wide = FlakyBackend(), WideBackend()
+    embedding_backend.BACKENDS.update(flaky=lambda: flaky, wide=lambda: wide)
+    embedding_backend.EMBEDDING_CACHE_ENABLED = False
+    vector_processor.RETRY_DELAY = 0
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = SegmentedEmbeddingStore(tmp_dir)
+            benchmarks = make_benchmarks(dict(A=[("a1", "p1"), ("a22", "p2")], B=[("b333", "p3")]))
+            embedding_backend.EMBEDDING_BACKEND = "flaky"
+            vector_processor.update_segment_store(benchmarks, [], store)
+            benchmarks["B"].append(dict(original=["b4"], partition=["p4"]))
+            vector_processor.update_segment_store(benchmarks, [], store)
+            assert store.backend == "flaky" and len(store.segments) == 2
+
+            # rows of another backend are never appended next to the existing ones
+            try:
+                store.append(["C-0"], [[1.0, 2.0, 3.0]], [dict()], ["h"], "wide")
+                assert False, "appended wide embeddings to a flaky store"
+            except ValueError:
+                pass
+
+            # a backend that fails on some rows leaves the store as it is
+            embedding_backend.EMBEDDING_BACKEND = "wide"
+            wide.failures = vector_processor.EMBEDDING_RETRIES
+            try:
+                vector_processor.update_segment_store(benchmarks, [], store)
+                assert False, "replaced the store with a partial one"
+            except RuntimeError:
+                pass
+            assert store.backend == "flaky" and len(SegmentedEmbeddingStore(tmp_dir)) == 4
+
+            # the next run embeds everything again into a single segment
+            vector_processor.update_segment_store(benchmarks, [], store)
+            assert sorted(wide.embedded) == ["a1", "a22", "b333", "b4"]
+            assert store.backend == "wide" and len(store.segments) == 1 and store.matrix.shape == (4, 3)
+            assert sorted(os.listdir(tmp_dir)) == ["manifest.json", "segment-00002.json", "segment-00002.npy"]
+            assert len(store.similarities([1.0, 2.0, 3.0])) == 4
+
+            # queries embedded by another backend are refused
+            store.check_backend("wide")
+            try:
+                store.check_backend("flaky")
+                assert False, "queried a wide store with flaky embeddings"
+            except ValueError:
+                pass
+    finally:
+        for name in ["flaky", "wide"]:
+            embedding_backend.BACKENDS.pop(name)
+            embedding_backend._backends.pop(name, None)
+        embedding_backend.EMBEDDING_BACKEND = "openai"
+        embedding_backend.EMBEDDING_CACHE_ENABLED = True
+
+
+if __name__ == "__main__":
+    test_incremental_updates()
+    test_needs_compaction()
+    test_backend_change()
@@ -1,4 +1,7 @@
 import os
+import tempfile
+from src.framework import slicer as slicer_module
+from src.framework.checkpoint import PartitionCheckpoint
 from src.framework.slicer import Slicer
 from src.framework.taint_tracking import TaintTrack
 from src.test.test_dependency import generate_dependency
@@ -28,5 +31,32 @@ def test_slice():
     os.system(cmd.format("public.sol"))
 
 
+def test_failed_transform_job():
+    def fake_transform(func_name):
+        if func_name == "bid":
+            raise RuntimeError("LLM request failed")
+        return dict(target_func_name=func_name, partitions={})
+
+    transform, workers = slicer_module.transform, slicer_module.TRANSFORM_WORKERS
+    slicer_module.transform, slicer_module.TRANSFORM_WORKERS = fake_transform, 2
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "A.partition.checkpoint.jsonl")
+        # only the checkpoint is needed to run the jobs
+        slicer = Slicer.__new__(Slicer)
+        slicer.checkpoint = PartitionCheckpoint(path, "source-1", "config-1")
+        jobs = [(name, dict(func_name=name)) for name in ["withdraw", "bid", "close", "claim"]]
+        try:
+            slicer.run_transform_jobs(jobs)
+            assert False, "the failure of bid is raised"
+        except RuntimeError:
+            pass
+        finally:
+            slicer_module.transform, slicer_module.TRANSFORM_WORKERS = transform, workers
+        # the functions completed besides the failing one are kept for the next run
+        resumed = PartitionCheckpoint(path, "source-1", "config-1")
+        assert sorted(resumed.results) == ["claim", "close", "withdraw"]
+
+
 if __name__ == "__main__":
     test_slice()
+    test_failed_transform_job()
@@ -0,0 +1,73 @@
+from typing import List
+from slither.core.cfg.node import Node, NodeType, recheable
+from src.framework.compile import Compilation, ContractWrapper
+from src.framework.dependency import ProgramDependency
+from src.framework.slicer import Slicer
+from src.framework.taint_tracking import TaintTrack
+
+benchmark_dir = "examples/benchmark/curated/manual_partitions"
+solc_remaps = "@openzeppelin=examples/benchmark/curated/raw/node_modules/@openzeppelin"
+solc_version = "0.8.25"
+benchmark_contracts = ["AuctionInstance", "BlindAuction", "EncryptedERC20"]
+
+
+def legacy_expand_slice(pdg: ProgramDependency, function, nodes_slice: List[Node]):
+    # the recursive any()-over-sinks traversal the worklist slicer replaces
+    def traverse_cfg_forward(node: Node, visited=None):
+        if visited is None:
+            visited = set()
+        if node is None or node in visited:
+            return
+        visited.add(node)
+        if node in nodes_slice:
+            pass
+        elif any([node in recheable(sink_node) and pdg.forward_propagation(sink_node, node) for sink_node in nodes_slice]):
+            nodes_slice.append(node)
+        elif node.type in [NodeType.ENDIF, NodeType.ENDLOOP]:
+            nodes_slice.append(node)
+        for son in node.sons:
+            traverse_cfg_forward(son, visited)
+
+    def traverse_cfg_backward(node: Node, visited=None):
+        if visited is None:
+            visited = set()
+        if node is None or node in visited:
+            return
+        visited.add(node)
+        if node in nodes_slice:
+            pass
+        elif any([sink_node in recheable(node) and pdg.backward_propagation(sink_node, node) for sink_node in nodes_slice]):
+            nodes_slice.append(node)
+        for son in node.sons:
+            traverse_cfg_backward(son, visited)
+
+    traverse_cfg_forward(function.entry_point)
+    traverse_cfg_backward(function.entry_point)
+    return nodes_slice
+
+
+def test_slice_equivalence():
+    for contract_name in benchmark_contracts:
+        instance = Compilation(contract_file="{0}/{1}/original/{1}.sol".format(benchmark_dir, contract_name),
+                               solc_remaps=solc_remaps, solc_version=solc_version)
+        wrapper = ContractWrapper(
+            target_contract_name=contract_name, compilation=instance)
+        pdg = ProgramDependency(contract=wrapper)
+        pdg.generate_dependencies()
+
+        for state_var in wrapper.get_all_state_variables():
+            tainter = TaintTrack(pdg, set([state_var]))
+            tainter.compute()
+            slicer = Slicer(tainter=tainter, pdg=pdg)
+            for function in set(apinode.node.function for apinode in tainter.get_taint_sources().union(tainter.get_taint_sinks())):
+                seeds = [apinode.node for apinode in tainter.get_taint_sink_source_node_for_func(function)
+                         if apinode.node.function == function]
+                order = slicer.cfg_preorder(function.entry_point)
+                expected = legacy_expand_slice(pdg, function, list(seeds))
+                actual = slicer.expand_slice(function, list(seeds), order)
+                assert set(expected) == set(actual), "{0}.{1} sliced on {2}".format(
+                    contract_name, function.name, state_var.name)
+
+
+if __name__ == "__main__":
+    test_slice_equivalence()
@@ -0,0 +1,200 @@
+import io
+import os
+import json
+import hashlib
+import stat
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from src.framework import solc_pool
+from src.framework.solc_pool import SolcPool, get_errors, source_hash
+
+# stands in for solc-js' wrapper: reports an error for every source containing "broken",
+# and the version of the soljson build it wraps
+FAKE_WRAPPER = """
+module.exports = function (soljson) {
+    return {
+        compile: function (input) {
+            const sources = JSON.parse(input).sources;
+            const errors = [];
+            for (const [name, source] of Object.entries(sources)) {
+                if (source.content.indexOf("broken") !== -1) {
+                    errors.push({severity: "error", type: "ParserError", message: "broken",
+                                 formattedMessage: "ParserError: broken in " + name,
+                                 sourceLocation: {file: name, start: source.content.indexOf("broken"), end: -1}});
+                }
+            }
+            return JSON.stringify({errors: errors, sources: sources, version: soljson.version});
+        }
+    };
+};
+"""
+
+# stands in for a solc binary of one version, echoes its standard-json input
+FAKE_SOLC = """#!/bin/sh
+if [ "$1" = "--version" ]; then
+    echo "solc, the solidity compiler commandline interface"
+    echo "Version: {0}+commit.00000000.Linux.g++"
+else
+    echo '{{"errors": [], "version": "{0}", "input": '
+    cat
+    echo '}}'
+fi
+"""
+# the candidate and its dependencies, as code_gen sends them
+SOURCES = {"candidate.sol": 'import "deps.sol"; contract A is Lib {}',
+           "deps.sol": 'import "candidate.sol";\ncontract Lib {}'}
+BROKEN = {"candidate.sol": 'import "deps.sol"; contract A is Lib { broken }',
+          "deps.sol": SOURCES["deps.sol"]}
+
+
+def create_fake_solcjs(tmp_dir, version="0.8.26"):
+    module = os.path.join(tmp_dir, "solc")
+    os.makedirs(module)
+    open(os.path.join(module, "wrapper.js"), "w").write(FAKE_WRAPPER)
+    open(os.path.join(module, "index.js"), "w").write(
+        'module.exports = require("./wrapper")(require("./soljson.js"));')
+    open(os.path.join(module, "soljson.js"), "w").write(
+        'module.exports = {{version: "{0}"}};'.format(version))
+    open(os.path.join(module, "package.json"), "w").write(
+        '{{"name": "solc", "version": "{0}"}}'.format(version))
+    return module
+
+
+def test_solcjs_worker_pool():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            pool = SolcPool(size=2, backend="auto",
+                            solcjs_module=create_fake_solcjs(tmp_dir))
+        assert pool.backend == "solcjs"
+        try:
+            assert pool.check(SOURCES) == []
+
+            errors = get_errors(pool.check(BROKEN))
+            assert len(errors) == 1
+            assert errors[0]["sourceLocation"]["file"] == "candidate.sol"
+
+            # the dependency is no longer sent, the worker resolves it from its own cache
+            worker = pool.idle.get()
+            sent = []
+            write = worker.process.stdin.write
+            worker.process.stdin.write = lambda line: sent.append(line) or write(line)
+            output = worker.compile(BROKEN, {})
+            worker.process.stdin.write = write
+            assert output["sources"]["deps.sol"]["content"] == SOURCES["deps.sol"]
+            assert "content" not in json.loads(sent[0])["sources"]["deps.sol"]
+            pool.release(worker)
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(lambda i: len(get_errors(pool.check(
+                    BROKEN if i % 2 else SOURCES))), range(8)))
+            assert results == [0, 1] * 4
+            assert len(pool.workers) <= 2
+        finally:
+            pool.close()
+
+
+def test_worker_cache_miss():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            pool = SolcPool(size=1, backend="solcjs",
+                            solcjs_module=create_fake_solcjs(tmp_dir))
+        try:
+            sources = {"candidate.sol": "contract A {}"}
+            assert pool.check(sources) == []
+            # a worker that lost a source (evicted from its cache) asks for it again
+            worker = pool.idle.get()
+            worker.known_sources.add(source_hash("contract B {}"))
+            pool.release(worker)
+            assert pool.check({"candidate.sol": "contract B {}"}) == []
+        finally:
+            pool.close()
+
+
+def test_backend_for_solc_version():
+    soljson_dir, download, path = solc_pool.SOLJSON_DIR, solc_pool.SOLJSON_DOWNLOAD, os.environ["PATH"]
+    solc_pool.SOLJSON_DOWNLOAD = False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        module = create_fake_solcjs(tmp_dir, version="0.8.26")
+        solc_pool.SOLJSON_DIR = os.path.join(tmp_dir, "soljson")
+        os.makedirs(solc_pool.SOLJSON_DIR)
+        open(os.path.join(solc_pool.SOLJSON_DIR, "soljson-v0.8.25+commit.b61c2a91.js"), "w").write(
+            'module.exports = {version: "0.8.25"};')
+        bin_dir = os.path.join(tmp_dir, "bin")
+        os.makedirs(bin_dir)
+        solc_binary = os.path.join(bin_dir, "solc-0.8.24")
+        open(solc_binary, "w").write(FAKE_SOLC.format("0.8.24"))
+        os.chmod(solc_binary, stat.S_IRWXU)
+        os.environ["PATH"] = bin_dir + os.pathsep + path
+        pools = []
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as log:
+                # the module's own build, another build of the module's wrapper, a solc binary
+                for version in ["0.8.26", "0.8.25", "0.8.24"]:
+                    pools.append(SolcPool(size=1, backend="auto",
+                                 solcjs_module=module, solc_version=version))
+                    assert pools[-1].compile({"candidate.sol": "contract A {}"})["version"] == version
+            assert [pool.backend for pool in pools] == ["solcjs", "solcjs", "standard-json"]
+            assert pools[2].solc_binary == solc_binary
+            # the solc binary gets the same two source units as the workers
+            assert pools[2].compile(SOURCES)["input"]["sources"] == {
+                name: dict(content=content) for name, content in SOURCES.items()}
+            # the chosen backend is logged, a process per check is not reported as warm workers
+            lines = log.getvalue().splitlines()
+            assert "persistent" in lines[1] and "soljson-v0.8.25" in lines[1]
+            assert "one process per check" in lines[2] and "persistent" not in lines[2]
+
+            try:
+                SolcPool(backend="solcjs", solcjs_module=module, solc_version="0.8.24")
+                assert False, "no solc-js build of 0.8.24"
+            except ValueError:
+                pass
+        finally:
+            for pool in pools:
+                pool.close()
+            solc_pool.SOLJSON_DIR = soljson_dir
+            solc_pool.SOLJSON_DOWNLOAD = download
+            os.environ["PATH"] = path
+
+
+def test_download_soljson():
+    soljson_dir, url = solc_pool.SOLJSON_DIR, solc_pool.SOLJSON_URL
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        module = create_fake_solcjs(tmp_dir, version="0.8.26")
+        # a release list and builds laid out as on binaries.soliditylang.org
+        bin_dir = os.path.join(tmp_dir, "bin")
+        os.makedirs(bin_dir)
+        builds = []
+        for version, commit in [("0.8.25", "b61c2a91"), ("0.8.24", "e11b9ed9")]:
+            file_name = "soljson-v{0}+commit.{1}.js".format(version, commit)
+            content = 'module.exports = {{version: "{0}"}};'.format(version).encode("utf8")
+            open(os.path.join(bin_dir, file_name), "wb").write(content)
+            builds.append(dict(path=file_name, version=version,
+                               sha256="0x" + hashlib.sha256(content).hexdigest()))
+        # a corrupted download
+        open(os.path.join(bin_dir, builds[1]["path"]), "a").write(" ")
+        open(os.path.join(bin_dir, "list.json"), "w").write(json.dumps(
+            dict(builds=builds, releases={build["version"]: build["path"] for build in builds})))
+        solc_pool.SOLJSON_DIR = os.path.join(tmp_dir, "soljson")
+        solc_pool.SOLJSON_URL = "file://" + bin_dir
+        pool = None
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                pool = SolcPool(size=1, backend="solcjs", solcjs_module=module, solc_version="0.8.25")
+            assert pool.soljson == os.path.join(solc_pool.SOLJSON_DIR, builds[0]["path"])
+            assert pool.compile(SOURCES)["version"] == "0.8.25"
+            assert solc_pool.download_soljson("0.8.24") is None
+            assert solc_pool.download_soljson("0.8.23") is None
+            assert os.listdir(solc_pool.SOLJSON_DIR) == [builds[0]["path"]]
+        finally:
+            if pool is not None:
+                pool.close()
+            solc_pool.SOLJSON_DIR = soljson_dir
+            solc_pool.SOLJSON_URL = url
+
+
+if __name__ == "__main__":
+    test_solcjs_worker_pool()
+    test_worker_cache_miss()
+    test_backend_for_solc_version()
+    test_download_soljson()
@@ -1,6 +1,70 @@
-from src.framework.taint_tracking import TaintTrack
+import gc
+import os
+import tempfile
+from slither.analyses.data_dependency.data_dependency import is_dependent
+from slither.core.declarations.function import Function
+from src.framework.compile import Compilation, ContractWrapper
+from src.framework.dependency import ProgramDependency
+from src.framework.taint_tracking import IGNORED_VARIABLES, TaintLattice, TaintTrack
 from src.test.test_dependency import generate_dependency
 
+benchmark_dir = "examples/benchmark/curated/manual_partitions"
+solc_remaps = "@openzeppelin=examples/benchmark/curated/raw/node_modules/@openzeppelin"
+solc_version = "0.8.25"
+benchmark_contracts = ["AuctionInstance", "BlindAuction", "EncryptedERC20"]
+
+# even/odd are mutually recursive, countdown calls itself, helper is called from b and c
+RECURSIVE_CONTRACT = """pragma solidity 0.8.25;
+
+contract Recursive {
+    uint256 secret;
+    uint256 total;
+    uint256 counter;
+
+    function even(uint256 n) internal returns (bool) {
+        if (n == 0) {
+            return true;
+        }
+        return odd(n - 1);
+    }
+
+    function odd(uint256 n) internal returns (bool) {
+        if (n == 0) {
+            total = secret;
+            return false;
+        }
+        return even(n - 1);
+    }
+
+    function countdown(uint256 n) internal returns (uint256) {
+        if (n == 0) {
+            return secret;
+        }
+        return countdown(n - 1);
+    }
+
+    function helper() internal view returns (uint256) {
+        return secret + 1;
+    }
+
+    function a(uint256 n) public returns (bool) {
+        return even(n);
+    }
+
+    function b(uint256 n) public returns (uint256) {
+        return countdown(n) + helper();
+    }
+
+    function c() public view returns (uint256) {
+        return helper() * 2;
+    }
+
+    function d() public {
+        counter += 1;
+    }
+}
+"""
+
 
 def taint_tracking():
     sensitive_vars = set(["bids"])
@@ -15,5 +79,192 @@ def taint_tracking():
         print(sources.node.expression)
 
 
+def generate_benchmark_dependency(contract_name):
+    instance = Compilation(contract_file="{0}/{1}/original/{1}.sol".format(benchmark_dir, contract_name),
+                           solc_remaps=solc_remaps, solc_version=solc_version)
+    pdg = ProgramDependency(contract=ContractWrapper(
+        target_contract_name=contract_name, compilation=instance))
+    pdg.generate_dependencies()
+    return pdg
+
+
+def generate_recursive_dependency():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        contract_file = os.path.join(tmp_dir, "Recursive.sol")
+        open(contract_file, "w").write(RECURSIVE_CONTRACT)
+        instance = Compilation(contract_file=contract_file,
+                               solc_remaps=None, solc_version=solc_version)
+        pdg = ProgramDependency(contract=ContractWrapper(
+            target_contract_name="Recursive", compilation=instance))
+        pdg.generate_dependencies()
+    return pdg
+
+
+def legacy_is_dependent(depends, sensitive_var, node, callers=()):
+    # the walk over every node of every called function, repeated at each call site, that the
+    # function summaries replace. It never ended on recursive calls: here a function already on
+    # the walked call path is skipped, which still visits every function the node reaches
+    for variable in node.variables_read:
+        if variable is not None and variable.name not in IGNORED_VARIABLES and depends(sensitive_var, variable):
+            return True
+    for variable in node.variables_written:
+        if depends(sensitive_var, variable):
+            return True
+    if sensitive_var in node.variables_read or sensitive_var in node.variables_written:
+        return True
+    for internal_call in node.internal_calls:
+        if isinstance(internal_call, Function) and internal_call not in callers:
+            for callee_node in internal_call.nodes:
+                if legacy_is_dependent(depends, sensitive_var, callee_node, callers + (internal_call,)):
+                    return True
+    return False
+
+
+def legacy_taint(pdg, sensitive_vars, depends):
+    return set(apinode for function in pdg.data_dependencies for apinode in pdg.data_dependencies[function].nodes
+               if any(legacy_is_dependent(depends, sensitive_var, apinode.node) for sensitive_var in sensitive_vars))
+
+
+def test_summaries_match_legacy():
+    for contract_name in benchmark_contracts:
+        pdg = generate_benchmark_dependency(contract_name)
+        contract = pdg.contract.contract
+        for state_var in pdg.contract.get_all_state_variables():
+            tainter = TaintTrack(pdg, set([state_var]))
+            tainter.compute()
+            sources = legacy_taint(pdg, [state_var], lambda sensitive_var, variable: is_dependent(
+                variable, sensitive_var, contract))
+            sinks = legacy_taint(pdg, [state_var], lambda sensitive_var, variable: is_dependent(
+                sensitive_var, variable, contract))
+            assert tainter.get_taint_sources() == sources, "{0} sources of {1}".format(
+                contract_name, state_var.name)
+            assert tainter.get_taint_sinks() == sinks, "{0} sinks of {1}".format(
+                contract_name, state_var.name)
+
+
+def test_recursive_helpers():
+    pdg = generate_recursive_dependency()
+    wrapper = pdg.contract
+    tainter = TaintTrack(pdg, set(["secret"]))
+    tainter.compute()
+    tainted = set(apinode.node.function.name for apinode in tainter.get_taint_sources())
+    assert set(["even", "odd", "countdown", "helper", "a", "b", "c"]) <= tainted
+    assert "d" not in tainted
+    assert tainter.get_taint_sources() == legacy_taint(pdg, tainter.sensitive_vars, lambda sensitive_var, variable: is_dependent(
+        variable, sensitive_var, wrapper.contract))
+
+    # the functions of a recursion share one summary
+    lattice = tainter.taintsources.lattice
+    bit = lattice.bits[wrapper.get_state_variable_from_name("secret")]
+    even, odd, countdown = [wrapper.get_functions_from_name(name)[0] for name in ["even", "odd", "countdown"]]
+    assert lattice.get_summary(even) == lattice.get_summary(odd) == bit
+    assert lattice.get_summary(countdown) == bit
+    assert tainter.get_taint_sink_source_node_for_func(
+        wrapper.get_functions_from_name("a")[0]) >= tainter.get_taint_sink_source_node_for_func(odd)
+
+
+def test_shared_helper():
+    pdg = generate_recursive_dependency()
+    wrapper = pdg.contract
+    contract = wrapper.contract
+    secret = wrapper.get_state_variable_from_name("secret")
+    helper, b, c = [wrapper.get_functions_from_name(name)[0] for name in ["helper", "b", "c"]]
+
+    # the summary of helper is the same whichever caller gets summarized first
+    summaries = []
+    for callers in [[b, c], [c, b]]:
+        lattice = TaintLattice(set([secret]), lambda sensitive_var, variable: is_dependent(
+            variable, sensitive_var, contract))
+        for caller in callers:
+            lattice.get_summary(caller)
+        summaries.append(lattice.summaries[helper])
+        # and every call site of helper is labelled with it
+        for caller in callers:
+            for node in caller.nodes:
+                if helper in node.internal_calls:
+                    assert lattice.node_mask(node) & lattice.summaries[helper] == lattice.summaries[helper]
+    assert summaries[0] == summaries[1] == 1
+
+
+def test_multiple_sensitive_variables():
+    # one pass over all the state variables gives what separate runs per variable give
+    for contract_name in benchmark_contracts:
+        pdg = generate_benchmark_dependency(contract_name)
+        state_vars = pdg.contract.get_all_state_variables()
+        assert len(state_vars) >= 2
+        tainter = TaintTrack(pdg, set(state_vars))
+        tainter.compute()
+        single = dict()
+        for state_var in state_vars:
+            single[state_var] = TaintTrack(pdg, set([state_var]))
+            single[state_var].compute()
+        assert tainter.get_taint_sources() == set().union(
+            *[single[state_var].get_taint_sources() for state_var in state_vars])
+        assert tainter.get_taint_sinks() == set().union(
+            *[single[state_var].get_taint_sinks() for state_var in state_vars])
+        for function in pdg.data_dependencies:
+            for apinode in pdg.data_dependencies[function].nodes:
+                expected = set(state_var for state_var in state_vars if apinode in
+                               single[state_var].get_taint_sources().union(single[state_var].get_taint_sinks()))
+                assert tainter.get_tainting_variables(apinode) == expected, "{0}: {1}".format(
+                    contract_name, apinode.node.expression)
+
+    pdg = generate_recursive_dependency()
+    wrapper = pdg.contract
+    secret, total, counter = [wrapper.get_state_variable_from_name(name) for name in ["secret", "total", "counter"]]
+    tainter = TaintTrack(pdg, set(["secret", "total", "counter"]))
+    tainter.compute()
+
+    def tainting_variables(function_name):
+        function = wrapper.get_functions_from_name(function_name)[0]
+        return set().union(*[tainter.get_tainting_variables(apinode) for apinode in pdg.data_dependencies[function].nodes])
+    # odd writes secret into total, a reaches it through even; helper reads secret, which total
+    # depends on; d only touches counter
+    assert tainting_variables("odd") == set([secret, total])
+    assert tainting_variables("a") == set([secret, total])
+    assert secret in tainting_variables("helper") and counter not in tainting_variables("helper")
+    assert tainting_variables("d") == set([counter])
+
+
+def get_factories(pdg):
+    return set(pdg.data_dependencies[function].factory for function in pdg.data_dependencies).union(
+        pdg.control_dependencies[function].factory for function in pdg.control_dependencies)
+
+
+def test_invalidation():
+    pdg = generate_dependency()
+    tainter = TaintTrack(pdg, set(["bids"]))
+    tainter.compute()
+    closures = {function: set(apinode.node for apinode in tainter.get_taint_sink_source_node_for_func(function))
+                for function in pdg.data_dependencies}
+    sources = set(apinode.node for apinode in tainter.get_taint_sources())
+    assert len(tainter.func_taint_closures) > 0
+    old_factories = get_factories(pdg)
+
+    # a new generation of the PDG drops the results, they are recomputed on the new PDG at the next lookup
+    pdg.generate_dependencies()
+    assert tainter.stale and tainter.func_taint_nodes is None and tainter.func_taint_closures == dict()
+    new_factories = get_factories(pdg)
+    assert new_factories.isdisjoint(old_factories)
+    for function, nodes in closures.items():
+        apinodes = tainter.get_taint_sink_source_node_for_func(function)
+        assert set(apinode.node for apinode in apinodes) == nodes
+        assert all(apinode.factory in new_factories for apinode in apinodes)
+    assert all(apinode.factory in new_factories for apinode in tainter.get_taint_sources().union(tainter.get_taint_sinks()))
+    assert set(apinode.node for apinode in tainter.get_taint_sources()) == sources
+    assert not tainter.stale and len(tainter.func_taint_closures) > 0
+
+    # the PDG does not keep a collected tracker alive, its hook is dropped on the next generation
+    del tainter
+    gc.collect()
+    pdg.generate_dependencies()
+    assert pdg.invalidation_hooks == []
+
+
 if __name__ == "__main__":
     taint_tracking()
+    test_summaries_match_legacy()
+    test_recursive_helpers()
+    test_shared_helper()
+    test_multiple_sensitive_variables()
+    test_invalidation()
@@ -0,0 +1,93 @@
+import io
+import json
+import os
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from src.framework.workspace import Workspace
+from src.llmpartition import code_gen, model_config
+from src.llmpartition.candidate_analysis import CandidateAnalysis
+from src.vector_db import embedding_backend
+
+
+def load_partitions():
+    benchmark = json.load(open("src/partition_benchmark.json"))
+    return [(item["partition"], item["target_contract_name"]) for items in benchmark.values() for item in items]
+
+
+def test_workspace_isolation():
+    with Workspace() as workspace:
+        first = workspace.subworkspace("candidate-0-")
+        second = workspace.subworkspace("candidate-1-")
+        assert first.write("compile.sol", "a") != second.write(
+            "compile.sol", "b")
+        assert open(first.get_file_path("compile.sol")).read() == "a"
+        assert open(second.get_file_path("compile.sol")).read() == "b"
+    assert not os.path.exists(workspace.path)
+
+
+def test_concurrent_analysis():
+    partitions = load_partitions()[:8]
+
+    with Workspace() as workspace:
+        serial = [CandidateAnalysis.from_code(code, "", set(), name, workspace.subworkspace("serial-")).wrapper.contract.name
+                  for code, name in partitions]
+
+        def job(item):
+            code, name = item
+            return CandidateAnalysis.from_code(code, "", set(), name, workspace.subworkspace("parallel-")).wrapper.contract.name
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            parallel = list(executor.map(job, partitions))
+
+    assert serial == parallel
+
+
+def run_transform_job(job):
+    original, partition, contract_name, func_name = job
+    # the slices are not used by the fake LLM, the privileged nodes tell the jobs apart
+    return code_gen.transform(original, "", "job:" + func_name, "", "", set(), contract_name, func_name)
+
+
+def test_concurrent_transform_jobs():
+    # two transform jobs on the same contract side by side, each must only see its own candidates
+    benchmark = json.load(open("src/partition_benchmark.json"))
+    jobs = [(item["original"], item["partition"], item["target_contract_name"], item["target_func_name"])
+            for item in benchmark["AuctionInstance"][:2]]
+    answers = {"job:" + func_name: partition for _, partition, _, func_name in jobs}
+    originals = [original for original, _, _, _ in jobs]
+
+    def fake_llm_result(prompt, example_prompts, candidate=0):
+        for marker, partition in answers.items():
+            if marker in prompt:
+                return partition
+        # the formatting request returns the code unchanged
+        return [original for original in originals if original in prompt][0]
+
+    settings = (code_gen.get_llm_result, code_gen.CANDIDATE_LIMIT, model_config.ASYNC_LLM,
+                model_config.SEARCH_MODE, embedding_backend.EMBEDDING_BACKEND)
+    code_gen.get_llm_result = fake_llm_result
+    code_gen.CANDIDATE_LIMIT = 2
+    model_config.ASYNC_LLM = False
+    model_config.SEARCH_MODE = "full"
+    embedding_backend.EMBEDDING_BACKEND = "hashing"
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial = [run_transform_job(job) for job in jobs]
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                parallel = list(executor.map(run_transform_job, jobs))
+    finally:
+        (code_gen.get_llm_result, code_gen.CANDIDATE_LIMIT, model_config.ASYNC_LLM,
+         model_config.SEARCH_MODE, embedding_backend.EMBEDDING_BACKEND) = settings
+
+    assert parallel == serial
+    for (_, partition, _, func_name), result in zip(jobs, parallel):
+        assert result["target_func_name"] == func_name and len(result["partitions"]) == 2
+        for candidate in result["partitions"].values():
+            assert candidate["output_code"] == partition
+            assert abs(candidate["groundtruth_similarity"] - 1) < 1e-6
+
+
+if __name__ == "__main__":
+    test_workspace_isolation()
+    test_concurrent_analysis()
+    test_concurrent_transform_jobs()
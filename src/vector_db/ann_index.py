@@ -0,0 +1,143 @@
+# Optional inverted-file (IVF) index over an EmbeddingStore: the normalized rows are clustered with
+# spherical k-means (trained on a sample) and a query only scores the rows of its ANN_N_PROBE closest clusters. The index
+# is persisted next to the embeddings as <name>.ivf.npz and rebuilt when the matrix changes. Small
+# stores, and queries whose probed clusters hold fewer than k rows, use exact search.
+import os
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from src.vector_db.embedding_store import EmbeddingStore, normalize_rows, top_k_indices
+
+ANN_ENABLED = False
+# stores with fewer rows are always searched exactly
+ANN_MIN_SIZE = 1000
+# None picks about sqrt(number of rows) clusters
+ANN_N_LISTS: Optional[int] = None
+ANN_N_PROBE = 8
+KMEANS_ITERATIONS = 20
+# k-means is trained on at most this many rows per cluster
+KMEANS_SAMPLES_PER_LIST = 40
+
+
+class IVFIndex(object):
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_ids: np.ndarray) -> None:
+        # the rows of cluster i are list_ids[list_offsets[i]:list_offsets[i + 1]]
+        self.centroids: np.ndarray = centroids
+        self.list_offsets: np.ndarray = list_offsets
+        self.list_ids: np.ndarray = list_ids
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_lists: int = None, iterations: int = None, seed: int = 0):
+        n = matrix.shape[0]
+        n_lists = max(1, int(np.sqrt(n))) if n_lists is None else n_lists
+        n_lists = min(n_lists, n)
+        iterations = KMEANS_ITERATIONS if iterations is None else iterations
+        random = np.random.default_rng(seed)
+        sample = np.asarray(matrix[np.sort(random.choice(
+            n, min(n, n_lists * KMEANS_SAMPLES_PER_LIST), replace=False))])
+        centroids = sample[random.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = cls.assign(sample, centroids)
+            counts = np.bincount(assignments, minlength=n_lists)
+            sums = cls.sum_by_list(sample, assignments, counts)
+            # an empty cluster restarts from a random row
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = sample[random.choice(len(sample), len(empty), replace=False)]
+            centroids = normalize_rows(sums)
+        assignments = cls.assign(matrix, centroids)
+        list_ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]).astype(np.int64)
+        return cls(centroids.astype(np.float32), list_offsets, list_ids)
+
+    @staticmethod
+    def sum_by_list(matrix: np.ndarray, assignments: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        sums = np.zeros((len(counts), matrix.shape[1]), dtype=np.float32)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        non_empty = np.flatnonzero(counts)
+        sums[non_empty] = np.add.reduceat(
+            matrix[order], offsets[non_empty], axis=0)
+        return sums
+
+    @staticmethod
+    def assign(matrix: np.ndarray, centroids: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+        assignments = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], batch_size):
+            assignments[start:start + batch_size] = np.argmax(
+                matrix[start:start + batch_size] @ centroids.T, axis=1)
+        return assignments
+
+    def save(self, path, n_rows: int, source_mtime: float) -> None:
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets, list_ids=self.list_ids,
+                     n_rows=n_rows, source_mtime=source_mtime)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, n_rows: int, source_mtime: float):
+        # None when the index was built for another version of the matrix
+        with np.load(path) as data:
+            if int(data['n_rows']) != n_rows or float(data['source_mtime']) != source_mtime:
+                return None
+            return cls(data['centroids'], data['list_offsets'], data['list_ids'])
+
+    def get_candidates(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        lists = top_k_indices(self.centroids @ query, n_probe)
+        return np.concatenate([self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists])
+
+    def search(self, matrix: np.ndarray, input_embedding, k: int, n_probe: int = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # None when the probed clusters hold fewer than k rows
+        n_probe = ANN_N_PROBE if n_probe is None else n_probe
+        query = normalize_rows(input_embedding)
+        candidates = np.sort(self.get_candidates(query, n_probe))
+        if len(candidates) < min(k, matrix.shape[0]):
+            return None
+        similarities = matrix[candidates] @ query
+        best = top_k_indices(similarities, k)
+        return candidates[best], similarities[best]
+
+
+def get_index_path(store: EmbeddingStore) -> Path:
+    return store.path.with_suffix('.ivf.npz')
+
+
+_indexes: Dict[Path, IVFIndex] = dict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(store: EmbeddingStore) -> Optional[IVFIndex]:
+    # None when exact search should be used
+    if not ANN_ENABLED or store.path is None or len(store) < ANN_MIN_SIZE:
+        return None
+    index_path = get_index_path(store)
+    source_mtime = EmbeddingStore.get_paths(store.path)[0].stat().st_mtime
+    with _indexes_lock:
+        if index_path not in _indexes:
+            index = IVFIndex.load(index_path, len(store), source_mtime) if index_path.exists() else None
+            if index is None:
+                index = IVFIndex.build(store.matrix, ANN_N_LISTS)
+                index.save(index_path, len(store), source_mtime)
+            _indexes[index_path] = index
+        return _indexes[index_path]
+
+
+def search(store: EmbeddingStore, input_embedding, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # indices and similarities of the (approximately) k most similar rows, by decreasing similarity
+    index = get_index(store)
+    if index is not None:
+        result = index.search(store.matrix, input_embedding, k)
+        if result is not None:
+            return result
+    return store.top_k(input_embedding, k)
+
+
+def search_batch(store: EmbeddingStore, input_embeddings, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # one row of indices and similarities per input, a single matrix product for exact search
+    if get_index(store) is None:
+        return store.top_k_batch(input_embeddings, k)
+    results = [search(store, input_embedding, k) for input_embedding in input_embeddings]
+    return np.array([indices for indices, _ in results]), np.array([similarities for _, similarities in results])
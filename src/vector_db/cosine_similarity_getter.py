@@ -1,87 +1,87 @@
 import os
 from pathlib import Path
-import pickle
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import openai
 import matplotlib.pyplot as plt
 import src.vector_db.config as config
+from src.vector_db.embedding_store import EMBEDDINGS_PKL, EmbeddingStore, find_elbow_points, get_store
+from src.vector_db.embedding_backend import embed_text, embed_texts, get_backend
+from src.vector_db import ann_index
+from src.vector_db.segment_store import get_segment_store
 
 
 class EmbeddingAnalyzer:
-    def __init__(self):
-        self.load_embeddings()
-
-    def load_embeddings(self):
-        script_dir = Path(__file__).parent
-        embeddings_file = script_dir / 'basic_data' / 'embeddings.pkl'
-        if embeddings_file.exists():
-            with open(embeddings_file, 'rb') as f:
-                self.embeddings, self.metadata_list = pickle.load(f)
+    def __init__(self, embeddings_file=EMBEDDINGS_PKL):
+        self.embeddings_file = Path(embeddings_file)
+
+    @property
+    def store(self) -> EmbeddingStore:
+        # loaded on first use and shared by every analyzer of the process,
+        # a directory is the segment store of incremental updates. Either has to hold
+        # vectors of the backend the queries are embedded with
+        if self.embeddings_file.is_dir():
+            store = get_segment_store(self.embeddings_file)
         else:
-            raise FileNotFoundError(
-                f"No embeddings file found at {embeddings_file}")
+            store = get_store(self.embeddings_file)
+        store.check_backend(get_backend().name)
+        return store
+
+    @property
+    def metadata_list(self):
+        return self.store.metadata_list
 
     def convert_to_embedding(self, input_text):
-        openai.api_key = config.OPENAI_API_KEY
-        response = openai.Embedding.create(
-            model=config.PRETRAIN_MODEL_OPENAI,
-            input=input_text
-        )
-        return response['data'][0]['embedding']
+        return embed_text(input_text)
+
+    def convert_to_embeddings(self, input_texts):
+        # batched and cached, one row per input text
+        return embed_texts(input_texts)
 
     def calculate_similarities(self, input_embedding):
-        return cosine_similarity([input_embedding], list(self.embeddings.values()))[0]
+        return self.store.similarities(input_embedding)
 
-    def get_top_k_similar(self, embeddings, metadata_list, input_embedding, k=5):
-        # Calculate cosine similarity
-        similarities = cosine_similarity(
-            [input_embedding], list(self.embeddings.values()))[0]
+    def calculate_similarities_batch(self, input_embeddings):
+        # one row of similarities per input embedding
+        return self.store.similarities_batch(input_embeddings)
 
-        # Get top k indices from the top similarities up to the limit
-        top_indices_limit = np.argsort(
-            similarities)[-config.TOP_K:][::-1]
+    def get_top_k_similar(self, embeddings, metadata_list, input_embedding, k=5):
+        # Get top k indices from the top similarities up to the limit,
+        # through the ANN index when it is enabled
+        top_indices_limit, top_similarities = ann_index.search(
+            self.store, input_embedding, min(k, config.TOP_K))
 
         # Get top k metadata and scores from the top similarities within the limit
-        top_k_metadata = [metadata_list[i] for i in top_indices_limit[:k]]
-        top_k_scores = [similarities[i] for i in top_indices_limit[:k]]
+        top_k_metadata = [metadata_list[i] for i in top_indices_limit]
+        top_k_scores = list(top_similarities)
 
         return top_k_metadata, top_k_scores
 
     def find_elbow_point(self, similarities, m):
-        # Ensure m is within the range of similarities
-        # m should not be out of index range
-        m = max(0, min(m, len(similarities) - 1))
-
-        # Adjust the list of points to start from m
-        points = [(i, s) for i, s in enumerate(similarities[m:])]
-        p1, pn = points[0], points[-1]
-
-        # Function to calculate distance of each point from line
-        def distance_from_line(p, p1, pn):
-            return np.abs((pn[1] - p1[1]) * p[0] - (pn[0] - p1[0]) * p[1] + pn[0] * p1[1] - pn[1] * p1[0]) / np.sqrt(
-                (pn[1] - p1[1]) ** 2 + (pn[0] - p1[0]) ** 2)
-
-        # Calculate the distance for each point
-        distances = np.array([distance_from_line(p, p1, pn) for p in points])
-
-        # The point with the maximum distance is our elbow point
-        elbow_index = np.argmax(distances)
-        return elbow_index + 1  # Adding 1 because indices start at 0
+        # one elbow per row for a 2-D batch of sorted similarities
+        return find_elbow_points(similarities, m)
 
     def analyze_input(self, input_text):
         input_embedding = self.convert_to_embedding(input_text)
-        similarities = self.calculate_similarities(input_embedding)
+        top_indices, sorted_similarities = ann_index.search(
+            self.store, input_embedding, config.TOP_K)
 
         m = 0
-        sorted_similarities = np.sort(
-            similarities)[-config.TOP_K:][::-1]
         top_k = self.find_elbow_point(sorted_similarities, m)
 
-        top_k_metadata, top_k_scores = self.get_top_k_similar(
-            self.embeddings, self.metadata_list, input_embedding, k=top_k)
+        return [(self.metadata_list[i]['Original'], self.metadata_list[i]['Partition'], score) for i, score in zip(top_indices[:top_k], sorted_similarities[:top_k])]
+
+
+    def analyze_inputs(self, input_texts):
+        # few-shot examples of several inputs at once: one embedding request, one matrix product
+        # for the similarities and one elbow computation for all of them
+        input_embeddings = self.convert_to_embeddings(input_texts)
+        top_indices, sorted_similarities = ann_index.search_batch(
+            self.store, input_embeddings, config.TOP_K)
+
+        m = 0
+        top_ks = self.find_elbow_point(sorted_similarities, m)
 
-        return [(metadata['Original'], metadata['Partition'], score) for metadata, score in zip(top_k_metadata, top_k_scores)]
+        return [[(self.metadata_list[i]['Original'], self.metadata_list[i]['Partition'], score) for i, score in zip(indices[:top_k], similarities[:top_k])]
+                for indices, similarities, top_k in zip(top_indices, sorted_similarities, top_ks)]
 
 
 # # 使用示例
@@ -0,0 +1,180 @@
+# Batched text embeddings behind a persistent content-hash cache: every distinct (backend, text) pair
+# is embedded once, and the texts that are not cached yet go to the backend EMBEDDING_BATCH_SIZE at a time.
+import os
+import time
+import sqlite3
+import hashlib
+import itertools
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+import src.vector_db.config as config
+
+# "openai", "hashing" (local, offline) or "sentence-transformers" (local, needs the package)
+EMBEDDING_BACKEND = "openai"
+EMBEDDING_BATCH_SIZE = 100
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = ".partitiongpt-cache/embeddings.sqlite"
+SENTENCE_TRANSFORMER_MODEL = "all-MiniLM-L6-v2"
+HASHING_DIMENSION = 1536
+
+
+# 辅助函数，将可迭代对象分割成多个块
+def chunks(iterable, batch_size=100):
+    it = iter(iterable)
+    chunk = list(itertools.islice(it, batch_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(it, batch_size))
+
+
+class OpenAIEmbeddingBackend(object):
+    def __init__(self, model: str = None) -> None:
+        self.model: str = config.PRETRAIN_MODEL_OPENAI if model is None else model
+        self.name: str = "openai:" + self.model
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        import openai
+        openai.api_key = config.OPENAI_API_KEY
+        response = openai.Embedding.create(model=self.model, input=texts)
+        data = sorted(response['data'], key=lambda item: item['index'])
+        return np.array([item['embedding'] for item in data], dtype=np.float32)
+
+
+class HashingEmbeddingBackend(object):
+    # bag of Solidity identifiers/operators hashed into a fixed number of buckets, needs no network
+    # and no model download. Its vectors only compare with vectors of the same backend.
+    def __init__(self, dimension: int = None) -> None:
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self.dimension: int = HASHING_DIMENSION if dimension is None else dimension
+        self.name: str = "hashing:{0}".format(self.dimension)
+        self.vectorizer = HashingVectorizer(n_features=self.dimension, token_pattern=r"[A-Za-z_$][A-Za-z0-9_$]*|\d+|[^\sA-Za-z0-9_$]",
+                                            ngram_range=(1, 2), lowercase=False, alternate_sign=False)
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        return self.vectorizer.transform(texts).toarray().astype(np.float32)
+
+
+class SentenceTransformerBackend(object):
+    def __init__(self, model: str = None) -> None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "The sentence-transformers embedding backend needs the sentence-transformers package")
+        self.model_name: str = SENTENCE_TRANSFORMER_MODEL if model is None else model
+        self.name: str = "sentence-transformers:" + self.model_name
+        self.model = SentenceTransformer(self.model_name)
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts), dtype=np.float32)
+
+
+BACKENDS = {"openai": OpenAIEmbeddingBackend, "hashing": HashingEmbeddingBackend,
+            "sentence-transformers": SentenceTransformerBackend}
+
+_backends: Dict[str, object] = dict()
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str = None):
+    name = EMBEDDING_BACKEND if name is None else name
+    if name not in BACKENDS:
+        raise ValueError("Unknown embedding backend: {0}".format(name))
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+def get_cache_key(backend_name: str, text: str) -> str:
+    return hashlib.sha256((backend_name + "\0" + text).encode("utf8")).hexdigest()
+
+
+class EmbeddingCache(object):
+    def __init__(self, path: str = None) -> None:
+        self.path: str = EMBEDDING_CACHE_PATH if path is None else path
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock = threading.Lock()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, backend TEXT, vector BLOB, created REAL)")
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = dict()
+        with self.lock:
+            for batch in chunks(keys, 500):
+                rows = self.connection.execute("SELECT key, vector FROM embeddings WHERE key IN ({0})".format(
+                    ",".join("?" * len(batch))), batch).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, backend_name: str, vectors: Dict[str, np.ndarray]) -> None:
+        with self.lock:
+            now = time.time()
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", [
+                    (key, backend_name, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in vectors.items()])
+
+    def clear(self) -> None:
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM embeddings")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def summary(self) -> str:
+        return "Embedding cache: {0} hits, {1} misses".format(self.hits, self.misses)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+
+def embed_texts(texts: Iterable[str], backend=None, batch_size: int = None) -> np.ndarray:
+    # one row per text, in order. Duplicated texts are embedded once.
+    if backend is None or isinstance(backend, str):
+        backend = get_backend(backend)
+    batch_size = EMBEDDING_BATCH_SIZE if batch_size is None else batch_size
+    texts = list(texts)
+    keys = [get_cache_key(backend.name, text) for text in texts]
+    unique_texts = dict(zip(keys, texts))
+
+    vectors = get_cache().get_many(list(unique_texts)) if EMBEDDING_CACHE_ENABLED else dict()
+    missing = [key for key in unique_texts if key not in vectors]
+    for batch in chunks(missing, batch_size):
+        batch_vectors = backend.embed_batch([unique_texts[key] for key in batch])
+        new_vectors = dict(zip(batch, batch_vectors))
+        if EMBEDDING_CACHE_ENABLED:
+            get_cache().put_many(backend.name, new_vectors)
+        vectors.update(new_vectors)
+    if len(texts) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([vectors[key] for key in keys]).astype(np.float32, copy=False)
+
+
+def embed_text(text: str, backend=None) -> np.ndarray:
+    return embed_texts([text], backend)[0]
+
+
+def summary() -> Optional[str]:
+    # None when no embedding went through the cache in this process
+    return None if _cache is None else _cache.summary()
@@ -0,0 +1,163 @@
+import os
+import json
+import pickle
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+EMBEDDINGS_PKL = Path(__file__).parent / 'basic_data' / 'embeddings.pkl'
+# an embeddings pickle is (embeddings, metadata_list, backend name); the pickles written before the
+# backend was recorded are (embeddings, metadata_list) and hold OpenAI ada-002 vectors
+PICKLE_BACKEND = "openai:text-embedding-ada-002"
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    # zero vectors stay zero, i.e. cosine similarity 0 with everything (as in sklearn)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def read_embeddings_pickle(pkl_path) -> Tuple[dict, List[dict], str]:
+    with open(pkl_path, 'rb') as f:
+        content = pickle.load(f)
+    return content[0], content[1], content[2] if len(content) > 2 else PICKLE_BACKEND
+
+
+def top_k_indices(similarities: np.ndarray, k: int) -> np.ndarray:
+    # indices of the k largest values in the last axis, by decreasing similarity (ties by index)
+    n = similarities.shape[-1]
+    k = max(0, min(k, n))
+    if k == 0:
+        return np.zeros(similarities.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        candidates = np.sort(np.argpartition(-similarities,
+                             k - 1, axis=-1)[..., :k], axis=-1)
+    else:
+        candidates = np.broadcast_to(np.arange(n), similarities.shape).copy()
+    order = np.argsort(-np.take_along_axis(similarities,
+                       candidates, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def find_elbow_points(similarities, m: int = 0):
+    # number of results up to the elbow of each (decreasingly sorted) similarity row: the point
+    # farthest from the line through the first and the last point after the first m ones.
+    # A 1-D input gives an int, a 2-D input one int per row.
+    similarities = np.asarray(similarities, dtype=np.float64)
+    n = similarities.shape[-1]
+    m = max(0, min(m, n - 1))
+    points = similarities[..., m:]
+    dx = points.shape[-1] - 1
+    if dx <= 0:
+        elbow_indices = np.zeros(points.shape[:-1], dtype=np.int64)
+    else:
+        y1, yn = points[..., :1], points[..., -1:]
+        x = np.arange(points.shape[-1])
+        distances = np.abs((yn - y1) * x - dx * points + dx * y1) / \
+            np.sqrt((yn - y1) ** 2 + dx ** 2)
+        elbow_indices = np.argmax(distances, axis=-1)
+    # Adding 1 because indices start at 0, no results without similarities
+    counts = np.minimum(elbow_indices + 1, n)
+    return int(counts) if similarities.ndim == 1 else counts
+
+
+class EmbeddingStore:
+    # Pre-normalized float32 matrix (one row per stored function) and the metadata of each row.
+    # Saved as <name>.npy + <name>.meta.json next to the pickle it is built from and memory-mapped
+    # on load, a cosine similarity query is then a single matrix-vector product.
+    def __init__(self, matrix: np.ndarray, ids: List[str], metadata_list: List[dict], path: Optional[Path] = None,
+                 backend: Optional[str] = None):
+        self.matrix: np.ndarray = matrix
+        self.ids: List[str] = ids
+        self.metadata_list: List[dict] = metadata_list
+        # the pickle the store was loaded from, None for a store built in memory
+        self.path: Optional[Path] = path
+        # the embedding backend of the vectors, None when unknown (a store built in memory)
+        self.backend: Optional[str] = backend
+
+    @classmethod
+    def from_embeddings(cls, embeddings: dict, metadata_list: List[dict], backend: Optional[str] = None):
+        ids = list(embeddings.keys())
+        matrix = normalize_rows(np.array(list(embeddings.values()), dtype=np.float32).reshape(len(ids), -1))
+        return cls(np.ascontiguousarray(matrix), ids, metadata_list, backend=backend)
+
+    @staticmethod
+    def get_paths(pkl_path) -> Tuple[Path, Path]:
+        pkl_path = Path(pkl_path)
+        return pkl_path.with_suffix('.npy'), pkl_path.with_suffix('.meta.json')
+
+    def save(self, pkl_path) -> None:
+        matrix_path, meta_path = self.get_paths(pkl_path)
+        tmp_matrix_path = matrix_path.with_name(matrix_path.name + '.tmp')
+        with open(tmp_matrix_path, 'wb') as f:
+            np.save(f, self.matrix)
+        tmp_meta_path = meta_path.with_name(meta_path.name + '.tmp')
+        with open(tmp_meta_path, 'w') as f:
+            json.dump(dict(ids=self.ids, metadata=self.metadata_list, backend=self.backend), f)
+        os.replace(tmp_meta_path, meta_path)
+        os.replace(tmp_matrix_path, matrix_path)
+
+    @classmethod
+    def load(cls, pkl_path=EMBEDDINGS_PKL, mmap: bool = True):
+        # (re)build the matrix when the pickle is newer than it, or it was built before the backend was recorded
+        pkl_path = Path(pkl_path)
+        matrix_path, meta_path = cls.get_paths(pkl_path)
+        meta = None
+        if matrix_path.exists() and meta_path.exists() and \
+                not (pkl_path.exists() and pkl_path.stat().st_mtime > matrix_path.stat().st_mtime):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if meta is None or 'backend' not in meta:
+            if not pkl_path.exists():
+                raise FileNotFoundError(
+                    f"No embeddings file found at {pkl_path}")
+            embeddings, metadata_list, backend = read_embeddings_pickle(pkl_path)
+            store = cls.from_embeddings(embeddings, metadata_list, backend)
+            store.save(pkl_path)
+            meta = dict(ids=store.ids, metadata=store.metadata_list, backend=backend)
+        matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+        return cls(matrix, meta['ids'], meta['metadata'], pkl_path, meta['backend'])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def check_backend(self, backend_name: str) -> None:
+        # queries embedded by another backend are not comparable with the stored vectors
+        if self.backend is not None and self.backend != backend_name:
+            raise ValueError("The embeddings {0} hold {1} vectors, not {2}: regenerate them with this backend "
+                             "(python -m src.vector_db.vector_processor --embedding-backend ...)".format(
+                                 self.path, self.backend, backend_name))
+
+    def similarities(self, input_embedding) -> np.ndarray:
+        return self.matrix @ normalize_rows(input_embedding)
+
+    def similarities_batch(self, input_embeddings) -> np.ndarray:
+        # one row of similarities per input
+        return normalize_rows(input_embeddings) @ self.matrix.T
+
+    def top_k(self, input_embedding, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        similarities = self.similarities(input_embedding)
+        indices = top_k_indices(similarities, k)
+        return indices, similarities[indices]
+
+    def top_k_batch(self, input_embeddings, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        similarities = self.similarities_batch(input_embeddings)
+        indices = top_k_indices(similarities, k)
+        return indices, np.take_along_axis(similarities, indices, axis=-1)
+
+
+# One read-only store per embeddings file and process. The matrix is memory-mapped, so worker
+# processes (forked or not) share its pages through the page cache instead of each holding a copy.
+_stores: Dict[Path, EmbeddingStore] = dict()
+_stores_lock = threading.Lock()
+
+
+def get_store(pkl_path=EMBEDDINGS_PKL) -> EmbeddingStore:
+    pkl_path = Path(pkl_path).resolve()
+    with _stores_lock:
+        if pkl_path not in _stores:
+            _stores[pkl_path] = EmbeddingStore.load(pkl_path)
+        return _stores[pkl_path]
@@ -0,0 +1,208 @@
+# Append-only embedding store for incremental updates: every ingestion writes a new segment
+# (segment-<n>.npy + segment-<n>.json) and never rewrites the existing ones. manifest.json lists
+# the segments in order, the deleted ids and the embedding backend all vectors come from. A later
+# row for an id replaces the earlier ones, and compact() merges the live rows into a single segment
+# once segments or dead rows pile up. Vectors of another backend are never mixed in: replace()
+# swaps the whole store for one re-embedded segment.
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from src.vector_db.embedding_store import normalize_rows, top_k_indices
+
+SEGMENTS_DIR = Path(__file__).parent / 'basic_data' / 'segments'
+MANIFEST_FILE = 'manifest.json'
+# compact() is due beyond this many segments or this share of dead rows
+COMPACTION_MAX_SEGMENTS = 8
+COMPACTION_MAX_DEAD_RATIO = 0.3
+
+
+def get_content_hash(original_code: str, partition_code: str) -> str:
+    return hashlib.sha256((original_code + "\0" + partition_code).encode("utf8")).hexdigest()
+
+
+def write_atomically(path: Path, write) -> None:
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Segment(object):
+    def __init__(self, directory: Path, name: str) -> None:
+        self.name: str = name
+        self.matrix: np.ndarray = np.load(directory / (name + '.npy'), mmap_mode='r')
+        with open(directory / (name + '.json')) as f:
+            meta = json.load(f)
+        self.ids: List[str] = meta['ids']
+        self.metadata_list: List[dict] = meta['metadata']
+        self.hashes: List[str] = meta['hashes']
+        self.backend: Optional[str] = meta.get('backend')
+
+    @staticmethod
+    def write(directory: Path, name: str, matrix: np.ndarray, ids: List[str], metadata_list: List[dict], hashes: List[str],
+              backend: str) -> None:
+        write_atomically(directory / (name + '.json'), lambda f: f.write(
+            json.dumps(dict(ids=ids, metadata=metadata_list, hashes=hashes, backend=backend)).encode("utf8")))
+        write_atomically(directory / (name + '.npy'),
+                         lambda f: np.save(f, np.ascontiguousarray(matrix, dtype=np.float32)))
+
+
+class SegmentedEmbeddingStore(object):
+    # queried like an EmbeddingStore, over the live rows of all segments
+    def __init__(self, directory=SEGMENTS_DIR) -> None:
+        self.directory: Path = Path(directory)
+        self.path = None
+        self.lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> None:
+        manifest_path = self.directory / MANIFEST_FILE
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                self.manifest: dict = json.load(f)
+        else:
+            self.manifest = dict(segments=[], next_segment=0, deleted=dict(), backend=None)
+        self.segments: List[Segment] = [Segment(self.directory, name)
+                                        for name in self.manifest['segments']]
+        # an id deleted when there were n segments is dead in the first n segments
+        latest: Dict[str, Tuple[int, int]] = dict()
+        for position, segment in enumerate(self.segments):
+            for row, row_id in enumerate(segment.ids):
+                if position >= self.manifest['deleted'].get(row_id, 0):
+                    latest[row_id] = (position, row)
+        self.live_rows: List[np.ndarray] = []
+        for position, segment in enumerate(self.segments):
+            self.live_rows.append(np.array([row for row, row_id in enumerate(segment.ids)
+                                            if latest.get(row_id) == (position, row)], dtype=np.int64))
+        self.ids: List[str] = [segment.ids[row] for segment, rows in zip(self.segments, self.live_rows)
+                               for row in rows]
+        self.metadata_list: List[dict] = [segment.metadata_list[row] for segment, rows in zip(self.segments, self.live_rows)
+                                          for row in rows]
+        self.hashes: Dict[str, str] = {segment.ids[row]: segment.hashes[row] for segment, rows in zip(self.segments, self.live_rows)
+                                       for row in rows}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def backend(self) -> Optional[str]:
+        # None for an empty store, or one written before backends were recorded
+        return self.manifest.get('backend')
+
+    def check_backend(self, backend_name: str) -> None:
+        # queries embedded by another backend are not comparable with the stored vectors
+        if len(self.segments) > 0 and self.backend != backend_name:
+            raise ValueError("The segment store {0} holds {1} embeddings, not {2}: re-run the incremental "
+                             "ingestion with this backend".format(self.directory, self.backend, backend_name))
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if len(self.segments) == 1 and len(self.live_rows[0]) == len(self.segments[0].ids):
+            return self.segments[0].matrix
+        return np.concatenate([segment.matrix[rows] for segment, rows in zip(self.segments, self.live_rows)]
+                              or [np.zeros((0, 0), dtype=np.float32)])
+
+    def get_dead_ratio(self) -> float:
+        total = sum(len(segment.ids) for segment in self.segments)
+        return 0.0 if total == 0 else 1 - len(self) / total
+
+    def needs_compaction(self) -> bool:
+        return len(self.segments) > COMPACTION_MAX_SEGMENTS or self.get_dead_ratio() > COMPACTION_MAX_DEAD_RATIO
+
+    def write_manifest(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        write_atomically(self.directory / MANIFEST_FILE,
+                         lambda f: f.write(json.dumps(self.manifest, indent=4).encode("utf8")))
+
+    def append(self, ids: List[str], embeddings, metadata_list: List[dict], hashes: List[str], backend: str) -> Optional[str]:
+        # the rows become live once the manifest lists their segment
+        if len(ids) == 0:
+            return None
+        with self.lock:
+            self.check_backend(backend)
+            os.makedirs(self.directory, exist_ok=True)
+            name = "segment-{0:05d}".format(self.manifest['next_segment'])
+            Segment.write(self.directory, name, normalize_rows(
+                embeddings), ids, metadata_list, hashes, backend)
+            self.manifest['segments'].append(name)
+            self.manifest['next_segment'] += 1
+            self.manifest['backend'] = backend
+            self.write_manifest()
+            self.reload()
+            return name
+
+    def delete(self, ids: List[str]) -> None:
+        if len(ids) == 0:
+            return
+        with self.lock:
+            for row_id in ids:
+                self.manifest['deleted'][row_id] = len(self.segments)
+            self.write_manifest()
+            self.reload()
+
+    def _rewrite(self, ids: List[str], matrix: np.ndarray, metadata_list: List[dict], hashes: List[str], backend: str) -> None:
+        # one new segment becomes the whole store, the old segments are removed once the manifest
+        # no longer lists them; the caller holds the lock
+        old_names = list(self.manifest['segments'])
+        name = "segment-{0:05d}".format(self.manifest['next_segment'])
+        os.makedirs(self.directory, exist_ok=True)
+        Segment.write(self.directory, name, matrix,
+                      ids, metadata_list, hashes, backend)
+        self.manifest = dict(segments=[name], next_segment=self.manifest['next_segment'] + 1, deleted=dict(),
+                             backend=backend)
+        self.write_manifest()
+        for old_name in old_names:
+            for suffix in ['.npy', '.json']:
+                os.remove(self.directory / (old_name + suffix))
+        self.reload()
+
+    def compact(self) -> None:
+        with self.lock:
+            if len(self.manifest['segments']) == 0:
+                return
+            hashes = [self.hashes[row_id] for row_id in self.ids]
+            self._rewrite(self.ids, self.matrix, self.metadata_list, hashes, self.backend)
+
+    def replace(self, ids: List[str], embeddings, metadata_list: List[dict], hashes: List[str], backend: str) -> None:
+        # all rows embedded again, e.g. by another backend
+        with self.lock:
+            self._rewrite(ids, normalize_rows(embeddings),
+                         metadata_list, hashes, backend)
+
+    def similarities(self, input_embedding) -> np.ndarray:
+        query = normalize_rows(input_embedding)
+        return np.concatenate([(segment.matrix @ query)[rows] for segment, rows in zip(self.segments, self.live_rows)]
+                              or [np.zeros(0, dtype=np.float32)])
+
+    def similarities_batch(self, input_embeddings) -> np.ndarray:
+        queries = normalize_rows(input_embeddings)
+        return np.concatenate([(queries @ segment.matrix.T)[:, rows] for segment, rows in zip(self.segments, self.live_rows)]
+                              or [np.zeros((len(queries), 0), dtype=np.float32)], axis=1)
+
+    def top_k(self, input_embedding, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        similarities = self.similarities(input_embedding)
+        indices = top_k_indices(similarities, k)
+        return indices, similarities[indices]
+
+    def top_k_batch(self, input_embeddings, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        similarities = self.similarities_batch(input_embeddings)
+        indices = top_k_indices(similarities, k)
+        return indices, np.take_along_axis(similarities, indices, axis=-1)
+
+
+_stores: Dict[Path, SegmentedEmbeddingStore] = dict()
+_stores_lock = threading.Lock()
+
+
+def get_segment_store(directory=SEGMENTS_DIR) -> SegmentedEmbeddingStore:
+    directory = Path(directory).resolve()
+    with _stores_lock:
+        if directory not in _stores:
+            _stores[directory] = SegmentedEmbeddingStore(directory)
+        return _stores[directory]
@@ -1,112 +1,150 @@
-import itertools
 import os
 import json
+import time
 import pickle
-import openai
+import argparse
 import numpy as np
 from tqdm import tqdm
+from typing import List, Tuple
 
 from pathlib import Path
 import src.vector_db.config as config
+from src.vector_db import embedding_backend
+from src.vector_db.embedding_backend import chunks
+from src.vector_db.segment_store import SEGMENTS_DIR, SegmentedEmbeddingStore, get_content_hash
 
 
-# 辅助函数，将可迭代对象分割成多个块
-def chunks(iterable, batch_size=100):
-    it = iter(iterable)
-    chunk = list(itertools.islice(it, batch_size))
-    while chunk:
-        yield chunk
-        chunk = list(itertools.islice(it, batch_size))
-
 # Read and create an exclusion set from secondcategory_filter.csv
 
+# attempts per batch before its functions are left out, they are retried by the next run
+EMBEDDING_RETRIES = 3
+RETRY_DELAY = 2.0
 
-def generate_update_embeddings(benchmarks: dict, excluded_testing_set, existing_embeddings=None):
-    new_embeddings = {}
-    new_metadata_list = []
-    for item in tqdm(set(benchmarks.keys()).difference(excluded_testing_set), desc="Vectorizing Partitioning", total=len(set(benchmarks.keys()).difference(excluded_testing_set)), ncols=100):
-        row_id = item
-        function_partitions = benchmarks[row_id]
+
+def get_function_rows(benchmarks: dict, excluded_testing_set) -> List[Tuple[str, dict, str]]:
+    # (row id, metadata, content hash) of every function partition of the benchmark
+    rows = []
+    for item in sorted(set(benchmarks.keys()).difference(excluded_testing_set)):
+        function_partitions = benchmarks[item]
         for row_id, function_partition in enumerate(function_partitions):
             row_id = item + "-" + str(row_id)
-            if existing_embeddings and row_id in existing_embeddings:
-                continue  # 如果已存在嵌入，则跳过
+            # 构建并添加元数据
+            metadata = {
+                "Contract": item,
+                "Partition": "\n".join(function_partition["partition"]),
+                "Original": "\n".join(function_partition["original"])
+            }
+            rows.append((row_id, metadata, get_content_hash(
+                metadata["Original"], metadata["Partition"])))
+    return rows
+
+
+def embed_rows(rows: List[Tuple[str, dict, str]]) -> Tuple[list, np.ndarray]:
+    # embeds the original code of the rows, the rows of a batch that keeps failing are left out
+    # instead of being stored with a placeholder vector
+    embedded_rows, embeddings = [], []
+    for batch in tqdm(list(chunks(rows, embedding_backend.EMBEDDING_BATCH_SIZE)), desc="Vectorizing Partitioning", ncols=100):
+        for attempt in range(1, EMBEDDING_RETRIES + 1):
             try:
-                openai.api_key = config.OPENAI_API_KEY
-                function_code = "\n".join(function_partition["original"])
-                response = openai.Embedding.create(
-                    model=config.PRETRAIN_MODEL_OPENAI, input=function_code)
-                embedding = response['data'][0]['embedding']
-                new_embeddings[row_id] = embedding
-                # 构建并添加元数据
-                metadata = {
-                    "Contract": item,
-                    "Partition": "\n".join(function_partition["partition"]),
-                    "Original": function_code
-                }
-                new_metadata_list.append(metadata)
+                embeddings.append(embedding_backend.embed_texts(
+                    [metadata["Original"] for _, metadata, _ in batch]))
+                embedded_rows.extend(batch)
+                break
             except Exception as e:
-                print("Error:", e)
-                new_embeddings[row_id] = np.zeros(1536).tolist()
-                # 处理错误情况的元数据
-                # ...
+                print("Error: {0}th Attempt failed: {1}".format(attempt, e))
+                if attempt < EMBEDDING_RETRIES:
+                    time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+        else:
+            print("Skipped {0} functions: {1}".format(
+                len(batch), ", ".join(row_id for row_id, _, _ in batch)))
+    return embedded_rows, np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+
+
+def generate_update_embeddings(benchmarks: dict, excluded_testing_set, existing_embeddings=None):
+    rows = [row for row in get_function_rows(benchmarks, excluded_testing_set)
+            if not (existing_embeddings and row[0] in existing_embeddings)]  # 如果已存在嵌入，则跳过
+    embedded_rows, embeddings = embed_rows(rows)
+    new_embeddings = {row_id: embedding.tolist()
+                      for (row_id, _, _), embedding in zip(embedded_rows, embeddings)}
+    new_metadata_list = [metadata for _, metadata, _ in embedded_rows]
     return new_embeddings, new_metadata_list
 
 
+def update_segment_store(benchmarks: dict, excluded_testing_set, store: SegmentedEmbeddingStore, compact: bool = False) -> None:
+    # embeds only the new and changed functions and appends them as one new segment
+    rows = get_function_rows(benchmarks, excluded_testing_set)
+    backend_name = embedding_backend.get_backend().name
+    if len(store.segments) > 0 and store.backend != backend_name:
+        # vectors of two backends are not comparable (nor of the same size): everything is
+        # embedded again and replaces the store at once, or the store is left as it is
+        print("Embedding backend changed ({0} -> {1}), re-embedding all {2} functions".format(
+            store.backend, backend_name, len(rows)))
+        embedded_rows, embeddings = embed_rows(rows)
+        if len(embedded_rows) < len(rows):
+            raise RuntimeError("{0} functions could not be embedded with {1}, the store still holds {2} embeddings".format(
+                len(rows) - len(embedded_rows), backend_name, store.backend))
+        store.replace([row_id for row_id, _, _ in embedded_rows], embeddings, [metadata for _, metadata, _ in embedded_rows],
+                      [content_hash for _, _, content_hash in embedded_rows], backend_name)
+        print("Replaced the store with {0}".format(store.manifest["segments"][0]))
+        return
+    changed_rows = [row for row in rows if store.hashes.get(row[0]) != row[2]]
+    removed_ids = sorted(set(store.hashes).difference(row[0] for row in rows))
+    print("{0} functions: {1} new or changed, {2} removed".format(
+        len(rows), len(changed_rows), len(removed_ids)))
+
+    embedded_rows, embeddings = embed_rows(changed_rows)
+    segment = store.append([row_id for row_id, _, _ in embedded_rows], embeddings, [
+        metadata for _, metadata, _ in embedded_rows], [content_hash for _, _, content_hash in embedded_rows], backend_name)
+    if segment is not None:
+        print("Added {0} functions to {1}".format(len(embedded_rows), segment))
+    store.delete(removed_ids)
+    if compact or store.needs_compaction():
+        store.compact()
+        print("Compacted into {0}".format(store.manifest["segments"][0]))
+
+
 # 保存嵌入和元数据的函数
-def save_embeddings(embeddings, metadata_list, filepath):
+def save_embeddings(embeddings, metadata_list, filepath, backend_name):
     with open(filepath, 'wb') as f:
-        pickle.dump((embeddings, metadata_list), f)
-
-
-# # 从新的CSV进行增量更新的函数
-# def update_embeddings_from_new_csv(new_csv_path, existing_pkl_path):
-#     new_df = pd.read_csv(new_csv_path)
-
-#     # 如果存在，则加载现有嵌入
-#     if os.path.exists(existing_pkl_path):
-#         with open(existing_pkl_path, 'rb') as f:
-#             existing_embeddings, existing_metadata = pickle.load(f)
-#     else:
-#         existing_embeddings = None
-
-#     # 生成新嵌入并更新现有嵌入
-#     new_embeddings, new_metadata_list = generate_update_embeddings(
-#         new_df, existing_embeddings)
-
-#     # 合并现有和新嵌入
-#     if existing_embeddings:
-#         combined_embeddings = {**existing_embeddings, **new_embeddings}
-#     else:
-#         combined_embeddings = new_embeddings
-
-#     # 合并现有和新元数据
-#     combined_metadata_list = existing_metadata + \
-#         new_metadata_list if existing_metadata else new_metadata_list
-
-#     # 保存合并后的嵌入
-#     save_embeddings(combined_embeddings,
-#                     combined_metadata_list, existing_pkl_path)
-#     print("更新嵌入，并保存到", existing_pkl_path)
-
-
-# 使用示例
-json_path = 'src/partition_benchmark.json'  # benchmark json file
-pkl_path = './src/vector_db/basic_data/embeddings.pkl'  # .pkl文件的路径
-
-excluded_testing_set = [
-    "BlindAuction",
-    "Comp",
-    "ConfidentialIdentityRegistry",
-    "EncryptedERC20",
-    "GovernorZama",
-    "NFTExample"
-]
-
-# If you need to completely regenerate the embedding file
-benchmarks = json.load(open(json_path))
-embeddings, metadata_list = generate_update_embeddings(
-    benchmarks, excluded_testing_set)
-save_embeddings(embeddings, metadata_list, pkl_path)
-# 如果您有新数据需要增量添加
-# update_embeddings_from_new_csv(new_csv_path, pkl_path)
+        pickle.dump((embeddings, metadata_list, backend_name), f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--benchmark", default='src/partition_benchmark.json',
+                        help="Benchmark json file")
+    parser.add_argument("--output", default='./src/vector_db/basic_data/embeddings.pkl',
+                        help="Embeddings file written by a full regeneration")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Embed only new or changed functions and append them to the segment store")
+    parser.add_argument("--segments", default=str(SEGMENTS_DIR),
+                        help="Directory of the segment store")
+    parser.add_argument("--compact", action="store_true",
+                        help="Merge the segments of the segment store into one")
+    parser.add_argument("--embedding-backend", default=embedding_backend.EMBEDDING_BACKEND,
+                        choices=sorted(embedding_backend.BACKENDS))
+    args = parser.parse_args()
+    embedding_backend.EMBEDDING_BACKEND = args.embedding_backend
+
+    excluded_testing_set = [
+        "BlindAuction",
+        "Comp",
+        "ConfidentialIdentityRegistry",
+        "EncryptedERC20",
+        "GovernorZama",
+        "NFTExample"
+    ]
+
+    benchmarks = json.load(open(args.benchmark))
+    if args.incremental:
+        # 如果您有新数据需要增量添加
+        update_segment_store(benchmarks, excluded_testing_set,
+                             SegmentedEmbeddingStore(args.segments), compact=args.compact)
+    elif args.compact:
+        SegmentedEmbeddingStore(args.segments).compact()
+    else:
+        # If you need to completely regenerate the embedding file
+        embeddings, metadata_list = generate_update_embeddings(
+            benchmarks, excluded_testing_set)
+        save_embeddings(embeddings, metadata_list, args.output,
+                        embedding_backend.get_backend().name)